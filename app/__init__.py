@@ -1,19 +1,27 @@
 from flask import Flask
 from flask_cors import CORS
+import config
 from config import Config
 
-def create_app():
+def create_app(start_background: bool = True):
+    """
+    start_background=False skips background collection, e.g. in the debug
+    reloader's watcher process, which never serves requests.
+    """
     app = Flask(__name__, 
                 template_folder='../templates',
                 static_folder='../static')
     app.config.from_object(Config)
     CORS(app)
     
-    from app.routes import main_bp, api_bp
+    from app.routes import main_bp, api_bp, metrics_scheduler
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
     
+    # Polling starts with the process, not the first request, so a restart leaves no
+    # gap in history; with several workers the scheduler's lock lets only one poll.
+    # Threads do not survive fork, so do not combine this with gunicorn --preload
+    if start_background and getattr(config, "BACKGROUND_COLLECTION", True):
+        metrics_scheduler.start()
+    
     return app
-
-
-
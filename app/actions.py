@@ -1,15 +1,72 @@
 """
 Server Actions - Execute maintenance tasks on servers
 """
+import codecs
+import os
+import select
+import shlex
+import signal
+import socket
+import threading
+import time
 import paramiko
 import subprocess
-from typing import Dict, List, Union
+import config
+from typing import Callable, Dict, List, Optional, Union
 from datetime import datetime
+from app.collectors.connection_pool import ssh_pool
+
+ACTION_MAX_RUNTIME = getattr(config, "ACTION_MAX_RUNTIME", 3600)   # seconds, None = no limit
+ACTION_MAX_LINE_LENGTH = getattr(config, "JOB_MAX_LINE_LENGTH", 4096)
+
+
+class ActionStopped(Exception):
+    """The action was cancelled or ran past its time limit and has been killed"""
+
+
+class _LineSplitter:
+    """
+    Turns output chunks into lines for on_line. At most ACTION_MAX_LINE_LENGTH
+    characters of an unfinished line are held; the rest of an overlong line is
+    dropped and its first part passed on with a marker.
+    """
+    
+    def __init__(self, on_line: Callable[[str], None], max_length: int = ACTION_MAX_LINE_LENGTH):
+        self.on_line = on_line
+        self.max_length = max_length
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending = ""
+        self._truncated = False
+    
+    def feed(self, data: bytes):
+        *lines, rest = (self._pending + self._decoder.decode(data)).split("\n")
+        for line in lines:
+            if self._truncated:
+                # The cut line was already passed on; this is the end of it
+                self._truncated = False
+            else:
+                self.on_line(line[:self.max_length])
+        if self._truncated:
+            rest = ""
+        elif len(rest) > self.max_length:
+            self.on_line(rest[:self.max_length] + " [line truncated]")
+            rest, self._truncated = "", True
+        self._pending = rest
+    
+    def close(self):
+        self.feed(b"")
+        tail = self._pending + self._decoder.decode(b"", final=True)
+        if tail and not self._truncated:
+            self.on_line(tail[:self.max_length])
+        self._pending = ""
 
 
 class ServerActions:
     """Execute actions on remote servers"""
     
+    POLL_INTERVAL = 0.5       # How often a running action checks for cancel and its time limit
+    READ_SIZE = 32768
+    
     ACTIONS = {
         "docker_cleanup": {
             "name": "Clean Up Docker",
@@ -68,6 +125,7 @@ class ServerActions:
     }
     
     def __init__(self, server_config: Dict):
+        self.server_config = server_config
         self.host = server_config["host"]
         self.port = server_config["port"]
         self.username = server_config["username"]
@@ -77,70 +135,129 @@ class ServerActions:
         self.is_localhost = self.host in ["localhost", "127.0.0.1", "::1"]
     
     def _connect(self) -> Union[paramiko.SSHClient, None]:
-        """Connect via SSH or return None for localhost"""
+        """Borrow a pooled SSH session or return None for localhost"""
         if self.is_localhost:
             return None
         
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        return ssh_pool.get(self.server_config)
+    
+    def stream_action(self, action_id: str, on_line: Callable[[str], None],
+                      cancel: Optional[threading.Event] = None,
+                      max_runtime: Optional[float] = ACTION_MAX_RUNTIME) -> int:
+        """
+        Run an action and pass each output line (stdout and stderr combined) to
+        on_line as it is produced. Returns the exit code. The command is stopped,
+        and ActionStopped raised, once cancel is set or after max_runtime seconds.
+        Output is read in fixed-size chunks and lines longer than
+        ACTION_MAX_LINE_LENGTH are cut, so memory stays bounded whatever it prints.
+        """
+        command = self.ACTIONS[action_id]["command"]
+        cancel = cancel or threading.Event()
+        stop_at = time.monotonic() + max_runtime if max_runtime else None
+        lines = _LineSplitter(on_line)
         
-        connect_kwargs = {
-            "hostname": self.host,
-            "port": self.port,
-            "username": self.username,
-            "timeout": 30
-        }
+        def check():
+            if cancel.is_set():
+                raise ActionStopped("Cancelled")
+            if stop_at is not None and time.monotonic() > stop_at:
+                raise ActionStopped(f"Stopped after running for {max_runtime:g}s")
         
-        if self.key_path:
-            connect_kwargs["key_filename"] = self.key_path
-        elif self.password:
-            connect_kwargs["password"] = self.password
+        if self.is_localhost:
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True
+            )
+            try:
+                while True:
+                    check()
+                    ready, _, _ = select.select([process.stdout], [], [], self.POLL_INTERVAL)
+                    if not ready:
+                        continue
+                    data = os.read(process.stdout.fileno(), self.READ_SIZE)
+                    if not data:
+                        break
+                    lines.feed(data)
+                lines.close()
+                return process.wait()
+            finally:
+                process.stdout.close()
+                if process.poll() is None:
+                    # The whole group, so children of the shell stop too
+                    os.killpg(process.pid, signal.SIGTERM)
+                    process.wait()
+        
+        client = self._connect()
+        try:
+            channel = client.get_transport().open_session()
+        except (paramiko.SSHException, AttributeError):
+            client = ssh_pool.reconnect(self.server_config)
+            channel = client.get_transport().open_session()
         
-        client.connect(**connect_kwargs)
-        return client
+        channel.set_combine_stderr(True)
+        channel.settimeout(self.POLL_INTERVAL)
+        # The first line is the remote shell's pid, so a stopped action can be killed
+        # on the host rather than only losing its channel
+        channel.exec_command(f"echo $$; exec sh -c {shlex.quote(command)}")
+        head, pid = b"", None
+        finished = False
+        try:
+            while True:
+                check()
+                try:
+                    data = channel.recv(self.READ_SIZE)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                if pid is None:
+                    head += data
+                    if b"\n" not in head:
+                        continue
+                    pid, _, data = head.partition(b"\n")
+                lines.feed(data)
+            lines.close()
+            finished = True
+            return channel.recv_exit_status()
+        finally:
+            channel.close()
+            if not finished and pid is not None and pid.strip().isdigit():
+                self._kill_remote(client, pid.strip().decode())
+    
+    @staticmethod
+    def _kill_remote(client: paramiko.SSHClient, pid: str):
+        """
+        Terminate a stopped action's shell and its process group, which is its own
+        session under sshd; where it is not, the shell's children are signalled directly.
+        """
+        try:
+            killer = client.get_transport().open_session()
+            killer.exec_command(f"kill -TERM -- -{pid} 2>/dev/null || {{ pkill -TERM -P {pid}; kill -TERM {pid}; }}")
+            killer.recv_exit_status()
+            killer.close()
+        except Exception:
+            pass
     
     def execute_action(self, action_id: str) -> Dict:
+        """Run an action to completion and return its whole output"""
         if action_id not in self.ACTIONS:
             return {"success": False, "error": f"Unknown action: {action_id}"}
         
         action = self.ACTIONS[action_id]
+        output: List[str] = []
         
         try:
-            if self.is_localhost:
-                # Run command directly on localhost
-                result = subprocess.run(
-                    action["command"],
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=120,
-                    check=False
-                )
-                return {
-                    "success": result.returncode == 0,
-                    "action": action["name"],
-                    "output": result.stdout,
-                    "error": result.stderr if result.stderr else None,
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-            else:
-                # Run command via SSH
-                client = self._connect()
-                stdin, stdout, stderr = client.exec_command(action["command"], timeout=120)
-                
-                output = stdout.read().decode('utf-8')
-                error = stderr.read().decode('utf-8')
-                exit_code = stdout.channel.recv_exit_status()
-                
-                client.close()
-                
-                return {
-                    "success": exit_code == 0,
-                    "action": action["name"],
-                    "output": output,
-                    "error": error if error else None,
-                    "timestamp": datetime.utcnow().isoformat()
-                }
+            exit_code = self.stream_action(action_id, output.append)
+            return {
+                "success": exit_code == 0,
+                "action": action["name"],
+                "output": "\n".join(output),
+                "error": None if exit_code == 0 else f"Exited with status {exit_code}",
+                "timestamp": datetime.utcnow().isoformat()
+            }
         except Exception as e:
             return {
                 "success": False,
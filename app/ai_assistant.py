@@ -1,177 +1,263 @@
 from openai import OpenAI
 from config import OPENAI_API_KEY
-from typing import Dict, List
+from typing import Dict, Iterator, List
+import hashlib
 import json
+import config
+from app.partial_json import IncrementalObjectParser
+from app.prompt_builder import build_messages
+
+AI_CACHE_BUCKET = getattr(config, "AI_CACHE_BUCKET", 10)
 
 class ServerAssistant:
-    def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+    def __init__(self, client=None):
+        # Any object with the OpenAI chat.completions interface; tests can pass a local stub
+        self.client = client or OpenAI(api_key=OPENAI_API_KEY)
+    
+    @staticmethod
+    def _normalize_recommendation(rec: Dict) -> Dict:
+        """Ensure a recommendation has every field the dashboard renders"""
+        if "risk" not in rec:
+            rec["risk"] = "YELLOW"
+        if "considerations" not in rec:
+            rec["considerations"] = ""
+        if "action" not in rec:
+            rec["action"] = ""
+        return rec
+    
+    @staticmethod
+    def _record_usage(report: Dict, usage) -> Dict:
+        """Add the provider's actual prompt token counts to our estimate"""
+        if usage is not None:
+            report["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+            details = getattr(usage, "prompt_tokens_details", None)
+            report["cached_tokens"] = getattr(details, "cached_tokens", None) or 0
+        return report
     
     def analyze(self, question: str, server_data: Dict) -> Dict:
         """
         Analyze server data and return structured recommendations with risk levels.
-        Returns a dict with 'summary', 'recommendations', and 'upgrade_suggestion'.
+        Returns a dict with 'summary', 'recommendations', 'upgrade_suggestion', and
+        'prompt' describing the size of the prompt that was sent.
         """
-        system_prompt = """You are a friendly server assistant helping non-technical users. 
-When analyzing server issues, provide:
-1. A brief summary in plain language
-2. Actionable recommendations with risk levels:
-   - GREEN: Safe to do, low risk, recommended
-   - YELLOW: Consider carefully, explain what could happen in simple terms
-   - RED: High risk, only if necessary, explain risks clearly
-3. Server upgrade suggestions if resources are consistently high
-
-Available actions you can reference (use action_id if it matches):
-- docker_cleanup: Clean up unused Docker images/containers (GREEN)
-- docker_cleanup_full: Deep Docker cleanup including volumes (YELLOW)
-- clear_temp: Clear temporary files (GREEN)
-- clear_logs: Clear old log files (GREEN)
-- clear_docker_logs: Clear Docker container logs (GREEN)
-- check_disk_usage: Analyze what's using disk space (GREEN)
-- list_large_files: Find large files (GREEN)
-- memory_report: Show memory usage report (GREEN)
-- restart_docker: Restart Docker service (RED)
-
-Format your response as JSON with this structure:
-{
-  "summary": "Brief explanation in plain language",
-  "recommendations": [
-    {
-      "title": "What to do",
-      "description": "Simple explanation of what this does",
-      "risk": "GREEN|YELLOW|RED",
-      "considerations": "For YELLOW/RED: explain what to watch out for in simple terms",
-      "action_id": "action_id_if_applicable (e.g. docker_cleanup, clear_temp)",
-      "action": "Specific command or step (if no action_id)"
-    }
-  ],
-  "upgrade_suggestion": {
-    "needed": true/false,
-    "reason": "Why upgrade might help",
-    "current_specs": "What you have now",
-    "recommended": "What to consider upgrading to"
-  }
-}
-
-Always explain things in simple, non-technical language. Avoid jargon. Prefer using action_id when possible so users can click to execute."""
-        
-        user_prompt = f"""
-Server Data:
-{json.dumps(server_data, indent=2)}
-
-Question: {question}
-
-Provide recommendations in the JSON format specified. Be helpful and clear for non-technical users."""
+        messages, report = build_messages(question, server_data)
         
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=messages,
                 max_tokens=2000,
                 response_format={"type": "json_object"}
             )
+            self._record_usage(report, getattr(response, "usage", None))
             
             content = response.choices[0].message.content
             result = json.loads(content)
             
             # Ensure all recommendations have required fields
-            if "recommendations" in result:
-                for rec in result["recommendations"]:
-                    if "risk" not in rec:
-                        rec["risk"] = "YELLOW"
-                    if "considerations" not in rec:
-                        rec["considerations"] = ""
-                    if "action" not in rec:
-                        rec["action"] = ""
-            
-            return result
+            for rec in result.get("recommendations", []):
+                self._normalize_recommendation(rec)
         except json.JSONDecodeError:
             # Fallback if JSON parsing fails
-            return {
+            result = {
                 "summary": response.choices[0].message.content,
                 "recommendations": [],
                 "upgrade_suggestion": {"needed": False}
             }
         except Exception as e:
-            # Check if it's an OpenAI API error
-            error_str = str(e)
-            
-            # Extract error code from the error message or object
-            error_code = None
-            if hasattr(e, 'status_code'):
-                error_code = e.status_code
-            elif hasattr(e, 'code'):
-                error_code = e.code
-            elif '429' in error_str:
-                error_code = 429
-            elif '401' in error_str:
-                error_code = 401
-            
-            # Handle 429 errors (rate limit or quota) - most common issue with credits available
-            if error_code == 429 or "429" in error_str or "insufficient_quota" in error_str.lower() or "quota" in error_str.lower() or "rate_limit" in error_str.lower():
-                return {
-                    "summary": "⚠️ OpenAI API Rate Limit or Quota Issue",
-                    "recommendations": [
-                        {
-                            "title": "Check Monthly Spending Limits (Most Likely Cause)",
-                            "description": "Even with $57 in credits, you may have hit a monthly spending limit. This is separate from your credit balance and is the most common cause of this error.",
-                            "risk": "YELLOW",
-                            "considerations": "Go to OpenAI Platform → Settings → Limits to check or increase your monthly spending limit. Monthly limits can block requests even when you have credits.",
-                            "action_id": "",
-                            "action": "Visit https://platform.openai.com/settings/organization/limits"
-                        },
-                        {
-                            "title": "Wait and Retry (Rate Limiting)",
-                            "description": "If this is a rate limit (too many requests per minute), wait a few minutes and try again.",
-                            "risk": "GREEN",
-                            "considerations": "Rate limits reset after a short period. Try again in 1-2 minutes.",
-                            "action_id": "",
-                            "action": "Wait 1-2 minutes and refresh the page"
-                        },
-                        {
-                            "title": "Verify API Key Organization",
-                            "description": "Make sure the API key belongs to the same organization/account where you see the $57 credits.",
-                            "risk": "YELLOW",
-                            "considerations": "API keys are organization-specific. If the key is from a different org, it won't use those credits.",
-                            "action_id": "",
-                            "action": "Check API key at https://platform.openai.com/api-keys"
-                        }
-                    ],
-                    "upgrade_suggestion": {"needed": False}
-                }
-            elif error_code == 401 or "401" in error_str or "invalid_api_key" in error_str.lower():
-                return {
-                    "summary": "⚠️ Invalid OpenAI API Key",
-                    "recommendations": [
-                        {
-                            "title": "Check API Key Configuration",
-                            "description": "The OpenAI API key is missing or invalid. Please verify it's correctly set in your server configuration.",
-                            "risk": "YELLOW",
-                            "considerations": "Make sure OPENAI_API_KEY environment variable is set correctly on the server.",
-                            "action_id": "",
-                            "action": "Verify OPENAI_API_KEY is set in systemd service file"
-                        }
-                    ],
-                    "upgrade_suggestion": {"needed": False}
-                }
-            else:
-                return {
-                    "summary": f"⚠️ OpenAI API Error (Code: {error_code or 'Unknown'})",
-                    "recommendations": [
-                        {
-                            "title": "Check Error Details",
-                            "description": f"OpenAI API returned an error: {error_str[:200]}",
-                            "risk": "YELLOW",
-                            "considerations": "This may be a temporary issue. Try again in a few minutes.",
-                            "action_id": "",
-                            "action": "Retry the request or check server logs"
-                        }
-                    ],
-                    "upgrade_suggestion": {"needed": False}
-                }
+            result = self._error_response(e)
+        
+        result["prompt"] = report
+        return result
+    
+    def _stream_completion(self, messages: List[Dict], report: Dict) -> Iterator[str]:
+        """Text deltas from the model as they are generated; usage arrives on the last chunk"""
+        stream = self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            max_tokens=2000,
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                self._record_usage(report, chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    def analyze_stream(self, question: str, server_data: Dict) -> Iterator[Dict]:
+        """
+        Same analysis as analyze(), yielded while the model is still writing:
+        a 'summary' event, one 'recommendation' event per item, an 'upgrade_suggestion'
+        event, and finally 'done' carrying the complete response.
+        """
+        messages, report = build_messages(question, server_data)
+        parser = IncrementalObjectParser()
+        content = ""
+        
+        try:
+            for text in self._stream_completion(messages, report):
+                content += text
+                if parser is None:
+                    continue
+                
+                try:
+                    events = parser.feed(text)
+                except json.JSONDecodeError:
+                    # Not the JSON we asked for; fall back to the full text at the end
+                    parser = None
+                    continue
+                
+                for kind, key, value in events:
+                    if kind == "field" and key == "summary":
+                        yield {"type": "summary", "summary": value}
+                    elif kind == "item" and key == "recommendations" and isinstance(value, dict):
+                        yield {"type": "recommendation", "recommendation": self._normalize_recommendation(value)}
+                    elif kind == "field" and key == "upgrade_suggestion":
+                        yield {"type": "upgrade_suggestion", "upgrade_suggestion": value}
+        except Exception as e:
+            result = self._error_response(e)
+            result["prompt"] = report
+            yield {"type": "done", "response": result}
+            return
+        
+        try:
+            result = json.loads(content)
+            for rec in result.get("recommendations", []):
+                self._normalize_recommendation(rec)
+        except json.JSONDecodeError:
+            result = {
+                "summary": content,
+                "recommendations": [],
+                "upgrade_suggestion": {"needed": False}
+            }
+        
+        result["prompt"] = report
+        yield {"type": "done", "response": result}
+    
+    @staticmethod
+    def response_events(result: Dict) -> Iterator[Dict]:
+        """Replay a finished response as the events analyze_stream would have produced"""
+        if "summary" in result:
+            yield {"type": "summary", "summary": result["summary"]}
+        for rec in result.get("recommendations", []):
+            yield {"type": "recommendation", "recommendation": rec}
+        if "upgrade_suggestion" in result:
+            yield {"type": "upgrade_suggestion", "upgrade_suggestion": result["upgrade_suggestion"]}
+        yield {"type": "done", "response": result}
+    
+    def _error_response(self, e: Exception) -> Dict:
+        """Turn an OpenAI failure into a response the dashboard can show"""
+        # Check if it's an OpenAI API error
+        error_str = str(e)
+        
+        # Extract error code from the error message or object
+        error_code = None
+        if hasattr(e, 'status_code'):
+            error_code = e.status_code
+        elif hasattr(e, 'code'):
+            error_code = e.code
+        elif '429' in error_str:
+            error_code = 429
+        elif '401' in error_str:
+            error_code = 401
+        
+        # Handle 429 errors (rate limit or quota) - most common issue with credits available
+        if error_code == 429 or "429" in error_str or "insufficient_quota" in error_str.lower() or "quota" in error_str.lower() or "rate_limit" in error_str.lower():
+            return {
+                "summary": "⚠️ OpenAI API Rate Limit or Quota Issue",
+                "recommendations": [
+                    {
+                        "title": "Check Monthly Spending Limits (Most Likely Cause)",
+                        "description": "Even with $57 in credits, you may have hit a monthly spending limit. This is separate from your credit balance and is the most common cause of this error.",
+                        "risk": "YELLOW",
+                        "considerations": "Go to OpenAI Platform → Settings → Limits to check or increase your monthly spending limit. Monthly limits can block requests even when you have credits.",
+                        "action_id": "",
+                        "action": "Visit https://platform.openai.com/settings/organization/limits"
+                    },
+                    {
+                        "title": "Wait and Retry (Rate Limiting)",
+                        "description": "If this is a rate limit (too many requests per minute), wait a few minutes and try again.",
+                        "risk": "GREEN",
+                        "considerations": "Rate limits reset after a short period. Try again in 1-2 minutes.",
+                        "action_id": "",
+                        "action": "Wait 1-2 minutes and refresh the page"
+                    },
+                    {
+                        "title": "Verify API Key Organization",
+                        "description": "Make sure the API key belongs to the same organization/account where you see the $57 credits.",
+                        "risk": "YELLOW",
+                        "considerations": "API keys are organization-specific. If the key is from a different org, it won't use those credits.",
+                        "action_id": "",
+                        "action": "Check API key at https://platform.openai.com/api-keys"
+                    }
+                ],
+                "upgrade_suggestion": {"needed": False}
+            }
+        elif error_code == 401 or "401" in error_str or "invalid_api_key" in error_str.lower():
+            return {
+                "summary": "⚠️ Invalid OpenAI API Key",
+                "recommendations": [
+                    {
+                        "title": "Check API Key Configuration",
+                        "description": "The OpenAI API key is missing or invalid. Please verify it's correctly set in your server configuration.",
+                        "risk": "YELLOW",
+                        "considerations": "Make sure OPENAI_API_KEY environment variable is set correctly on the server.",
+                        "action_id": "",
+                        "action": "Verify OPENAI_API_KEY is set in systemd service file"
+                    }
+                ],
+                "upgrade_suggestion": {"needed": False}
+            }
+        else:
+            return {
+                "summary": f"⚠️ OpenAI API Error (Code: {error_code or 'Unknown'})",
+                "recommendations": [
+                    {
+                        "title": "Check Error Details",
+                        "description": f"OpenAI API returned an error: {error_str[:200]}",
+                        "risk": "YELLOW",
+                        "considerations": "This may be a temporary issue. Try again in a few minutes.",
+                        "action_id": "",
+                        "action": "Retry the request or check server logs"
+                    }
+                ],
+                "upgrade_suggestion": {"needed": False}
+            }
+    
+    @staticmethod
+    def fingerprint(question: str, server_data: Dict) -> str:
+        """
+        Key for caching recommendations: the question plus a quantized view of the server.
+        Metrics are bucketed so normal jitter maps to the same key, and only the set
+        of top processes and containers counts, not their exact numbers or uptimes.
+        """
+        metrics = server_data.get("metrics", {})
+        
+        def bucket(value) -> int:
+            return int((value or 0) // AI_CACHE_BUCKET)
+        
+        processes = sorted({
+            p["command"].split()[0].rsplit("/", 1)[-1]
+            for p in server_data.get("top_processes", [])
+            if p.get("command")
+        })
+        containers = sorted(
+            f"{c.get('name')}:{c.get('image')}"
+            for c in server_data.get("docker", {}).get("containers", [])
+        )
+        
+        state = {
+            "question": " ".join(question.lower().split()),
+            "status": metrics.get("status"),
+            "cpu": bucket(metrics.get("cpu", {}).get("percent")),
+            "memory": bucket(metrics.get("memory", {}).get("percent")),
+            "disk": bucket(metrics.get("disk", {}).get("percent")),
+            "processes": processes,
+            "containers": containers
+        }
+        return hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest()
     
     def get_quick_insights(self, server_data: Dict) -> List[str]:
         insights = []
@@ -0,0 +1,223 @@
+"""
+Result Cache - TTL + LRU cache that coalesces concurrent computations of the same key and can serve stale values while refreshing,
+plus the bare single-flight coalescing for calls whose results should not outlive them
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    At most one call per key runs at a time. Callers arriving while it runs wait
+    for it and receive the same result (or exception) instead of starting their
+    own; nothing is kept once the call returns. Shared results must be treated
+    as read-only.
+    """
+    
+    def __init__(self):
+        self._in_flight: Dict[Hashable, _InFlight] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+    
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> tuple:
+        """Return (value, shared) where shared is True when another caller's call produced it"""
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _InFlight()
+                self.calls += 1
+            else:
+                self.shared += 1
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+        
+        try:
+            flight.value = fn()
+            return flight.value, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.done.set()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"in_flight": len(self._in_flight), "calls": self.calls, "shared": self.shared}
+
+
+class TTLCache:
+    """
+    Entries expire after ttl seconds and the least recently used entry is evicted
+    beyond max_entries. Callers asking for a key that is already being computed
+    wait for that computation instead of starting their own.
+    
+    With stale_ttl, get_or_compute keeps serving an expired entry for that many
+    more seconds while a single background refresh replaces it
+    (stale-while-revalidate), so only the very first caller waits.
+    """
+    
+    def __init__(self, ttl: float, max_entries: int = 256, stale_ttl: float = 0,
+                 executor: Optional[Executor] = None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.executor = executor
+        # key -> (value, fresh_until, stale_until)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._in_flight: Dict[Hashable, _InFlight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refresh_errors = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """The value while it is fresh, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, fresh_until, stale_until = entry
+            now = time.monotonic()
+            if now >= stale_until:
+                del self._entries[key]
+                return None
+            if now >= fresh_until:
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, stale_ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (value, now + ttl, now + ttl + stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches; returns how many were dropped"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any],
+                       cacheable: Callable[[Any], bool] = lambda value: True,
+                       ttl: Optional[float] = None, stale_ttl: Optional[float] = None,
+                       refresh: Optional[Callable[[], Any]] = None) -> tuple:
+        """
+        Return (value, cached) where cached is True when no new computation ran for
+        this caller. ttl and stale_ttl override the cache's defaults for this key.
+        A stale value is returned at once and recomputed in the background with
+        refresh (default: compute), which must not depend on the caller's context.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is not None and now < entry[2]:
+                self._entries.move_to_end(key)
+                if now < entry[1]:
+                    self.hits += 1
+                    return entry[0], True
+                
+                self.stale_hits += 1
+                if key in self._in_flight:
+                    return entry[0], True
+                flight = self._in_flight[key] = _InFlight()
+                stale, leader = entry, False
+            else:
+                stale = None
+                flight = self._in_flight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = _InFlight()
+                    self._in_flight[key] = flight
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+        
+        if stale is not None:
+            self._submit(lambda: self._revalidate(key, flight, refresh or compute, cacheable, ttl, stale_ttl))
+            return stale[0], True
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+        
+        return self._fill(key, flight, compute, cacheable, ttl, stale_ttl), False
+    
+    def _fill(self, key: Hashable, flight: _InFlight, compute: Callable[[], Any],
+              cacheable: Callable[[Any], bool], ttl: Optional[float], stale_ttl: Optional[float]) -> Any:
+        """Compute key as its single in-flight leader and hand the result to any waiters"""
+        try:
+            flight.value = compute()
+            if cacheable(flight.value):
+                self.set(key, flight.value, ttl, stale_ttl)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.done.set()
+    
+    def _revalidate(self, key: Hashable, flight: _InFlight, compute: Callable[[], Any],
+                    cacheable: Callable[[Any], bool], ttl: Optional[float], stale_ttl: Optional[float]):
+        try:
+            self._fill(key, flight, compute, cacheable, ttl, stale_ttl)
+        except Exception:
+            # The stale entry stays until it runs out; the next caller tries again
+            self.refresh_errors += 1
+    
+    def _submit(self, fn: Callable[[], None]):
+        if self.executor is not None:
+            self.executor.submit(fn)
+        else:
+            threading.Thread(target=fn, daemon=True, name="cache-refresh").start()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "refresh_errors": self.refresh_errors,
+                "hit_ratio": round((self.hits + self.stale_hits + self.coalesced) / lookups, 3) if lookups else None
+            }
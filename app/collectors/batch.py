@@ -0,0 +1,39 @@
+"""
+Batched probes - run several shell commands in one round trip
+"""
+import shlex
+import uuid
+from typing import Dict, Optional, Tuple
+
+
+def build_batch_script(sections: Dict[str, str], section_timeout: Optional[int] = None) -> Tuple[str, str]:
+    """
+    Join named commands into a single shell script.
+    Each section's output is preceded by a marker line so it can be split apart again.
+    Returns (script, marker).
+    """
+    marker = f"__SA_{uuid.uuid4().hex[:12]}__"
+    parts = []
+    for name, command in sections.items():
+        if section_timeout:
+            command = f"timeout {section_timeout} sh -c {shlex.quote(command)}"
+        parts.append(f"printf '\\n%s\\n' '{marker} {name}'; {{ {command} ; }} 2>/dev/null")
+    return "; ".join(parts), marker
+
+
+def parse_batch_output(output: str, marker: str) -> Dict[str, str]:
+    """Split the combined output of a batch script back into its sections"""
+    sections = {}
+    current = None
+    lines = []
+    for line in output.split('\n'):
+        if line.startswith(marker + " "):
+            if current is not None:
+                sections[current] = '\n'.join(lines).strip()
+            current = line[len(marker) + 1:].strip()
+            lines = []
+        elif current is not None:
+            lines.append(line)
+    if current is not None:
+        sections[current] = '\n'.join(lines).strip()
+    return sections
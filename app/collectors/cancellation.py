@@ -0,0 +1,116 @@
+"""
+Cancellation - Stop one piece of blocking work's own channels and processes when its caller gives up
+"""
+import os
+import signal
+import subprocess
+import threading
+from typing import Any, Callable, List, Optional
+
+_local = threading.local()
+
+
+class Cancelled(Exception):
+    """The caller stopped waiting and the work's channels were closed; whatever it read is incomplete"""
+
+
+class CancelScope:
+    """
+    Collects what one piece of work opens while it runs: SSH channels, sockets and
+    local process groups. cancel() closes and kills exactly those, so the worker
+    blocked on them returns while the pooled SSH session, and every other channel
+    on it, stays up. Anything registered after cancel() is stopped at once.
+    """
+
+    def __init__(self):
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self.cancelled = False
+
+    def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call fn with this scope current on the calling thread"""
+        previous = getattr(_local, "scope", None)
+        _local.scope = self
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.scope = previous
+
+    def on_cancel(self, callback: Callable[[], None]):
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        _call_quietly(callback)
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            _call_quietly(callback)
+
+
+def _call_quietly(callback: Callable[[], None]):
+    try:
+        callback()
+    except Exception:
+        pass
+
+
+def current_scope() -> Optional[CancelScope]:
+    return getattr(_local, "scope", None)
+
+
+def raise_if_cancelled():
+    scope = current_scope()
+    if scope is not None and scope.cancelled:
+        raise Cancelled("Cancelled: the caller stopped waiting")
+
+
+def on_cancel(callback: Callable[[], None], scope: Optional[CancelScope] = None):
+    """Run callback if the current (or given) scope is cancelled; a no-op outside any scope"""
+    scope = scope or current_scope()
+    if scope is not None:
+        scope.on_cancel(callback)
+
+
+def track(closeable, scope: Optional[CancelScope] = None):
+    """Close a channel or socket if the current (or given) scope is cancelled; returns it"""
+    on_cancel(closeable.close, scope)
+    return closeable
+
+
+def kill_process_group(process: subprocess.Popen):
+    if process.poll() is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def run_local(command: str, timeout: float, input: Optional[str] = None) -> str:
+    """
+    Run a shell command in its own process group and return its stdout. The whole
+    group is killed when the timeout passes (raising subprocess.TimeoutExpired)
+    or when the current scope is cancelled.
+    """
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True
+    )
+    on_cancel(lambda: kill_process_group(process))
+    try:
+        output, _ = process.communicate(input, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_process_group(process)
+        process.communicate()
+        raise
+    return output
@@ -0,0 +1,173 @@
+"""
+SSH Connection Pool - Keep authenticated sessions alive between requests
+"""
+import threading
+import time
+import paramiko
+import config
+from typing import Dict, Tuple
+
+SSH_CONNECT_TIMEOUT = getattr(config, "SSH_CONNECT_TIMEOUT", 30)
+SSH_POOL_IDLE_TIMEOUT = getattr(config, "SSH_POOL_IDLE_TIMEOUT", 300)
+SSH_KEEPALIVE_INTERVAL = getattr(config, "SSH_KEEPALIVE_INTERVAL", 30)
+
+
+class _PooledConnection:
+    def __init__(self, client: paramiko.SSHClient):
+        self.client = client
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class SSHConnectionPool:
+    """One authenticated SSH transport per server, shared by every collector"""
+    
+    def __init__(self, idle_timeout: float = SSH_POOL_IDLE_TIMEOUT,
+                 keepalive_interval: int = SSH_KEEPALIVE_INTERVAL,
+                 connect_timeout: float = SSH_CONNECT_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+        self._connections: Dict[Tuple, _PooledConnection] = {}
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(server_config: Dict) -> Tuple:
+        return (server_config["host"], server_config["port"], server_config["username"])
+    
+    def _key_lock(self, key: Tuple) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+    
+    def _open(self, server_config: Dict) -> paramiko.SSHClient:
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        
+        connect_kwargs = {
+            "hostname": server_config["host"],
+            "port": server_config["port"],
+            "username": server_config["username"],
+            "timeout": self.connect_timeout
+        }
+        
+        if server_config.get("key_path"):
+            connect_kwargs["key_filename"] = server_config["key_path"]
+        elif server_config.get("password"):
+            connect_kwargs["password"] = server_config["password"]
+        
+        client.connect(**connect_kwargs)
+        transport = client.get_transport()
+        if transport and self.keepalive_interval:
+            transport.set_keepalive(self.keepalive_interval)
+        return client
+    
+    def _is_healthy(self, conn: _PooledConnection) -> bool:
+        transport = conn.client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        # Probe sessions that have been quiet long enough for a NAT or sshd to drop them
+        if time.monotonic() - conn.last_used > self.keepalive_interval:
+            try:
+                transport.send_ignore()
+            except Exception:
+                return False
+        return True
+    
+    def get(self, server_config: Dict) -> paramiko.SSHClient:
+        """Return a live client for the server, connecting or reconnecting as needed"""
+        self.evict_idle()
+        key = self._key(server_config)
+        
+        with self._key_lock(key):
+            conn = self._connections.get(key)
+            if conn and self._is_healthy(conn):
+                conn.last_used = time.monotonic()
+                return conn.client
+            
+            if conn:
+                self._close(conn)
+            
+            conn = _PooledConnection(self._open(server_config))
+            with self._lock:
+                self._connections[key] = conn
+            return conn.client
+    
+    def touch(self, server_config: Dict):
+        """Mark a session as in use so long-running commands are not evicted as idle"""
+        with self._lock:
+            conn = self._connections.get(self._key(server_config))
+            if conn:
+                conn.last_used = time.monotonic()
+    
+    def reconnect(self, server_config: Dict) -> paramiko.SSHClient:
+        """Drop the pooled session for a server and open a fresh one"""
+        self.invalidate(server_config)
+        return self.get(server_config)
+    
+    def invalidate(self, server_config: Dict):
+        key = self._key(server_config)
+        with self._lock:
+            conn = self._connections.pop(key, None)
+        if conn:
+            self._close(conn)
+    
+    @staticmethod
+    def _open_channels(conn: _PooledConnection) -> int:
+        """Channels still open on the session, i.e. commands, tunnels or actions in progress"""
+        transport = conn.client.get_transport()
+        if transport is None:
+            return 0
+        try:
+            return len(transport._channels)
+        except Exception:
+            return 0
+    
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = []
+            for key, conn in self._connections.items():
+                if now - conn.last_used <= self.idle_timeout:
+                    continue
+                if self._open_channels(conn):
+                    # A long command looks idle from get()'s point of view; idle time
+                    # counts from when its last channel closes instead
+                    conn.last_used = now
+                    continue
+                expired.append(key)
+            evicted = [self._connections.pop(key) for key in expired]
+        for conn in evicted:
+            self._close(conn)
+    
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            self._close(conn)
+    
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{key[2]}@{key[0]}:{key[1]}": {
+                    "age": round(now - conn.created_at, 1),
+                    "idle": round(now - conn.last_used, 1),
+                    "channels": self._open_channels(conn)
+                }
+                for key, conn in self._connections.items()
+            }
+    
+    @staticmethod
+    def _close(conn: _PooledConnection):
+        try:
+            conn.client.close()
+        except Exception:
+            pass
+
+
+# Shared by SSHCollector, DockerCollector, DetailedAnalyzer and ServerActions
+ssh_pool = SSHConnectionPool()
@@ -1,9 +1,42 @@
+import math
+import os
 import paramiko
+import queue
+import shlex
+import signal
+import socket
 import subprocess
-from typing import Dict, Any, Union
+import threading
+import time
+import config
+from concurrent.futures import ThreadPoolExecutor
+from app.collectors.cancellation import on_cancel, raise_if_cancelled, run_local, track
+from app.collectors.connection_pool import ssh_pool
+from app.collectors.dir_index import refresh_directory_index
+from app.collectors.file_index import scan_large_files
+from app.collectors.single_flight import single_flight
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Independent shell probes of a deep analysis; each runs on its own channel with its own deadline
+PROBES = {
+    "docker_disk": "docker system df -v",
+    "memory_processes": "ps aux --sort=-%mem | head -10"
+}
+ANALYZE_PROBE_DEADLINES = getattr(config, "ANALYZE_PROBE_DEADLINES", {"docker_disk": 60, "memory_processes": 15})
+ANALYZE_PROBE_WORKERS = getattr(config, "ANALYZE_PROBE_WORKERS", 16)
+
+_probe_pool = ThreadPoolExecutor(max_workers=ANALYZE_PROBE_WORKERS, thread_name_prefix="probe")
+
+
+class ProbeCancelled(Exception):
+    pass
+
 
 class DetailedAnalyzer:
+    PROBE_POLL_INTERVAL = 0.2
+    
     def __init__(self, server_config: Dict):
+        self.server_config = server_config
         self.host = server_config["host"]
         self.port = server_config["port"]
         self.username = server_config["username"]
@@ -12,78 +45,190 @@ class DetailedAnalyzer:
         self.is_localhost = self.host in ["localhost", "127.0.0.1", "::1"]
     
     def _connect(self) -> Union[paramiko.SSHClient, None]:
-        """Connect via SSH or return None for localhost"""
+        """Borrow a pooled SSH session or return None for localhost"""
         if self.is_localhost:
             return None
         
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        connect_kwargs = {
-            "hostname": self.host,
-            "port": self.port,
-            "username": self.username,
-            "timeout": 30
-        }
-        
-        if self.key_path:
-            connect_kwargs["key_filename"] = self.key_path
-        elif self.password:
-            connect_kwargs["password"] = self.password
-        
-        client.connect(**connect_kwargs)
-        return client
+        return ssh_pool.get(self.server_config)
     
-    def _run_command(self, client: Union[paramiko.SSHClient, None], command: str) -> str:
-        """Run command via SSH or locally via subprocess"""
+    def _run_command(self, client: Union[paramiko.SSHClient, None], command: str, timeout: int = 60,
+                     input: Optional[str] = None) -> str:
+        """Run command via SSH or locally via subprocess, optionally feeding input on stdin"""
         if self.is_localhost:
             try:
-                result = subprocess.run(
-                    command,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=60,
-                    check=False
-                )
-                return result.stdout.strip()
+                output = run_local(command, timeout, input).strip()
             except subprocess.TimeoutExpired:
-                return ""
+                output = ""
             except Exception as e:
-                return f"Error: {str(e)}"
+                output = f"Error: {str(e)}"
         else:
-            stdin, stdout, stderr = client.exec_command(command, timeout=60)
-            return stdout.read().decode('utf-8').strip()
+            try:
+                stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+            except paramiko.SSHException:
+                # Pooled session died between the health check and this call
+                client = ssh_pool.reconnect(self.server_config)
+                stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+            track(stdout.channel)
+            if input is not None:
+                stdin.write(input)
+            stdin.channel.shutdown_write()
+            output = stdout.read().decode('utf-8').strip()
+        raise_if_cancelled()
+        return output
     
-    def analyze(self) -> Dict[str, Any]:
+    def _run_probe(self, command: str, deadline: float, cancel: threading.Event) -> str:
+        """
+        Run one probe on its own channel of the pooled connection (or its own
+        subprocess) and return its output. Stops the command and raises
+        TimeoutError at the deadline, or ProbeCancelled once cancel is set.
+        """
+        stop_at = time.monotonic() + deadline
+        
+        def check():
+            if cancel.is_set():
+                raise ProbeCancelled("Cancelled")
+            if time.monotonic() > stop_at:
+                raise TimeoutError(f"No result within {deadline:g}s")
+        
+        if self.is_localhost:
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True
+            )
+            try:
+                while True:
+                    try:
+                        output, _ = process.communicate(timeout=self.PROBE_POLL_INTERVAL)
+                        return output.decode('utf-8', 'replace').strip()
+                    except subprocess.TimeoutExpired:
+                        check()
+            finally:
+                if process.poll() is None:
+                    os.killpg(process.pid, signal.SIGKILL)
+                    process.wait()
+        
+        client = self._connect()
         try:
-            client = self._connect()
-            
-            # Disk usage by directory
-            disk_by_dir = self._run_command(client, 
-                "du -sh /home/* /var/* /tmp 2>/dev/null | sort -rh | head -15")
-            
-            # Docker system df
-            docker_df = self._run_command(client, "docker system df -v 2>/dev/null")
-            
-            # Large files
-            large_files = self._run_command(client,
-                "find /home /var/www -type f -size +50M -exec ls -lh {} \\; 2>/dev/null | head -10")
-            
-            # Memory by process
-            memory_procs = self._run_command(client,
-                "ps aux --sort=-%mem | head -10")
-            
-            if client:
-                client.close()
-            
-            return {
-                "disk_by_directory": disk_by_dir,
-                "docker_disk": docker_df,
-                "large_files": large_files,
-                "memory_processes": memory_procs
-            }
-        except Exception as e:
-            return {"error": str(e)}
-
-
+            channel = client.get_transport().open_session()
+        except (paramiko.SSHException, AttributeError):
+            client = ssh_pool.reconnect(self.server_config)
+            channel = client.get_transport().open_session()
+        
+        channel.settimeout(self.PROBE_POLL_INTERVAL)
+        # The first output line is the pid of the remote timeout process, so an
+        # abandoned probe can be killed; timeout itself bounds it if that fails
+        channel.exec_command(f"echo $$; exec timeout {math.ceil(deadline)} sh -c {shlex.quote(command)} 2>/dev/null")
+        channel.shutdown_write()
+        output = b""
+        finished = False
+        try:
+            while True:
+                check()
+                try:
+                    data = channel.recv(32768)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                output += data
+            finished = True
+            return output.partition(b"\n")[2].decode('utf-8', 'replace').strip()
+        finally:
+            channel.close()
+            pid = output.partition(b"\n")[0].strip()
+            if not finished and pid.isdigit():
+                try:
+                    killer = client.get_transport().open_session()
+                    killer.exec_command(f"kill -TERM {pid.decode()}")
+                    killer.recv_exit_status()
+                    killer.close()
+                except Exception:
+                    pass
+    
+    def run_probes(self, names: Optional[List[str]] = None,
+                   cancel: Optional[threading.Event] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Start every probe at once and yield (name, result) as each one finishes.
+        A result has 'output', 'status' ('ok', 'timeout', 'error' or 'cancelled'),
+        'elapsed' and, when it failed, 'error'. Closing the generator early
+        cancels the probes still running.
+        """
+        cancel = cancel or threading.Event()
+        names = names or list(PROBES)
+        finished: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue()
+        
+        def run(name: str):
+            started = time.monotonic()
+            deadline = ANALYZE_PROBE_DEADLINES.get(name, 60)
+            try:
+                result = {"output": self._run_probe(PROBES[name], deadline, cancel), "status": "ok"}
+            except TimeoutError as e:
+                result = {"output": "", "status": "timeout", "error": str(e)}
+            except ProbeCancelled:
+                result = {"output": "", "status": "cancelled", "error": "Cancelled"}
+            except Exception as e:
+                result = {"output": "", "status": "error", "error": str(e)}
+            result["elapsed"] = round(time.monotonic() - started, 2)
+            finished.put((name, result))
+        
+        for name in names:
+            _probe_pool.submit(run, name)
+        try:
+            for _ in names:
+                yield finished.get()
+        finally:
+            cancel.set()
+    
+    @single_flight
+    def analyze(self) -> Dict[str, Any]:
+        """
+        Every probe's output by name. A probe that fails or runs past its deadline
+        only loses its own section, which then says why, and is listed in 'errors'.
+        Disk usage by directory and large files come from the stored indexes
+        (see refresh_directory_index and scan_large_files).
+        """
+        cancel = threading.Event()
+        # A caller giving up stops the probes, which kill their own commands
+        on_cancel(cancel.set)
+        analysis = self.combine(self.run_probes(cancel=cancel))
+        raise_if_cancelled()
+        return analysis
+    
+    @staticmethod
+    def combine(results: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """Fold (name, result) pairs from run_probes into the analysis dict"""
+        analysis: Dict[str, Any] = {}
+        errors = {}
+        for name, result in results:
+            analysis[name] = result["output"]
+            if result["status"] != "ok":
+                errors[name] = result["error"]
+                analysis[name] = f"Failed: {result['error']}"
+        if errors:
+            analysis["errors"] = errors
+        return analysis
+    
+    def refresh_directory_index(self, server_id: str, db, full: bool = False) -> Dict[str, Any]:
+        """Rescan changed directories at idle priority and store the sizes; returns the scan summary"""
+        client = self._connect()
+        roots: Optional[List[str]] = self.server_config.get("dir_index_roots")
+        return refresh_directory_index(
+            server_id,
+            lambda command, timeout, input=None: self._run_command(client, command, timeout, input),
+            db, roots, full
+        )
+    
+    def scan_large_files(self, server_id: str, db) -> Dict[str, Any]:
+        """Find the largest files at idle priority and store them as a new scan; returns the scan summary"""
+        client = self._connect()
+        return scan_large_files(
+            server_id,
+            lambda command, timeout: self._run_command(client, command, timeout),
+            db,
+            self.server_config.get("large_file_roots"),
+            self.server_config.get("large_file_min_size")
+        )
@@ -0,0 +1,124 @@
+"""
+Directory Index - Disk usage per directory kept between scans, re-measured only where directories changed
+"""
+import posixpath
+import shlex
+import time
+import config
+from typing import Callable, Dict, Iterable, List, Optional
+
+DIR_INDEX_ROOTS = getattr(config, "DIR_INDEX_ROOTS", ["/home", "/var", "/tmp"])
+DIR_INDEX_FULL_RESCAN = getattr(config, "DIR_INDEX_FULL_RESCAN", 86400)
+DIR_INDEX_SCAN_TIMEOUT = getattr(config, "DIR_INDEX_SCAN_TIMEOUT", 1800)
+
+# Lowest CPU and idle-class I/O priority for everything a scan runs; ionice is skipped where missing
+THROTTLE = "nice -n 19 $(command -v ionice >/dev/null && echo ionice -c3)"
+
+
+def list_directories_command(roots: Iterable[str]) -> str:
+    """Every directory under the roots with its mtime; stays on each root's filesystem and stats no files"""
+    paths = " ".join(shlex.quote(root) for root in roots)
+    return f"{THROTTLE} find {paths} -xdev -type d -printf '%T@\\t%p\\n' 2>/dev/null"
+
+
+def own_sizes_command() -> str:
+    """
+    Disk usage of the files directly inside each directory read NUL-separated from
+    stdin, summed on the host so only one line per directory comes back.
+    """
+    return (
+        f"{THROTTLE} xargs -0 -r sh -c 'find \"$@\" -maxdepth 1 ! -type d -printf \"%b\\t%h\\n\"' _ 2>/dev/null"
+        " | awk '{i = index($0, \"\\t\"); s[substr($0, i + 1)] += substr($0, 1, i - 1)}"
+        " END {for (d in s) printf \"%.0f\\t%s\\n\", s[d] * 512, d}'"
+    )
+
+
+def parse_directory_listing(output: str) -> Dict[str, float]:
+    directories = {}
+    for line in output.split('\n'):
+        mtime, _, path = line.partition('\t')
+        if path.startswith('/'):
+            try:
+                directories[path] = float(mtime)
+            except ValueError:
+                continue
+    return directories
+
+
+def parse_own_sizes(output: str) -> Dict[str, int]:
+    sizes = {}
+    for line in output.split('\n'):
+        size, _, path = line.partition('\t')
+        if path and size.isdigit():
+            sizes[path] = int(size)
+    return sizes
+
+
+def compute_totals(own: Dict[str, int]) -> Dict[str, int]:
+    """Subtree size of every directory: its own files plus all indexed descendants"""
+    totals = dict(own)
+    # Deepest first, so each directory is complete before it is added to its parent
+    for path in sorted(own, key=lambda p: p.count('/'), reverse=True):
+        parent = posixpath.dirname(path)
+        if parent != path and parent in totals:
+            totals[parent] += totals[path]
+    return totals
+
+
+def human_size(size: float) -> str:
+    """Binary units the way `du -h` prints them"""
+    for unit in ("", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            return f"{size:.0f}{unit}" if unit == "" or size >= 10 else f"{size:.1f}{unit}"
+        size /= 1024
+
+
+def format_entries(entries: List[Dict]) -> str:
+    return "\n".join(f"{human_size(entry['bytes'])}\t{entry['path']}" for entry in entries)
+
+
+def refresh_directory_index(server_id: str, run: Callable[..., str], db,
+                            roots: Optional[List[str]] = None, full: bool = False) -> Dict:
+    """
+    Bring the server's stored index up to date. Every directory's mtime is listed
+    (cheap: no file is stat'ed), and only directories that are new or whose mtime
+    moved have their files re-measured. A file growing in place does not touch its
+    directory's mtime, so a full re-measure still happens every DIR_INDEX_FULL_RESCAN.
+    run(command, timeout=..., input=...) executes a shell command on the host.
+    """
+    roots = roots or DIR_INDEX_ROOTS
+    started = time.time()
+    previous = db.get_dir_index(server_id)
+    last_scan = db.get_dir_scan(server_id)
+    full = full or not last_scan or started - last_scan["full_scan_at"] > DIR_INDEX_FULL_RESCAN
+
+    listing = parse_directory_listing(run(list_directories_command(roots), timeout=DIR_INDEX_SCAN_TIMEOUT))
+    if not listing:
+        raise RuntimeError(f"No directories found under {', '.join(roots)}")
+
+    changed = [path for path, mtime in listing.items()
+               if full or path not in previous or previous[path][0] != mtime]
+    own = {path: previous[path][1] for path in listing if path in previous}
+    if changed:
+        sizes = parse_own_sizes(run(own_sizes_command(), timeout=DIR_INDEX_SCAN_TIMEOUT,
+                                    input="\0".join(changed)))
+        for path in changed:
+            own[path] = sizes.get(path, 0)
+    totals = compute_totals(own)
+
+    rows = [
+        (path, posixpath.dirname(path), mtime, own[path], totals[path])
+        for path, mtime in listing.items()
+        if previous.get(path) != (mtime, own[path], totals[path])
+    ]
+    removed = [path for path in previous if path not in listing]
+    scan = {
+        "scanned_at": started,
+        "full_scan_at": started if full else last_scan["full_scan_at"],
+        "duration": round(time.time() - started, 2),
+        "directories": len(listing),
+        "remeasured": len(changed),
+        "roots": list(roots)
+    }
+    db.save_dir_index(server_id, rows, removed, scan)
+    return scan
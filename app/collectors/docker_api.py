@@ -0,0 +1,196 @@
+"""
+Docker Engine API - JSON calls to dockerd over its unix socket, tunnelled through SSH for remote hosts
+"""
+import http.client
+import json
+import queue
+import socket
+import threading
+import config
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.collectors.cancellation import current_scope, track
+from app.collectors.connection_pool import ssh_pool
+
+DOCKER_SOCKET = getattr(config, "DOCKER_SOCKET", "/var/run/docker.sock")
+DOCKER_API_TIMEOUT = getattr(config, "DOCKER_API_TIMEOUT", 15)
+DOCKER_API_WORKERS = getattr(config, "DOCKER_API_WORKERS", 4)
+
+
+class DockerAPIError(Exception):
+    pass
+
+
+class _SocketConnection(http.client.HTTPConnection):
+    """HTTP/1.1 over any connected socket-like object (unix socket or SSH channel)"""
+    
+    def __init__(self, open_socket: Callable[[], Any], timeout: float):
+        super().__init__("docker", timeout=timeout)
+        self._open_socket = open_socket
+    
+    def connect(self):
+        self.sock = self._open_socket()
+
+
+def unix_socket_opener(path: str, timeout: float = DOCKER_API_TIMEOUT) -> Callable[[], socket.socket]:
+    scope = current_scope()
+    
+    def open_socket():
+        sock = track(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM), scope)
+        sock.settimeout(timeout)
+        sock.connect(path)
+        return sock
+    return open_socket
+
+
+def ssh_opener(server_config: Dict, timeout: float = DOCKER_API_TIMEOUT) -> Callable[[], Any]:
+    """
+    Each connection is an exec channel on the pooled SSH session running
+    `docker system dial-stdio`, which relays its stdin/stdout to the remote
+    daemon socket, so no port forwarding or socket permissions beyond the
+    docker CLI's are needed.
+    """
+    # Connections are opened from get_many's pool threads, so the scope is taken here
+    scope = current_scope()
+    
+    def open_socket():
+        transport = ssh_pool.get(server_config).get_transport()
+        channel = track(transport.open_session(), scope)
+        channel.settimeout(timeout)
+        channel.exec_command("docker system dial-stdio")
+        return channel
+    return open_socket
+
+
+class DockerEngineClient:
+    """
+    Minimal read-only Engine API client. Keep-alive connections are reused, and at
+    most `workers` of them (so at most that many SSH tunnels) are open at once.
+    """
+    
+    def __init__(self, open_socket: Callable[[], Any], timeout: float = DOCKER_API_TIMEOUT,
+                 workers: int = DOCKER_API_WORKERS):
+        self.open_socket = open_socket
+        self.timeout = timeout
+        self.workers = workers
+        self._idle: "queue.LifoQueue[_SocketConnection]" = queue.LifoQueue()
+        self._all: List[_SocketConnection] = []
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def for_server(cls, server_config: Dict, is_localhost: bool) -> "DockerEngineClient":
+        path = server_config.get("docker_socket", DOCKER_SOCKET)
+        if is_localhost:
+            return cls(unix_socket_opener(path))
+        return cls(ssh_opener(server_config))
+    
+    def _connection(self) -> _SocketConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            conn = _SocketConnection(self.open_socket, self.timeout)
+            with self._lock:
+                self._all.append(conn)
+            return conn
+    
+    def get(self, path: str) -> Any:
+        conn = self._connection()
+        try:
+            conn.request("GET", path, headers={"Host": "docker"})
+            response = conn.getresponse()
+            body = response.read()
+        except Exception:
+            conn.close()
+            raise
+        self._idle.put(conn)
+        
+        if response.status >= 400:
+            try:
+                message = json.loads(body).get("message", "")
+            except ValueError:
+                message = body[:200].decode("utf-8", "replace")
+            raise DockerAPIError(f"{response.status} on {path}: {message}")
+        return json.loads(body)
+    
+    def get_many(self, paths: List[str]) -> Dict[str, Any]:
+        """GET several paths in parallel; failed calls map to their exception"""
+        def fetch(path: str) -> Tuple[str, Any]:
+            try:
+                return path, self.get(path)
+            except Exception as e:
+                return path, e
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return dict(pool.map(fetch, paths))
+    
+    def close(self):
+        with self._lock:
+            connections, self._all = self._all, []
+        for conn in connections:
+            conn.close()
+
+
+def cpu_percent(stats: Dict, previous: Optional[Dict] = None) -> Optional[float]:
+    """CPU% the way `docker stats` computes it, against precpu_stats or an earlier sample"""
+    current = stats.get("cpu_stats") or {}
+    before = previous or stats.get("precpu_stats") or {}
+    
+    cpu_delta = current.get("cpu_usage", {}).get("total_usage", 0) - before.get("cpu_usage", {}).get("total_usage", 0)
+    system_delta = current.get("system_cpu_usage", 0) - before.get("system_cpu_usage", 0)
+    if not before.get("system_cpu_usage") or system_delta <= 0:
+        return None
+    
+    online = current.get("online_cpus") or len(current.get("cpu_usage", {}).get("percpu_usage") or []) or 1
+    return round(max(cpu_delta, 0) / system_delta * online * 100, 2)
+
+
+def memory_usage(stats: Dict) -> Dict:
+    memory = stats.get("memory_stats") or {}
+    details = memory.get("stats") or {}
+    # Page cache is reclaimable; `docker stats` leaves it out (cgroup v1 "cache", v2 "inactive_file")
+    cache = details.get("inactive_file", details.get("cache", 0))
+    usage = max(memory.get("usage", 0) - cache, 0)
+    limit = memory.get("limit", 0)
+    return {
+        "usage": usage,
+        "limit": limit,
+        "percent": round(usage / limit * 100, 2) if limit else 0
+    }
+
+
+def network_io(stats: Dict) -> Dict:
+    networks = (stats.get("networks") or {}).values()
+    return {
+        "rx_bytes": sum(net.get("rx_bytes", 0) for net in networks),
+        "tx_bytes": sum(net.get("tx_bytes", 0) for net in networks)
+    }
+
+
+def block_io(stats: Dict) -> Dict:
+    entries = (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []
+    totals = {"read": 0, "write": 0}
+    for entry in entries:
+        op = entry.get("op", "").lower()
+        if op in totals:
+            totals[op] += entry.get("value", 0)
+    return {"read_bytes": totals["read"], "write_bytes": totals["write"]}
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "kB", "MB", "GB"):
+        if size < 1000:
+            return f"{size:.3g}{unit}"
+        size /= 1000
+    return f"{size:.3g}TB"
+
+
+def disk_usage(df: Dict) -> Dict[str, int]:
+    """Bytes per `docker system df` category"""
+    return {
+        "Images": sum(image.get("Size", 0) for image in df.get("Images") or []),
+        "Containers": sum(container.get("SizeRw", 0) or 0 for container in df.get("Containers") or []),
+        "Local Volumes": sum(
+            max((volume.get("UsageData") or {}).get("Size", 0), 0) for volume in df.get("Volumes") or []
+        ),
+        "Build Cache": sum(cache.get("Size", 0) for cache in df.get("BuildCache") or [])
+    }
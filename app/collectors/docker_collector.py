@@ -1,9 +1,28 @@
 import paramiko
 import subprocess
-from typing import Dict, Any, List, Union
+import threading
+import time
+import config
+from app.collectors.cancellation import Cancelled, raise_if_cancelled, run_local, track
+from app.collectors.connection_pool import ssh_pool
+from app.collectors.batch import build_batch_script, parse_batch_output
+from app.collectors.single_flight import single_flight
+from app.collectors.docker_api import (
+    DockerEngineClient, cpu_percent, memory_usage, network_io, block_io, disk_usage, format_size
+)
+from typing import Dict, Any, List, Tuple, Union
+
+# After the Engine API fails for a host, use the CLI for this long before trying again
+DOCKER_API_RETRY = getattr(config, "DOCKER_API_RETRY", 600)
 
 class DockerCollector:
+    # Last cpu_stats per (host, port, container id), so stats can be one-shot
+    _previous_cpu: Dict[Tuple, Dict] = {}
+    _api_failed_at: Dict[Tuple, float] = {}
+    _state_lock = threading.Lock()
+    
     def __init__(self, server_config: Dict):
+        self.server_config = server_config
         self.host = server_config["host"]
         self.port = server_config["port"]
         self.username = server_config["username"]
@@ -12,60 +31,137 @@ class DockerCollector:
         self.is_localhost = self.host in ["localhost", "127.0.0.1", "::1"]
     
     def _connect(self) -> Union[paramiko.SSHClient, None]:
-        """Connect via SSH or return None for localhost"""
+        """Borrow a pooled SSH session or return None for localhost"""
         if self.is_localhost:
             return None
         
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        connect_kwargs = {
-            "hostname": self.host,
-            "port": self.port,
-            "username": self.username,
-            "timeout": 30
-        }
-        
-        if self.key_path:
-            connect_kwargs["key_filename"] = self.key_path
-        elif self.password:
-            connect_kwargs["password"] = self.password
-        
-        client.connect(**connect_kwargs)
-        return client
+        return ssh_pool.get(self.server_config)
     
     def _run_command(self, client: Union[paramiko.SSHClient, None], command: str) -> str:
         """Run command via SSH or locally via subprocess"""
         if self.is_localhost:
             try:
-                result = subprocess.run(
-                    command,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=30,
-                    check=False
-                )
-                return result.stdout.strip()
+                output = run_local(command, timeout=30).strip()
             except subprocess.TimeoutExpired:
-                return ""
+                output = ""
             except Exception as e:
-                return f"Error: {str(e)}"
+                output = f"Error: {str(e)}"
         else:
-            stdin, stdout, stderr = client.exec_command(command, timeout=30)
-            return stdout.read().decode('utf-8').strip()
+            try:
+                stdin, stdout, stderr = client.exec_command(command, timeout=30)
+            except paramiko.SSHException:
+                # Pooled session died between the health check and this call
+                client = ssh_pool.reconnect(self.server_config)
+                stdin, stdout, stderr = client.exec_command(command, timeout=30)
+            track(stdout.channel)
+            output = stdout.read().decode('utf-8').strip()
+        # A closed channel reads as EOF; that is not an empty answer from the host
+        raise_if_cancelled()
+        return output
     
+    def _run_batch(self, client: Union[paramiko.SSHClient, None], sections: Dict[str, str]) -> Dict[str, str]:
+        """Run several commands in one round trip and split the output per section"""
+        script, marker = build_batch_script(sections)
+        results = parse_batch_output(self._run_command(client, script), marker)
+        if not results:
+            raise RuntimeError("No output from host")
+        return results
+    
+    @single_flight
     def get_containers(self) -> Dict[str, Any]:
+        """Containers with per-container stats from the Engine API, or the CLI when it is unavailable"""
+        host_key = (self.host, self.port)
+        with self._state_lock:
+            failed_at = self._api_failed_at.get(host_key)
+        
+        if failed_at is None or time.monotonic() - failed_at > DOCKER_API_RETRY:
+            try:
+                return self._get_containers_api()
+            except Exception:
+                # Closed under a caller that gave up, which says nothing about the API
+                raise_if_cancelled()
+                with self._state_lock:
+                    self._api_failed_at[host_key] = time.monotonic()
+        
+        return self._get_containers_cli()
+    
+    def _container_stats(self, container_id: str, stats: Dict) -> Dict[str, Any]:
+        key = (self.host, self.port, container_id)
+        with self._state_lock:
+            previous = self._previous_cpu.get(key)
+            self._previous_cpu[key] = stats.get("cpu_stats") or {}
+        
+        return {
+            "cpu_percent": cpu_percent(stats, previous),
+            "memory": memory_usage(stats),
+            "network": network_io(stats),
+            "block_io": block_io(stats)
+        }
+    
+    def _get_containers_api(self) -> Dict[str, Any]:
+        client = DockerEngineClient.for_server(self.server_config, self.is_localhost)
+        try:
+            listed = client.get("/containers/json?all=1")
+            running = [c for c in listed if c.get("State") == "running"]
+            
+            # Without an earlier sample of our own, let the daemon take the two CPU readings
+            stats_paths = {}
+            for c in running:
+                with self._state_lock:
+                    seen = (self.host, self.port, c["Id"]) in self._previous_cpu
+                stats_paths[c["Id"]] = f"/containers/{c['Id']}/stats?stream=false" + ("&one-shot=true" if seen else "")
+            
+            results = client.get_many(list(stats_paths.values()) + ["/system/df"])
+        finally:
+            client.close()
+        
+        with self._state_lock:
+            running_keys = {(self.host, self.port, c["Id"]) for c in running}
+            for key in [key for key in self._previous_cpu if key[:2] == (self.host, self.port) and key not in running_keys]:
+                del self._previous_cpu[key]
+        
+        containers = []
+        for c in running:
+            stats = results.get(stats_paths[c["Id"]])
+            container = {
+                "id": c["Id"][:12],
+                "name": (c.get("Names") or ["/"])[0].lstrip("/"),
+                "status": c.get("Status", ""),
+                "image": c.get("Image", "")
+            }
+            if isinstance(stats, dict):
+                container.update(self._container_stats(c["Id"], stats))
+            containers.append(container)
+        
+        df = results.get("/system/df")
+        usage = disk_usage(df) if isinstance(df, dict) else {}
+        
+        return {
+            "running": len(running),
+            "total": len(listed),
+            "containers": containers,
+            "disk_usage": "\n".join(f"{kind}: {format_size(size)}" for kind, size in usage.items()),
+            "disk_usage_bytes": usage,
+            "source": "api"
+        }
+    
+    def _get_containers_cli(self) -> Dict[str, Any]:
         try:
             client = self._connect()
             
+            results = self._run_batch(client, {
+                "running": "docker ps -q | wc -l",
+                "total": "docker ps -aq | wc -l",
+                "containers": "docker ps --format '{{.Names}}|{{.Status}}|{{.Image}}'",
+                "disk_usage": "docker system df --format '{{.Type}}: {{.Size}}'"
+            })
+            
             # Get container counts
-            running = self._run_command(client, "docker ps -q | wc -l")
-            total = self._run_command(client, "docker ps -aq | wc -l")
+            running = results.get("running", "")
+            total = results.get("total", "")
             
             # Get container details
-            containers_output = self._run_command(client, 
-                "docker ps --format '{{.Names}}|{{.Status}}|{{.Image}}'")
+            containers_output = results.get("containers", "")
             
             containers = []
             if containers_output:
@@ -79,17 +175,17 @@ class DockerCollector:
                         })
             
             # Get Docker disk usage
-            disk_usage = self._run_command(client, "docker system df --format '{{.Type}}: {{.Size}}'")
-            
-            if client:
-                client.close()
+            disk_usage = results.get("disk_usage", "")
             
             return {
                 "running": int(running) if running else 0,
                 "total": int(total) if total else 0,
                 "containers": containers,
-                "disk_usage": disk_usage
+                "disk_usage": disk_usage,
+                "source": "cli"
             }
+        except Cancelled:
+            raise
         except Exception as e:
             return {
                 "running": 0,
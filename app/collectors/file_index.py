@@ -0,0 +1,82 @@
+"""
+Large File Index - The biggest files per server from one throttled find, kept per scan for later queries and diffs
+"""
+import heapq
+import shlex
+import time
+import config
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from app.collectors.dir_index import THROTTLE, human_size
+
+LARGE_FILE_ROOTS = getattr(config, "LARGE_FILE_ROOTS", ["/home", "/var", "/opt", "/srv", "/root", "/tmp"])
+LARGE_FILE_MIN_SIZE = getattr(config, "LARGE_FILE_MIN_SIZE", 50 * 1024 * 1024)
+LARGE_FILE_TOP = getattr(config, "LARGE_FILE_TOP", 200)
+LARGE_FILE_SCAN_TIMEOUT = getattr(config, "LARGE_FILE_SCAN_TIMEOUT", 1800)
+
+
+def large_files_command(roots: Iterable[str], min_size: int) -> str:
+    """One find for all roots printing size, mtime and path; nothing is forked per match"""
+    paths = " ".join(shlex.quote(root) for root in roots)
+    return f"{THROTTLE} find {paths} -xdev -type f -size +{int(min_size)}c -printf '%s\\t%T@\\t%p\\n' 2>/dev/null"
+
+
+def top_files(output: str, top: int) -> List[Tuple[int, float, str]]:
+    """The top largest (size, mtime, path) entries, largest first, holding at most top in memory"""
+    heap: List[Tuple[int, float, str]] = []
+    for line in output.split('\n'):
+        parts = line.split('\t', 2)
+        if len(parts) != 3 or not parts[0].isdigit() or not parts[2].startswith('/'):
+            continue
+        try:
+            entry = (int(parts[0]), float(parts[1]), parts[2])
+        except ValueError:
+            continue
+        if len(heap) < top:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return sorted(heap, reverse=True)
+
+
+def diff_files(before: List[Dict], after: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Changes between two scans: files that grew or shrank, appeared or disappeared.
+    Scans only hold each run's largest files, so "new" also covers files that
+    crossed into the top list.
+    """
+    previous = {f["path"]: f for f in before}
+    current = {f["path"]: f for f in after}
+    grown, shrunk, new = [], [], []
+    for path, f in current.items():
+        old = previous.get(path)
+        if old is None:
+            new.append(dict(f, delta=f["size"]))
+        elif f["size"] != old["size"]:
+            (grown if f["size"] > old["size"] else shrunk).append(dict(f, delta=f["size"] - old["size"]))
+    removed = [dict(f, delta=-f["size"]) for path, f in previous.items() if path not in current]
+
+    def by_delta(files: List[Dict]) -> List[Dict]:
+        return sorted(files, key=lambda f: abs(f["delta"]), reverse=True)
+    return {"grown": by_delta(grown), "new": by_delta(new), "shrunk": by_delta(shrunk), "removed": by_delta(removed)}
+
+
+def format_files(files: List[Dict]) -> str:
+    return "\n".join(f"{human_size(f['size'])}\t{f['path']}" for f in files)
+
+
+def scan_large_files(server_id: str, run: Callable[..., str], db, roots: Optional[List[str]] = None,
+                     min_size: Optional[int] = None, top: int = LARGE_FILE_TOP) -> Dict:
+    """Run one scan and store it; run(command, timeout=...) executes a shell command on the host"""
+    roots = roots or LARGE_FILE_ROOTS
+    min_size = LARGE_FILE_MIN_SIZE if min_size is None else min_size
+    started = time.time()
+    files = top_files(run(large_files_command(roots, min_size), timeout=LARGE_FILE_SCAN_TIMEOUT), top)
+    scan = {
+        "scanned_at": started,
+        "duration": round(time.time() - started, 2),
+        "roots": list(roots),
+        "min_size": min_size,
+        "files": len(files)
+    }
+    scan["id"] = db.save_large_files(server_id, scan, files)
+    return scan
@@ -0,0 +1,129 @@
+"""
+Local Collector - Read localhost metrics straight from /proc and psutil, without forking shells
+"""
+import math
+import os
+import socket
+import threading
+import time
+import psutil
+from typing import Dict, Any, List, Optional
+
+
+class LocalCollector:
+    """Native localhost backend producing the same payloads as SSHCollector"""
+    
+    # Previous CPU sample shared by every instance, so percent is measured between refreshes
+    _cpu_lock = threading.Lock()
+    _last_cpu_sample: Optional[tuple] = None
+    
+    MIN_CPU_INTERVAL = 0.1
+    
+    @staticmethod
+    def _cpu_totals() -> tuple:
+        times = psutil.cpu_times()
+        # guest time is already included in user/nice on Linux
+        total = sum(times) - getattr(times, "guest", 0) - getattr(times, "guest_nice", 0)
+        idle = times.idle + getattr(times, "iowait", 0)
+        return (total, idle)
+    
+    @classmethod
+    def cpu_percent(cls) -> float:
+        """Busy CPU share between the previous sample and now"""
+        with cls._cpu_lock:
+            previous = cls._last_cpu_sample
+            if previous is None or time.monotonic() - previous[0] < cls.MIN_CPU_INTERVAL:
+                # No usable baseline yet: take a short one rather than report a lifetime average
+                previous = (time.monotonic(), *cls._cpu_totals())
+                time.sleep(cls.MIN_CPU_INTERVAL)
+            
+            current = (time.monotonic(), *cls._cpu_totals())
+            cls._last_cpu_sample = current
+        
+        total_delta = current[1] - previous[1]
+        idle_delta = current[2] - previous[2]
+        if total_delta <= 0:
+            return 0.0
+        return round(max(0.0, min(100.0, (total_delta - idle_delta) / total_delta * 100)), 1)
+    
+    @staticmethod
+    def _format_uptime(seconds: float) -> str:
+        """Match the output of `uptime -p`"""
+        minutes = int(seconds // 60)
+        units = [("week", 7 * 24 * 60), ("day", 24 * 60), ("hour", 60), ("minute", 1)]
+        parts = []
+        for name, size in units:
+            count, minutes = divmod(minutes, size)
+            if count:
+                parts.append(f"{count} {name}{'s' if count != 1 else ''}")
+        return "up " + (", ".join(parts) if parts else "0 minutes")
+    
+    def collect_all(self) -> Dict[str, Any]:
+        try:
+            load_avg = " ".join(f"{value:.2f}" for value in os.getloadavg())
+            
+            mem = psutil.virtual_memory()
+            mem_percent = (mem.used / mem.total * 100) if mem.total > 0 else 0
+            
+            # Same arithmetic as `df -B1 /`: used excludes reserved blocks, percent rounds up
+            st = os.statvfs("/")
+            disk_total = st.f_blocks * st.f_frsize
+            disk_used = (st.f_blocks - st.f_bfree) * st.f_frsize
+            disk_avail = st.f_bavail * st.f_frsize
+            disk_percent = math.ceil(disk_used / (disk_used + disk_avail) * 100) if disk_used + disk_avail > 0 else 0
+            
+            return {
+                "status": "online",
+                "cpu": {
+                    "percent": self.cpu_percent(),
+                    "cores": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else psutil.cpu_count(),
+                    "load_avg": load_avg
+                },
+                "memory": {
+                    "total": mem.total,
+                    "used": mem.used,
+                    "percent": round(mem_percent, 1)
+                },
+                "disk": {
+                    "total": disk_total,
+                    "used": disk_used,
+                    "percent": disk_percent
+                },
+                "uptime": self._format_uptime(time.time() - psutil.boot_time()),
+                "hostname": socket.gethostname()
+            }
+        except Exception as e:
+            return {
+                "status": "offline",
+                "error": str(e)
+            }
+    
+    def get_processes(self, limit: int = 15, sort: str = "memory") -> List[Dict]:
+        try:
+            now = time.time()
+            rows = []
+            for proc in psutil.process_iter(["pid", "username", "name", "cmdline", "cpu_times", "create_time", "memory_percent"]):
+                info = proc.info
+                if info["memory_percent"] is None:
+                    continue
+                
+                # Lifetime average, the same figure `ps aux` reports in %CPU
+                cpu = 0.0
+                if info["cpu_times"] and info["create_time"]:
+                    elapsed = now - info["create_time"]
+                    if elapsed > 0:
+                        cpu = (info["cpu_times"].user + info["cpu_times"].system) / elapsed * 100
+                
+                command = " ".join(info["cmdline"]) if info["cmdline"] else f"[{info['name']}]"
+                rows.append({
+                    "user": info["username"] or "?",
+                    "pid": str(info["pid"]),
+                    "cpu": round(cpu, 1),
+                    "mem": round(info["memory_percent"], 1),
+                    "command": command[:50]
+                })
+            
+            rows.sort(key=lambda p: p["cpu" if sort == "cpu" else "mem"], reverse=True)
+            return rows[:limit]
+        except Exception as e:
+            return []
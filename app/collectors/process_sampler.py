@@ -0,0 +1,247 @@
+"""
+Process Sampler - Interval CPU% and RSS growth per process from successive /proc/<pid>/stat snapshots
+"""
+import heapq
+import os
+import pwd
+import threading
+import time
+import config
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+PROCESS_RING_SIZE = getattr(config, "PROCESS_RING_SIZE", 4)
+PROCESS_MIN_INTERVAL = getattr(config, "PROCESS_MIN_INTERVAL", 1.0)     # seconds between compared snapshots
+PROCESS_BASELINE_INTERVAL = getattr(config, "PROCESS_BASELINE_INTERVAL", 0.5)
+PROCESS_SAMPLE_MAX_AGE = getattr(config, "PROCESS_SAMPLE_MAX_AGE", 300)  # older snapshots are not compared against
+PROCESS_COMMAND_LENGTH = getattr(config, "PROCESS_COMMAND_LENGTH", 200)
+
+
+class ProcessSnapshot:
+    """All processes at one instant as parallel arrays sorted by pid"""
+
+    __slots__ = ("taken_at", "total_ticks", "pids", "starts", "ticks", "rss", "comms")
+
+    def __init__(self, taken_at: float, total_ticks: int):
+        self.taken_at = taken_at
+        self.total_ticks = total_ticks
+        self.pids = array("l")
+        self.starts = array("Q")
+        self.ticks = array("Q")   # utime + stime
+        self.rss = array("q")     # bytes
+        self.comms: List[str] = []
+
+
+def parse_proc_stat(stat_text: str, cpu_line: str, page_size: int, taken_at: float) -> ProcessSnapshot:
+    """Build a snapshot from concatenated /proc/<pid>/stat lines and the first line of /proc/stat"""
+    rows = []
+    for line in stat_text.splitlines():
+        # The command name may contain spaces and parentheses; it ends at the last ')'
+        open_paren, close_paren = line.find("("), line.rfind(")")
+        if open_paren < 0 or close_paren < 0:
+            continue
+        fields = line[close_paren + 2:].split()
+        if len(fields) < 22:
+            continue
+        rows.append((
+            int(line[:open_paren]),
+            int(fields[19]),
+            int(fields[11]) + int(fields[12]),
+            int(fields[21]) * page_size,
+            line[open_paren + 1:close_paren]
+        ))
+    rows.sort()
+
+    snapshot = ProcessSnapshot(taken_at, sum(int(value) for value in cpu_line.split()[1:]))
+    for pid, start, ticks, rss, comm in rows:
+        snapshot.pids.append(pid)
+        snapshot.starts.append(start)
+        snapshot.ticks.append(ticks)
+        snapshot.rss.append(rss)
+        snapshot.comms.append(comm)
+    return snapshot
+
+
+class ProcessRing:
+    """The last few snapshots of one server in a fixed-size ring"""
+
+    def __init__(self, size: int = PROCESS_RING_SIZE):
+        self._slots: List[Optional[ProcessSnapshot]] = [None] * size
+        self._next = 0
+
+    def push(self, snapshot: ProcessSnapshot):
+        self._slots[self._next] = snapshot
+        self._next = (self._next + 1) % len(self._slots)
+
+    def newest_before(self, taken_at: float, min_interval: float) -> Optional[ProcessSnapshot]:
+        """Most recent snapshot at least min_interval older than taken_at and still fresh enough"""
+        size = len(self._slots)
+        for back in range(1, size + 1):
+            snapshot = self._slots[(self._next - back) % size]
+            if snapshot is None:
+                return None
+            age = taken_at - snapshot.taken_at
+            if age > PROCESS_SAMPLE_MAX_AGE:
+                return None
+            if age >= min_interval:
+                return snapshot
+        return None
+
+
+def interval_usage(previous: ProcessSnapshot, current: ProcessSnapshot, cpus: int) -> Tuple[array, array]:
+    """
+    CPU% (100 = one core, like top) and RSS change in bytes per process of current.
+    Both snapshots are sorted by pid, so they are matched in one merge pass; a pid
+    whose start time changed is a new process and is measured from its start.
+    """
+    cpu = array("d", bytes(8 * len(current.pids)))
+    rss_delta = array("q", bytes(8 * len(current.pids)))
+    core_ticks = (current.total_ticks - previous.total_ticks) / max(cpus, 1)
+
+    j, previous_count = 0, len(previous.pids)
+    for i, pid in enumerate(current.pids):
+        while j < previous_count and previous.pids[j] < pid:
+            j += 1
+        if j < previous_count and previous.pids[j] == pid and previous.starts[j] == current.starts[i]:
+            ticks = current.ticks[i] - previous.ticks[j]
+            rss_delta[i] = current.rss[i] - previous.rss[j]
+        else:
+            ticks = current.ticks[i]
+            rss_delta[i] = current.rss[i]
+        if core_ticks > 0:
+            cpu[i] = ticks / core_ticks * 100
+    return cpu, rss_delta
+
+
+def top_n(values: Sequence, n: int) -> List[int]:
+    """Indices of the n largest values, without sorting everything"""
+    return heapq.nlargest(n, range(len(values)), key=values.__getitem__)
+
+
+class ProcessSampler:
+    """
+    Keeps a ring of snapshots per server. Each call samples /proc once, compares
+    against an earlier snapshot for interval CPU% and RSS growth, and returns the
+    top processes. User and full command line are looked up only for those few
+    and cached by (pid, start time).
+    """
+
+    COMMAND_CACHE_SIZE = 4096
+
+    def __init__(self):
+        self._rings: Dict[Tuple, ProcessRing] = {}
+        self._details: Dict[Tuple, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def sample(self, key: Tuple, read_proc: Callable[[], Dict],
+               read_details: Callable[[List[int]], Dict[int, Tuple[str, str]]],
+               limit: int = 15, sort: str = "memory") -> List[Dict]:
+        """
+        read_proc returns {"stat", "cpu", "mem_total", "page_size", "cpus"} for the host;
+        read_details maps pids to (user, command line).
+        """
+        with self._lock:
+            ring = self._rings.setdefault(key, ProcessRing())
+
+        proc = read_proc()
+        current = parse_proc_stat(proc["stat"], proc["cpu"], proc["page_size"], time.monotonic())
+        previous = ring.newest_before(current.taken_at, PROCESS_MIN_INTERVAL)
+        if previous is None:
+            # Nothing recent to compare with: take a short baseline first
+            time.sleep(PROCESS_BASELINE_INTERVAL)
+            previous, proc = current, read_proc()
+            current = parse_proc_stat(proc["stat"], proc["cpu"], proc["page_size"], time.monotonic())
+            ring.push(previous)
+        ring.push(current)
+
+        cpu, rss_delta = interval_usage(previous, current, proc["cpus"])
+        ranked = top_n(cpu if sort == "cpu" else current.rss, limit)
+        details = self._lookup(key, current, ranked, read_details)
+        mem_total = proc["mem_total"] or 1
+
+        processes = []
+        for i in ranked:
+            user, command = details.get(i) or ("?", "")
+            processes.append({
+                "user": user,
+                "pid": str(current.pids[i]),
+                "cpu": round(cpu[i], 1),
+                "mem": round(current.rss[i] / mem_total * 100, 1),
+                "rss": current.rss[i],
+                "rss_delta": rss_delta[i],
+                "command": (command or f"[{current.comms[i]}]")[:PROCESS_COMMAND_LENGTH]
+            })
+        return processes
+
+    def _lookup(self, key: Tuple, snapshot: ProcessSnapshot, indices: List[int],
+                read_details: Callable[[List[int]], Dict[int, Tuple[str, str]]]) -> Dict[int, Tuple[str, str]]:
+        found = {}
+        missing = []
+        with self._lock:
+            for i in indices:
+                cached = self._details.get((key, snapshot.pids[i], snapshot.starts[i]))
+                if cached:
+                    found[i] = cached
+                else:
+                    missing.append(i)
+
+        if missing:
+            fetched = read_details([snapshot.pids[i] for i in missing])
+            with self._lock:
+                if len(self._details) > self.COMMAND_CACHE_SIZE:
+                    self._details.clear()
+                for i in missing:
+                    if snapshot.pids[i] in fetched:
+                        found[i] = fetched[snapshot.pids[i]]
+                        self._details[(key, snapshot.pids[i], snapshot.starts[i])] = found[i]
+        return found
+
+
+def read_local_proc() -> Dict:
+    """The same inputs the remote probe gathers, read straight from this host's /proc"""
+    stat_lines = []
+    for name in os.listdir("/proc"):
+        if name.isdigit():
+            try:
+                with open(f"/proc/{name}/stat") as f:
+                    stat_lines.append(f.read())
+            except OSError:
+                continue
+
+    with open("/proc/stat") as f:
+        cpu_line = f.readline()
+    mem_total = 0
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                mem_total = int(line.split()[1]) * 1024
+                break
+
+    return {
+        "stat": "".join(stat_lines),
+        "cpu": cpu_line,
+        "mem_total": mem_total,
+        "page_size": os.sysconf("SC_PAGE_SIZE"),
+        "cpus": os.cpu_count() or 1
+    }
+
+
+def read_local_details(pids: List[int]) -> Dict[int, Tuple[str, str]]:
+    details = {}
+    for pid in pids:
+        try:
+            uid = os.stat(f"/proc/{pid}").st_uid
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                command = f.read().replace(b"\0", b" ").decode("utf-8", "replace").strip()
+        except OSError:
+            continue
+        try:
+            user = pwd.getpwuid(uid).pw_name
+        except KeyError:
+            user = str(uid)
+        details[pid] = (user, command)
+    return details
+
+
+# Shared by every SSHCollector so snapshots survive between requests
+process_sampler = ProcessSampler()
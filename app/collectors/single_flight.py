@@ -0,0 +1,44 @@
+"""
+Single Flight - Concurrent calls of the same collector method for the same server share one collection
+"""
+import functools
+import inspect
+from app.cache import SingleFlight
+from app.collectors.cancellation import Cancelled, raise_if_cancelled
+
+# Shared by SSHCollector, DockerCollector and DetailedAnalyzer
+collector_flights = SingleFlight()
+
+
+def single_flight(method):
+    """
+    Coalesce a collector method: while a call is running for a server, calls with
+    the same arguments from any other collector instance for that server wait
+    for it and get its result.
+    """
+    signature = inspect.signature(method)
+    
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # Bound with defaults, so get_processes() and get_processes(15) share a key
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        server = self.server_config
+        key = (
+            (server["host"], server["port"], server["username"]),
+            type(self).__name__, method.__name__, tuple(bound.arguments.items())[1:]
+        )
+        return coalesce(collector_flights, key, lambda: method(self, *args, **kwargs))
+    return wrapper
+
+
+def coalesce(flights: SingleFlight, key, fn):
+    """
+    flights.do(key, fn)'s value, except that a call cancelled under another caller
+    is not shared: a waiter that is still waiting runs the call again itself.
+    """
+    while True:
+        try:
+            return flights.do(key, fn)[0]
+        except Cancelled:
+            raise_if_cancelled()
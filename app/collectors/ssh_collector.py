@@ -1,9 +1,17 @@
+import os
 import paramiko
 import subprocess
+from app.collectors.cancellation import Cancelled, raise_if_cancelled, run_local, track
+from app.collectors.connection_pool import ssh_pool
+from app.collectors.batch import build_batch_script, parse_batch_output
+from app.collectors.local_collector import LocalCollector
+from app.collectors.process_sampler import process_sampler, read_local_proc, read_local_details
+from app.collectors.single_flight import single_flight
 from typing import Dict, Any, Union
 
 class SSHCollector:
     def __init__(self, server_config: Dict):
+        self.server_config = server_config
         self.host = server_config["host"]
         self.port = server_config["port"]
         self.username = server_config["username"]
@@ -11,82 +19,86 @@ class SSHCollector:
         self.key_path = server_config.get("key_path")
         self.server_name = server_config["name"]
         self.is_localhost = self.host in ["localhost", "127.0.0.1", "::1"]
+        self.local = LocalCollector() if self.is_localhost else None
     
     def _connect(self) -> Union[paramiko.SSHClient, None]:
-        """Connect via SSH or return None for localhost"""
+        """Borrow a pooled SSH session or return None for localhost"""
         if self.is_localhost:
             return None
         
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        connect_kwargs = {
-            "hostname": self.host,
-            "port": self.port,
-            "username": self.username,
-            "timeout": 30
-        }
-        
-        if self.key_path:
-            connect_kwargs["key_filename"] = self.key_path
-        elif self.password:
-            connect_kwargs["password"] = self.password
-        
-        client.connect(**connect_kwargs)
-        return client
+        return ssh_pool.get(self.server_config)
     
     def _run_command(self, client: Union[paramiko.SSHClient, None], command: str) -> str:
         """Run command via SSH or locally via subprocess"""
         if self.is_localhost:
             # Run command directly on localhost
             try:
-                result = subprocess.run(
-                    command,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=30,
-                    check=False
-                )
-                return result.stdout.strip()
+                output = run_local(command, timeout=30).strip()
             except subprocess.TimeoutExpired:
-                return ""
+                output = ""
             except Exception as e:
-                return f"Error: {str(e)}"
+                output = f"Error: {str(e)}"
         else:
             # Run command via SSH
-            stdin, stdout, stderr = client.exec_command(command, timeout=30)
-            return stdout.read().decode('utf-8').strip()
+            try:
+                stdin, stdout, stderr = client.exec_command(command, timeout=30)
+            except paramiko.SSHException:
+                # Pooled session died between the health check and this call
+                client = ssh_pool.reconnect(self.server_config)
+                stdin, stdout, stderr = client.exec_command(command, timeout=30)
+            track(stdout.channel)
+            output = stdout.read().decode('utf-8').strip()
+        # A closed channel reads as EOF; that is not an empty answer from the host
+        raise_if_cancelled()
+        return output
+    
+    def _run_batch(self, client: Union[paramiko.SSHClient, None], sections: Dict[str, str]) -> Dict[str, str]:
+        """Run several commands in one round trip and split the output per section"""
+        script, marker = build_batch_script(sections)
+        results = parse_batch_output(self._run_command(client, script), marker)
+        if not results:
+            raise RuntimeError("No output from host")
+        return results
     
+    @single_flight
     def collect_all(self) -> Dict[str, Any]:
+        if self.local:
+            return self.local.collect_all()
+        
         try:
             client = self._connect()
             
+            # One composite probe instead of a channel per metric
+            results = self._run_batch(client, {
+                "cpu_percent": "top -bn1 | grep 'Cpu(s)' | awk '{print $2}' | cut -d'%' -f1",
+                "cpu_cores": "nproc",
+                "load_avg": "cat /proc/loadavg | awk '{print $1, $2, $3}'",
+                "mem_info": "free -b | grep Mem",
+                "disk_info": "df -B1 / | tail -1",
+                "uptime": "uptime -p",
+                "hostname": "hostname"
+            })
+            
             # CPU info
-            cpu_percent = self._run_command(client, "top -bn1 | grep 'Cpu(s)' | awk '{print $2}' | cut -d'%' -f1")
-            cpu_cores = self._run_command(client, "nproc")
-            load_avg = self._run_command(client, "cat /proc/loadavg | awk '{print $1, $2, $3}'")
+            cpu_percent = results.get("cpu_percent", "")
+            cpu_cores = results.get("cpu_cores", "")
+            load_avg = results.get("load_avg", "")
             
             # Memory info
-            mem_info = self._run_command(client, "free -b | grep Mem")
-            mem_parts = mem_info.split()
+            mem_parts = results.get("mem_info", "").split()
             mem_total = int(mem_parts[1]) if len(mem_parts) > 1 else 0
             mem_used = int(mem_parts[2]) if len(mem_parts) > 2 else 0
             mem_percent = (mem_used / mem_total * 100) if mem_total > 0 else 0
             
             # Disk info
-            disk_info = self._run_command(client, "df -B1 / | tail -1")
-            disk_parts = disk_info.split()
+            disk_parts = results.get("disk_info", "").split()
             disk_total = int(disk_parts[1]) if len(disk_parts) > 1 else 0
             disk_used = int(disk_parts[2]) if len(disk_parts) > 2 else 0
             disk_percent = int(disk_parts[4].replace('%', '')) if len(disk_parts) > 4 else 0
             
             # Uptime and hostname
-            uptime = self._run_command(client, "uptime -p")
-            hostname = self._run_command(client, "hostname")
-            
-            if client:
-                client.close()
+            uptime = results.get("uptime", "")
+            hostname = results.get("hostname", "")
             
             return {
                 "status": "online",
@@ -108,36 +120,74 @@ class SSHCollector:
                 "uptime": uptime,
                 "hostname": hostname
             }
+        except Cancelled:
+            raise
         except Exception as e:
             return {
                 "status": "offline",
                 "error": str(e)
             }
     
-    def get_processes(self, limit: int = 15) -> list:
+    @single_flight
+    def get_processes(self, limit: int = 15, sort: str = "memory") -> list:
+        """
+        Top processes by resident memory or by CPU. CPU% is measured over the
+        interval since this server's previous snapshot, not averaged over each
+        process's lifetime as `ps` reports it.
+        """
+        if self.local and not os.path.isdir("/proc/self"):
+            return self.local.get_processes(limit, sort)
+        
         try:
-            client = self._connect()
-            output = self._run_command(client, f"ps aux --sort=-%mem | head -{limit}")
-            if client:
-                client.close()
-            
-            lines = output.strip().split('\n')
-            if len(lines) < 2:
-                return []
+            if self.local:
+                return process_sampler.sample(("localhost",), read_local_proc, read_local_details, limit, sort)
             
-            processes = []
-            for line in lines[1:]:
-                parts = line.split(None, 10)
-                if len(parts) >= 11:
-                    processes.append({
-                        "user": parts[0],
-                        "pid": parts[1],
-                        "cpu": float(parts[2]),
-                        "mem": float(parts[3]),
-                        "command": parts[10][:50]
-                    })
-            return processes
+            client = self._connect()
+            return process_sampler.sample(
+                (self.host, self.port),
+                lambda: self._read_proc(client),
+                lambda pids: self._read_process_details(client, pids),
+                limit, sort
+            )
+        except Cancelled:
+            raise
         except Exception as e:
             return []
+    
+    def _read_proc(self, client: paramiko.SSHClient) -> Dict[str, Any]:
+        results = self._run_batch(client, {
+            "stat": "cat /proc/[0-9]*/stat",
+            "cpu": "head -1 /proc/stat",
+            "mem_total_kb": "awk '/^MemTotal:/ {print $2}' /proc/meminfo",
+            "page_size": "getconf PAGESIZE",
+            "cpus": "nproc"
+        })
+        if not results.get("stat"):
+            raise RuntimeError("/proc is not readable on this host")
+        return {
+            "stat": results["stat"],
+            "cpu": results.get("cpu", ""),
+            "mem_total": int(results.get("mem_total_kb") or 0) * 1024,
+            "page_size": int(results.get("page_size") or 4096),
+            "cpus": int(results.get("cpus") or 1)
+        }
+    
+    def _read_process_details(self, client: paramiko.SSHClient, pids: list) -> Dict[int, tuple]:
+        """Owner and full command line for just the listed pids, in one command"""
+        if not pids:
+            return {}
+        output = self._run_command(client, (
+            f"for p in {' '.join(str(pid) for pid in pids)}; do "
+            "u=$(stat -c %U /proc/$p 2>/dev/null) || continue; "
+            "c=$(tr '\\0' ' ' < /proc/$p/cmdline 2>/dev/null); "
+            "printf '%s\\t%s\\t%s\\n' \"$p\" \"$u\" \"$c\"; done"
+        ))
+        details = {}
+        for line in output.split('\n'):
+            # Kernel threads have an empty command line (and the last line loses its trailing tab)
+            parts = line.split('\t', 2) + [""]
+            if len(parts) >= 3 and parts[0].isdigit():
+                details[int(parts[0])] = (parts[1], parts[2].strip())
+        return details
 
 
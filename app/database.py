@@ -1,54 +1,685 @@
 import sqlite3
 import os
-from datetime import datetime
-from typing import List, Dict
+import threading
+import atexit
+import time
+import traceback
+import config
+import itertools
+import json
+import math
+from typing import List, Dict, Tuple, Optional, Iterable, Set
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'metrics.db')
 
+METRICS_FLUSH_SIZE = getattr(config, "METRICS_FLUSH_SIZE", 500)
+METRICS_FLUSH_INTERVAL = getattr(config, "METRICS_FLUSH_INTERVAL", 5)
+METRICS_POLL_INTERVAL = getattr(config, "METRICS_POLL_INTERVAL", 30)
+HISTORY_MAX_POINTS = getattr(config, "HISTORY_MAX_POINTS", 1500)
+
+# Retention in days per tier; None keeps data forever
+RETENTION_DAYS = {
+    "raw": getattr(config, "METRICS_RAW_RETENTION_DAYS", 7),
+    "1m": getattr(config, "METRICS_1M_RETENTION_DAYS", 30),
+    "1h": getattr(config, "METRICS_1H_RETENTION_DAYS", 400),
+    "1d": getattr(config, "METRICS_1D_RETENTION_DAYS", None)
+}
+
+# (tier, bucket size in seconds), finest first; each tier is built from the one before it
+ROLLUP_TIERS = [("1m", 60), ("1h", 3600), ("1d", 86400)]
+METRIC_NAMES = ("cpu", "memory", "disk")
+PRUNE_EVERY = 3600
+
+# Per-container series: a row is written only when cpu or memory moved by more than
+# these amounts since the container's last row, or the last row is this old
+CONTAINER_CPU_CHANGE = getattr(config, "CONTAINER_CPU_CHANGE", 1.0)          # percentage points
+CONTAINER_MEMORY_CHANGE = getattr(config, "CONTAINER_MEMORY_CHANGE", 4 * 1024 * 1024)  # bytes
+CONTAINER_HEARTBEAT = getattr(config, "CONTAINER_HEARTBEAT", 600)            # seconds
+CONTAINER_RETENTION_DAYS = getattr(config, "CONTAINER_RETENTION_DAYS", 7)
+CONTAINER_METRICS = {"cpu": "cpu_percent", "memory": "memory_bytes", "memory_percent": "memory_percent"}
+
+# Large-file scans are kept this long so changes can be compared over days; a server's newest scan is always kept
+LARGE_FILE_RETENTION_DAYS = getattr(config, "LARGE_FILE_RETENTION_DAYS", 30)
+
 class Database:
-    def __init__(self):
-        self.db_path = DB_PATH
+    def __init__(self, db_path: str = DB_PATH,
+                 flush_size: int = METRICS_FLUSH_SIZE,
+                 flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._buffer: List[Tuple] = []
+        self._buffer_lock = threading.Lock()
+        # Buffered samples are written by one long-lived thread, so every batch reuses
+        # that thread's connection instead of opening one per flush
+        self._writer: Optional[threading.Thread] = None
+        self._flush_wanted = threading.Event()
+        self._last_prune = 0.0
+        # Interned label ids and each container's last written row, by (server_id, container_id, name, image)
+        self._label_ids: Dict[Tuple, int] = {}
+        self._last_container_rows: Dict[int, Tuple] = {}
+        self._container_lock = threading.Lock()
         self._init_db()
+        atexit.register(self.flush)
+    
+    def _connection(self) -> sqlite3.Connection:
+        """One long-lived connection per thread, opened on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            # WAL lets history queries read while the collector writes;
+            # NORMAL sync is durable across app crashes and skips an fsync per commit
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-16000")
+            self._local.conn = conn
+        return conn
     
     def _init_db(self):
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
+        conn = self._connection()
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS metrics (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 server_id TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                ts INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
                 cpu_percent REAL,
                 memory_percent REAL,
                 disk_percent REAL
             )
         ''')
         conn.commit()
-        conn.close()
+        self._migrate(conn)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_metrics_server_ts ON metrics (server_id, ts)")
+        
+        stat_columns = ",\n".join(
+            f"{name}_min REAL, {name}_max REAL, {name}_avg REAL, {name}_p95 REAL"
+            for name in METRIC_NAMES
+        )
+        for tier, _ in ROLLUP_TIERS:
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS metrics_{tier} (
+                    server_id TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    samples INTEGER NOT NULL,
+                    {stat_columns},
+                    PRIMARY KEY (server_id, ts)
+                ) WITHOUT ROWID
+            ''')
+        
+        # Names and images are stored once per container in container_labels;
+        # series rows carry only the small label id
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS container_labels (
+                id INTEGER PRIMARY KEY,
+                server_id TEXT NOT NULL,
+                container_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                image TEXT NOT NULL,
+                UNIQUE (server_id, container_id, name, image)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS container_metrics (
+                label_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                cpu_percent REAL,
+                memory_bytes INTEGER,
+                memory_percent REAL,
+                net_rx INTEGER,
+                net_tx INTEGER,
+                block_read INTEGER,
+                block_write INTEGER,
+                PRIMARY KEY (label_id, ts)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Directory sizes from the incremental disk scan, one row per directory
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS dir_index (
+                server_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                parent TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                own_bytes INTEGER NOT NULL,
+                total_bytes INTEGER NOT NULL,
+                PRIMARY KEY (server_id, path)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_dir_index_parent ON dir_index (server_id, parent, total_bytes)")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS dir_index_scans (
+                server_id TEXT PRIMARY KEY,
+                scanned_at REAL NOT NULL,
+                full_scan_at REAL NOT NULL,
+                duration REAL,
+                directories INTEGER,
+                remeasured INTEGER,
+                roots TEXT
+            )
+        ''')
+        
+        # Each large-file scan keeps its own top list so any two scans can be compared
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS large_file_scans (
+                id INTEGER PRIMARY KEY,
+                server_id TEXT NOT NULL,
+                scanned_at REAL NOT NULL,
+                duration REAL,
+                min_size INTEGER,
+                roots TEXT
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_large_file_scans_server ON large_file_scans (server_id, scanned_at)")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS large_files (
+                scan_id INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL,
+                PRIMARY KEY (scan_id, path)
+            ) WITHOUT ROWID
+        ''')
+        conn.commit()
+        self._backfill_rollups(conn)
     
-    def save_metrics(self, server_id: str, cpu: float, memory: float, disk: float):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO metrics (server_id, cpu_percent, memory_percent, disk_percent)
-            VALUES (?, ?, ?, ?)
-        ''', (server_id, cpu, memory, disk))
+    @staticmethod
+    def _has_legacy_timestamps(conn: sqlite3.Connection) -> bool:
+        return "timestamp" in [row[1] for row in conn.execute("PRAGMA table_info(metrics)")]
+    
+    def _migrate(self, conn: sqlite3.Connection):
+        """Upgrade databases created before timestamps were stored as epoch seconds"""
+        if not self._has_legacy_timestamps(conn):
+            return
+        
+        # Rebuild in place: TEXT 'YYYY-MM-DD HH:MM:SS' (UTC) becomes INTEGER seconds.
+        # sqlite3 opens no transaction for DDL by itself, so one is begun explicitly:
+        # either the whole rebuild lands or none of it does
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have migrated while this one waited for the lock
+            if not self._has_legacy_timestamps(conn):
+                conn.commit()
+                return
+            # Left behind by a rebuild interrupted before this ran in one transaction
+            conn.execute("DROP TABLE IF EXISTS metrics_migrated")
+            conn.execute('''
+                CREATE TABLE metrics_migrated (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    server_id TEXT NOT NULL,
+                    ts INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                    cpu_percent REAL,
+                    memory_percent REAL,
+                    disk_percent REAL
+                )
+            ''')
+            conn.execute('''
+                INSERT INTO metrics_migrated (id, server_id, ts, cpu_percent, memory_percent, disk_percent)
+                SELECT id, server_id, CAST(strftime('%s', timestamp) AS INTEGER),
+                       cpu_percent, memory_percent, disk_percent
+                FROM metrics
+                WHERE timestamp IS NOT NULL
+                ORDER BY server_id, timestamp
+            ''')
+            conn.execute("DROP TABLE metrics")
+            conn.execute("ALTER TABLE metrics_migrated RENAME TO metrics")
+        except BaseException:
+            conn.rollback()
+            raise
         conn.commit()
-        conn.close()
     
-    def get_history(self, server_id: str, hours: int = 24) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT timestamp, cpu_percent, memory_percent, disk_percent
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        """Nearest-rank percentile"""
+        ordered = sorted(values)
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+    
+    @classmethod
+    def _summarize(cls, samples: List[Tuple]) -> Tuple:
+        """Raw (cpu, memory, disk) samples -> (samples, min, max, avg, p95 per metric)"""
+        row = [len(samples)]
+        for index in range(len(METRIC_NAMES)):
+            values = [sample[index] for sample in samples if sample[index] is not None]
+            if values:
+                row += [min(values), max(values), sum(values) / len(values), cls._percentile(values, 0.95)]
+            else:
+                row += [None, None, None, None]
+        return tuple(row)
+    
+    @staticmethod
+    def _combine(children: List[Tuple]) -> Tuple:
+        """
+        Merge finer rollup rows into one coarser row.
+        min/max/avg are exact; p95 is the sample-weighted 95th percentile of the
+        children's p95 values, which tracks the true figure closely at these sizes.
+        """
+        total = sum(child[0] for child in children)
+        row = [total]
+        for index in range(len(METRIC_NAMES)):
+            base = 1 + index * 4
+            parts = [child for child in children if child[base] is not None]
+            if not parts:
+                row += [None, None, None, None]
+                continue
+            weight = sum(child[0] for child in parts)
+            weighted = sorted((child[base + 3], child[0]) for child in parts)
+            threshold, running, p95 = 0.95 * weight, 0, weighted[-1][0]
+            for value, count in weighted:
+                running += count
+                if running >= threshold:
+                    p95 = value
+                    break
+            row += [
+                min(child[base] for child in parts),
+                max(child[base + 1] for child in parts),
+                sum(child[base + 2] * child[0] for child in parts) / weight,
+                p95
+            ]
+        return tuple(row)
+    
+    def _upsert_rollups(self, conn: sqlite3.Connection, tier: str, rows: Iterable[Tuple]):
+        placeholders = ", ".join("?" * (3 + 4 * len(METRIC_NAMES)))
+        conn.executemany(f"INSERT OR REPLACE INTO metrics_{tier} VALUES ({placeholders})", rows)
+    
+    def _update_rollups(self, conn: sqlite3.Connection, buckets: Set[Tuple[str, int]]):
+        """Recompute only the rollup buckets touched by newly inserted samples"""
+        source = None
+        for tier, size in ROLLUP_TIERS:
+            buckets = {(server_id, ts - ts % size) for server_id, ts in buckets}
+            rows = []
+            for server_id, start in sorted(buckets):
+                if source is None:
+                    samples = conn.execute('''
+                        SELECT cpu_percent, memory_percent, disk_percent FROM metrics
+                        WHERE server_id = ? AND ts >= ? AND ts < ?
+                    ''', (server_id, start, start + size)).fetchall()
+                    if samples:
+                        rows.append((server_id, start, *self._summarize(samples)))
+                else:
+                    children = conn.execute(f'''
+                        SELECT * FROM metrics_{source}
+                        WHERE server_id = ? AND ts >= ? AND ts < ?
+                    ''', (server_id, start, start + size)).fetchall()
+                    if children:
+                        rows.append((server_id, start, *self._combine([child[2:] for child in children])))
+            self._upsert_rollups(conn, tier, rows)
+            source = tier
+    
+    def _backfill_rollups(self, conn: sqlite3.Connection):
+        """Build rollups for raw data recorded before rollup tiers existed"""
+        if conn.execute("SELECT 1 FROM metrics_1m LIMIT 1").fetchone():
+            return
+        if not conn.execute("SELECT 1 FROM metrics LIMIT 1").fetchone():
+            return
+        
+        with conn:
+            source = None
+            for tier, size in ROLLUP_TIERS:
+                if source is None:
+                    cursor = conn.execute('''
+                        SELECT server_id, ts, cpu_percent, memory_percent, disk_percent
+                        FROM metrics ORDER BY server_id, ts
+                    ''')
+                    groups = itertools.groupby(cursor, key=lambda row: (row[0], row[1] - row[1] % size))
+                    rows = [(*key, *self._summarize([row[2:] for row in group])) for key, group in groups]
+                else:
+                    cursor = conn.execute(f"SELECT * FROM metrics_{source} ORDER BY server_id, ts")
+                    groups = itertools.groupby(cursor, key=lambda row: (row[0], row[1] - row[1] % size))
+                    rows = [(*key, *self._combine([row[2:] for row in group])) for key, group in groups]
+                self._upsert_rollups(conn, tier, rows)
+                source = tier
+    
+    def _write_samples(self, rows: List[Tuple]):
+        """Insert (server_id, ts, cpu, memory, disk) rows and refresh their rollups in one transaction"""
+        conn = self._connection()
+        with conn:
+            conn.executemany('''
+                INSERT INTO metrics (server_id, ts, cpu_percent, memory_percent, disk_percent)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            self._update_rollups(conn, {(row[0], row[1]) for row in rows})
+        
+        if time.time() - self._last_prune > PRUNE_EVERY:
+            self.prune()
+    
+    def prune(self):
+        """Delete data older than each tier's retention"""
+        self._last_prune = time.time()
+        conn = self._connection()
+        with conn:
+            for tier, table in [("raw", "metrics")] + [(tier, f"metrics_{tier}") for tier, _ in ROLLUP_TIERS]:
+                days = RETENTION_DAYS.get(tier)
+                if days:
+                    conn.execute(f"DELETE FROM {table} WHERE ts < ?", (int(time.time()) - days * 86400,))
+            if CONTAINER_RETENTION_DAYS:
+                conn.execute("DELETE FROM container_metrics WHERE ts < ?",
+                             (int(time.time()) - CONTAINER_RETENTION_DAYS * 86400,))
+                conn.execute('''
+                    DELETE FROM container_labels
+                    WHERE id NOT IN (SELECT DISTINCT label_id FROM container_metrics)
+                ''')
+            if LARGE_FILE_RETENTION_DAYS:
+                conn.execute('''
+                    DELETE FROM large_file_scans
+                    WHERE scanned_at < ?
+                      AND id NOT IN (SELECT MAX(id) FROM large_file_scans GROUP BY server_id)
+                ''', (time.time() - LARGE_FILE_RETENTION_DAYS * 86400,))
+                conn.execute("DELETE FROM large_files WHERE scan_id NOT IN (SELECT id FROM large_file_scans)")
+        with self._container_lock:
+            self._label_ids.clear()
+            self._last_container_rows.clear()
+    
+    def save_metrics(self, server_id: str, cpu: float, memory: float, disk: float):
+        self._write_samples([(server_id, int(time.time()), cpu, memory, disk)])
+    
+    def save_metrics_many(self, samples: List[Tuple[str, float, float, float]]):
+        """
+        Buffer (server_id, cpu, memory, disk) samples and write them in batched transactions.
+        The buffer is flushed once it reaches flush_size rows or flush_interval seconds.
+        """
+        # Stamp on arrival, not on flush
+        ts = int(time.time())
+        rows = [(server_id, ts, cpu, memory, disk) for server_id, cpu, memory, disk in samples]
+        
+        with self._buffer_lock:
+            self._buffer.extend(rows)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="metrics-writer", daemon=True)
+                self._writer.start()
+            if len(self._buffer) >= self.flush_size:
+                self._flush_wanted.set()
+    
+    def _write_loop(self):
+        while True:
+            self._flush_wanted.wait(self.flush_interval)
+            self._flush_wanted.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Keep the writer alive; the rows of this batch are lost
+                traceback.print_exc()
+    
+    def flush(self):
+        """Write buffered samples now; the writer thread does this on its own, and atexit at shutdown"""
+        with self._buffer_lock:
+            rows, self._buffer = self._buffer, []
+        
+        if not rows:
+            return
+        
+        self._write_samples(rows)
+    
+    def _label_id(self, conn: sqlite3.Connection, key: Tuple) -> int:
+        label_id = self._label_ids.get(key)
+        if label_id is None:
+            conn.execute('''
+                INSERT OR IGNORE INTO container_labels (server_id, container_id, name, image)
+                VALUES (?, ?, ?, ?)
+            ''', key)
+            label_id = conn.execute('''
+                SELECT id FROM container_labels
+                WHERE server_id = ? AND container_id = ? AND name = ? AND image = ?
+            ''', key).fetchone()[0]
+            self._label_ids[key] = label_id
+        return label_id
+    
+    @staticmethod
+    def _container_changed(previous: Optional[Tuple], row: Tuple) -> bool:
+        """row is (label_id, ts, cpu, memory_bytes, ...); compare against the last row written"""
+        if previous is None or row[1] - previous[1] >= CONTAINER_HEARTBEAT:
+            return True
+        if (row[2] is None) != (previous[2] is None):
+            return True
+        if row[2] is not None and abs(row[2] - previous[2]) > CONTAINER_CPU_CHANGE:
+            return True
+        return abs((row[3] or 0) - (previous[3] or 0)) > CONTAINER_MEMORY_CHANGE
+    
+    def save_container_samples(self, server_id: str, containers: List[Dict]) -> int:
+        """
+        Record one poll of DockerCollector containers, writing only those whose cpu or
+        memory changed noticeably since their last row. Returns the number of rows written.
+        """
+        ts = int(time.time())
+        conn = self._connection()
+        
+        with self._container_lock, conn:
+            rows = []
+            for container in containers:
+                if "memory" not in container:
+                    continue
+                key = (server_id, container.get("id", ""), container.get("name", ""), container.get("image", ""))
+                label_id = self._label_id(conn, key)
+                network = container.get("network", {})
+                block = container.get("block_io", {})
+                row = (
+                    label_id, ts,
+                    container.get("cpu_percent"),
+                    container["memory"].get("usage"),
+                    container["memory"].get("percent"),
+                    network.get("rx_bytes"), network.get("tx_bytes"),
+                    block.get("read_bytes"), block.get("write_bytes")
+                )
+                if self._container_changed(self._last_container_rows.get(label_id), row):
+                    rows.append(row)
+                    self._last_container_rows[label_id] = row
+            
+            conn.executemany('''
+                INSERT OR REPLACE INTO container_metrics
+                (label_id, ts, cpu_percent, memory_bytes, memory_percent, net_rx, net_tx, block_read, block_write)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        
+        return len(rows)
+    
+    def get_container_history(self, server_id: str, hours: float = 24, metric: str = "memory",
+                              top: Optional[int] = 5) -> List[Dict]:
+        """
+        Series for the top containers by peak metric ('cpu', 'memory' or 'memory_percent')
+        in the window, highest first. Rows are written on change, so each value holds
+        until the next point.
+        """
+        column = CONTAINER_METRICS.get(metric)
+        if column is None:
+            raise ValueError(f"Unknown metric: {metric}")
+        
+        since = int(time.time() - hours * 3600)
+        conn = self._connection()
+        leaders = conn.execute(f'''
+            SELECT l.id, l.container_id, l.name, l.image, MAX(m.{column}) AS peak
+            FROM container_labels l JOIN container_metrics m ON m.label_id = l.id
+            WHERE l.server_id = ? AND m.ts > ?
+            GROUP BY l.id
+            ORDER BY peak DESC
+            LIMIT ?
+        ''', (server_id, since, top if top else -1)).fetchall()
+        
+        result = []
+        for label_id, container_id, name, image, peak in leaders:
+            points = conn.execute('''
+                SELECT datetime(ts, 'unixepoch'), cpu_percent, memory_bytes, memory_percent,
+                       net_rx, net_tx, block_read, block_write
+                FROM container_metrics
+                WHERE label_id = ? AND ts > ?
+                ORDER BY ts ASC
+            ''', (label_id, since)).fetchall()
+            result.append({
+                "id": container_id,
+                "name": name,
+                "image": image,
+                "peak": peak,
+                "history": [
+                    {
+                        "timestamp": row[0],
+                        "cpu": row[1],
+                        "memory_bytes": row[2],
+                        "memory_percent": row[3],
+                        "net_rx": row[4],
+                        "net_tx": row[5],
+                        "block_read": row[6],
+                        "block_write": row[7]
+                    }
+                    for row in points
+                ]
+            })
+        return result
+    
+    def get_dir_index(self, server_id: str) -> Dict[str, Tuple[float, int, int]]:
+        """Every indexed directory as path -> (mtime, own_bytes, total_bytes)"""
+        rows = self._connection().execute(
+            "SELECT path, mtime, own_bytes, total_bytes FROM dir_index WHERE server_id = ?", (server_id,)
+        )
+        return {path: (mtime, own, total) for path, mtime, own, total in rows}
+    
+    def save_dir_index(self, server_id: str, rows: List[Tuple], removed: List[str], scan: Dict):
+        """Apply one scan: changed rows are (path, parent, mtime, own_bytes, total_bytes)"""
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "DELETE FROM dir_index WHERE server_id = ? AND path = ?",
+                ((server_id, path) for path in removed)
+            )
+            conn.executemany('''
+                INSERT OR REPLACE INTO dir_index (server_id, path, parent, mtime, own_bytes, total_bytes)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', ((server_id,) + row for row in rows))
+            conn.execute('''
+                INSERT OR REPLACE INTO dir_index_scans
+                (server_id, scanned_at, full_scan_at, duration, directories, remeasured, roots)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (server_id, scan["scanned_at"], scan["full_scan_at"], scan["duration"],
+                  scan["directories"], scan["remeasured"], json.dumps(scan["roots"])))
+    
+    def get_dir_scan(self, server_id: str) -> Optional[Dict]:
+        row = self._connection().execute('''
+            SELECT scanned_at, full_scan_at, duration, directories, remeasured, roots
+            FROM dir_index_scans WHERE server_id = ?
+        ''', (server_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "scanned_at": row[0],
+            "full_scan_at": row[1],
+            "duration": row[2],
+            "directories": row[3],
+            "remeasured": row[4],
+            "roots": json.loads(row[5] or "[]")
+        }
+    
+    def get_dir_children(self, server_id: str, parents: List[str], top: Optional[int] = 15) -> List[Dict]:
+        """Largest directories directly under any of the given paths"""
+        placeholders = ", ".join("?" * len(parents))
+        rows = self._connection().execute(f'''
+            SELECT path, total_bytes, own_bytes FROM dir_index
+            WHERE server_id = ? AND parent IN ({placeholders}) AND path != parent
+            ORDER BY total_bytes DESC
+            LIMIT ?
+        ''', (server_id, *parents, top if top else -1)).fetchall()
+        return [{"path": path, "bytes": total, "own_bytes": own} for path, total, own in rows]
+    
+    def save_large_files(self, server_id: str, scan: Dict, files: List[Tuple[int, float, str]]) -> int:
+        """Store one large-file scan with its (size, mtime, path) entries; returns the scan id"""
+        conn = self._connection()
+        with conn:
+            scan_id = conn.execute('''
+                INSERT INTO large_file_scans (server_id, scanned_at, duration, min_size, roots)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (server_id, scan["scanned_at"], scan["duration"], scan["min_size"],
+                  json.dumps(scan["roots"]))).lastrowid
+            conn.executemany(
+                "INSERT OR REPLACE INTO large_files (scan_id, path, size, mtime) VALUES (?, ?, ?, ?)",
+                ((scan_id, path, size, mtime) for size, mtime, path in files)
+            )
+        return scan_id
+    
+    def get_large_file_scan(self, server_id: str, before: Optional[float] = None) -> Optional[Dict]:
+        """The newest scan, or the newest one taken at or before the given epoch time"""
+        row = self._connection().execute('''
+            SELECT id, scanned_at, duration, min_size, roots,
+                   (SELECT COUNT(*) FROM large_files WHERE scan_id = large_file_scans.id)
+            FROM large_file_scans
+            WHERE server_id = ? AND scanned_at <= ?
+            ORDER BY scanned_at DESC
+            LIMIT 1
+        ''', (server_id, before if before is not None else time.time())).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "scanned_at": row[1],
+            "duration": row[2],
+            "min_size": row[3],
+            "roots": json.loads(row[4] or "[]"),
+            "files": row[5]
+        }
+    
+    def get_large_files(self, scan_id: int, top: Optional[int] = None) -> List[Dict]:
+        rows = self._connection().execute('''
+            SELECT path, size, mtime FROM large_files
+            WHERE scan_id = ?
+            ORDER BY size DESC
+            LIMIT ?
+        ''', (scan_id, top if top else -1)).fetchall()
+        return [{"path": path, "size": size, "mtime": mtime} for path, size, mtime in rows]
+    
+    def select_tier(self, hours: float) -> str:
+        """Finest tier that keeps the window under HISTORY_MAX_POINTS and still holds data for it"""
+        candidates = [("raw", METRICS_POLL_INTERVAL)] + ROLLUP_TIERS
+        for tier, step in candidates:
+            retention = RETENTION_DAYS.get(tier)
+            if retention and hours > retention * 24:
+                continue
+            if hours * 3600 / step <= HISTORY_MAX_POINTS:
+                return tier
+        return ROLLUP_TIERS[-1][0]
+    
+    def get_rollups(self, server_id: str, hours: float, tier: str) -> List[Dict]:
+        """Full min/max/avg/p95 rows for a rollup tier"""
+        if tier not in dict(ROLLUP_TIERS):
+            raise ValueError(f"Unknown tier: {tier}")
+        self.flush()
+        
+        conn = self._connection()
+        cursor = conn.execute(f'''
+            SELECT datetime(ts, 'unixepoch'), * FROM metrics_{tier}
+            WHERE server_id = ? AND ts > ?
+            ORDER BY ts ASC
+        ''', (server_id, int(time.time() - hours * 3600)))
+        columns = [description[0] for description in cursor.description]
+        return [
+            {"timestamp": row[0], **{name: value for name, value in zip(columns[3:], row[3:])}}
+            for row in cursor.fetchall()
+        ]
+    
+    def get_history(self, server_id: str, hours: int = 24, tier: Optional[str] = "raw") -> List[Dict]:
+        """Average cpu/memory/disk per point; tier None picks one from the window size"""
+        tier = tier or self.select_tier(hours)
+        if tier != "raw":
+            return [
+                {
+                    "timestamp": row["timestamp"],
+                    "cpu": row["cpu_avg"],
+                    "memory": row["memory_avg"],
+                    "disk": row["disk_avg"]
+                }
+                for row in self.get_rollups(server_id, hours, tier)
+            ]
+        
+        # Make buffered samples visible to readers
+        self.flush()
+        
+        conn = self._connection()
+        cursor = conn.execute('''
+            SELECT datetime(ts, 'unixepoch'), cpu_percent, memory_percent, disk_percent
             FROM metrics
             WHERE server_id = ?
-            AND timestamp > datetime('now', ?)
-            ORDER BY timestamp ASC
-        ''', (server_id, f'-{hours} hours'))
+            AND ts > ?
+            ORDER BY ts ASC
+        ''', (server_id, int(time.time() - hours * 3600)))
         rows = cursor.fetchall()
-        conn.close()
         
         return [
             {
@@ -59,6 +690,27 @@ class Database:
             }
             for row in rows
         ]
+    
+    def get_history_columns(self, server_id: str, hours: int = 24, tier: str = "raw") -> Dict[str, List]:
+        """Same points as get_history as parallel arrays, with integer epoch timestamps"""
+        if tier == "raw":
+            table, columns = "metrics", "cpu_percent, memory_percent, disk_percent"
+        elif tier in dict(ROLLUP_TIERS):
+            table, columns = f"metrics_{tier}", "cpu_avg, memory_avg, disk_avg"
+        else:
+            raise ValueError(f"Unknown tier: {tier}")
+        
+        self.flush()
+        
+        conn = self._connection()
+        rows = conn.execute(f'''
+            SELECT ts, {columns} FROM {table}
+            WHERE server_id = ? AND ts > ?
+            ORDER BY ts ASC
+        ''', (server_id, int(time.time() - hours * 3600))).fetchall()
+        
+        ts, cpu, memory, disk = (list(column) for column in zip(*rows)) if rows else ([], [], [], [])
+        return {"ts": ts, "cpu": cpu, "memory": memory, "disk": disk}
 
 
 
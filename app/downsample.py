@@ -0,0 +1,62 @@
+"""
+Downsampling - Reduce time series to a fixed number of points while keeping their visual shape
+"""
+from datetime import datetime
+from typing import List, Dict, Sequence
+
+
+def lttb_indices(xs: Sequence[float], series: List[Sequence[float]], threshold: int) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets over one or more series sharing the same x values.
+    For every bucket it keeps the point whose triangle with the previously kept point
+    and the next bucket's average has the largest area, summed over all series, so
+    peaks in any series survive. Returns the indices of the kept points.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    
+    ys = [[value or 0.0 for value in values] for values in series]
+    bucket_size = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        
+        # Average of the next bucket (the last point for the final bucket)
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_ys = [sum(values[next_start:next_end]) / count for values in ys]
+        
+        ax = xs[a]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            dx_a = ax - avg_x
+            dx_i = ax - xs[i]
+            area = 0.0
+            for values, avg_y in zip(ys, avg_ys):
+                area += abs(dx_a * (values[i] - values[a]) - dx_i * (avg_y - values[a]))
+            if area > best_area:
+                best, best_area = i, area
+        
+        kept.append(best)
+        a = best
+    
+    kept.append(n - 1)
+    return kept
+
+
+def downsample_history(history: List[Dict], max_points: int, fields: Sequence[str] = ("cpu", "memory", "disk")) -> List[Dict]:
+    """Pick at most max_points rows of a get_history() result with LTTB across all metric fields"""
+    if len(history) <= max_points:
+        return history
+    
+    xs = [datetime.fromisoformat(row["timestamp"]).timestamp() for row in history]
+    series = [[row.get(field) for row in history] for field in fields]
+    return [history[i] for i in lttb_indices(xs, series, max_points)]
@@ -0,0 +1,389 @@
+"""
+Action Jobs - Run Smart Actions in the background and keep a bounded tail of their output
+"""
+import itertools
+import threading
+import time
+import traceback
+import uuid
+import config
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from app.actions import ServerActions
+from app.request_executor import ExecutorSaturated
+from app.stream import sse_event, STREAM_HEARTBEAT_INTERVAL
+
+JOB_MAX_WORKERS = getattr(config, "JOB_MAX_WORKERS", 8)
+JOB_MAX_PER_SERVER = getattr(config, "JOB_MAX_PER_SERVER", 1)
+JOB_MAX_QUEUED_PER_SERVER = getattr(config, "JOB_MAX_QUEUED_PER_SERVER", 10)
+JOB_OUTPUT_LINES = getattr(config, "JOB_OUTPUT_LINES", 2000)
+JOB_MAX_LINE_LENGTH = getattr(config, "JOB_MAX_LINE_LENGTH", 4096)
+JOB_HISTORY = getattr(config, "JOB_HISTORY", 200)
+FLEET_ACTION_CONCURRENCY = getattr(config, "FLEET_ACTION_CONCURRENCY", 5)
+FLEET_ACTION_MAX_FAILURES = getattr(config, "FLEET_ACTION_MAX_FAILURES", 1)
+
+
+class Job:
+    """
+    One action run. Output lines are numbered from 0 and kept in a ring buffer of
+    the last JOB_OUTPUT_LINES, so readers can resume from a line number and learn
+    how many lines they missed if the buffer wrapped.
+    """
+    
+    def __init__(self, server_id: str, action_id: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.server_id = server_id
+        self.action_id = action_id
+        self.action = ServerActions.ACTIONS[action_id]["name"]
+        self.status = "queued"
+        self.exit_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.lines: deque = deque(maxlen=JOB_OUTPUT_LINES)
+        self.next_line = 0
+        self._changed = threading.Condition()
+        self._on_finish: List[Callable[["Job"], None]] = []
+        # Set to stop the action; it is killed and the job fails as cancelled
+        self.cancelled = threading.Event()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+    
+    def start(self):
+        with self._changed:
+            self.status = "running"
+            self.started_at = datetime.utcnow().isoformat()
+            self._changed.notify_all()
+    
+    def append(self, line: str):
+        with self._changed:
+            self.lines.append(line[:JOB_MAX_LINE_LENGTH])
+            self.next_line += 1
+            self._changed.notify_all()
+    
+    def finish(self, exit_code: Optional[int], error: Optional[str] = None):
+        with self._changed:
+            self.exit_code = exit_code
+            self.error = error
+            self.status = "succeeded" if exit_code == 0 and error is None else "failed"
+            self.finished_at = datetime.utcnow().isoformat()
+            self._changed.notify_all()
+            callbacks, self._on_finish = self._on_finish, []
+        for callback in callbacks:
+            self._notify(callback)
+    
+    def on_finish(self, callback: Callable[["Job"], None]):
+        """Call back once the job has finished, immediately if it already has"""
+        with self._changed:
+            if not self.finished:
+                self._on_finish.append(callback)
+                return
+        self._notify(callback)
+    
+    def _notify(self, callback: Callable[["Job"], None]):
+        # A failing callback is logged; it must not change how the job ended
+        try:
+            callback(self)
+        except Exception:
+            traceback.print_exc()
+    
+    def read(self, since: int = 0) -> Tuple[List[str], int, int]:
+        """Lines numbered since and later as (lines, next line number, lines dropped by the ring buffer)"""
+        with self._changed:
+            first = self.next_line - len(self.lines)
+            start = max(since, first)
+            lines = list(itertools.islice(self.lines, start - first, None))
+            return lines, self.next_line, start - since if since < first else 0
+    
+    def tail(self, count: int) -> Tuple[List[str], int, int]:
+        with self._changed:
+            return self.read(max(self.next_line - count, 0))
+    
+    def wait(self, since: int, timeout: float) -> bool:
+        """Block until there is output past since or the job ends; False on timeout"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.next_line > since or self.finished, timeout)
+    
+    def join(self, timeout: float) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: self.finished, timeout)
+    
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "server_id": self.server_id,
+            "action_id": self.action_id,
+            "action": self.action,
+            "status": self.status,
+            "success": self.status == "succeeded" if self.finished else None,
+            "exit_code": self.exit_code,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "lines": self.next_line
+        }
+
+
+class JobManager:
+    """
+    Queues action jobs and runs them on a shared pool. At most JOB_MAX_PER_SERVER
+    jobs run on one server at a time; the rest wait in that server's queue without
+    holding a worker. Finished jobs are forgotten beyond the newest JOB_HISTORY.
+    """
+    
+    def __init__(self, servers: Dict[str, Dict], max_workers: int = JOB_MAX_WORKERS,
+                 max_per_server: int = JOB_MAX_PER_SERVER,
+                 on_finish: Optional[Callable[[Job], None]] = None):
+        self.servers = servers
+        self.max_per_server = max_per_server
+        # Called for every finished job, e.g. to drop cached state of the server it changed
+        self.on_finish = on_finish
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._runs: "OrderedDict[str, FleetRun]" = OrderedDict()
+        self._queued: Dict[str, deque] = {}
+        self._running: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, server_id: str, action_id: str) -> Job:
+        job = Job(server_id, action_id)
+        if self.on_finish is not None:
+            job.on_finish(self.on_finish)
+        
+        with self._lock:
+            queue = self._queued.setdefault(server_id, deque())
+            if len(queue) >= JOB_MAX_QUEUED_PER_SERVER:
+                raise ExecutorSaturated(f"Too many actions queued for {server_id}")
+            
+            self._jobs[job.id] = job
+            self._forget_old()
+            
+            if self._running.get(server_id, 0) < self.max_per_server:
+                self._running[server_id] = self._running.get(server_id, 0) + 1
+            else:
+                queue.append(job)
+                return job
+        
+        self._pool.submit(self._run, job)
+        return job
+    
+    def _forget_old(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - JOB_HISTORY, 0)]:
+            del self._jobs[job_id]
+    
+    def _run(self, job: Job):
+        job.start()
+        try:
+            job.finish(*self._execute(job))
+        finally:
+            with self._lock:
+                queue = self._queued.get(job.server_id)
+                next_job = queue.popleft() if queue else None
+                if next_job is None:
+                    self._running[job.server_id] -= 1
+            if next_job is not None:
+                self._pool.submit(self._run, next_job)
+    
+    def _execute(self, job: Job) -> Tuple[Optional[int], Optional[str]]:
+        """The action's (exit code, error); only the action's own failure counts against the job"""
+        try:
+            actions = ServerActions(self.servers[job.server_id])
+            return actions.stream_action(job.action_id, job.append, cancel=job.cancelled), None
+        except Exception as e:
+            return None, str(e)
+    
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Stop a running job, or drop a queued one before it starts; None if there is no such job"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            queue = self._queued.get(job.server_id)
+            dequeued = job.status == "queued" and queue is not None and job in queue
+            if dequeued:
+                queue.remove(job)
+        
+        job.cancelled.set()
+        if dequeued:
+            job.finish(None, "Cancelled")
+        return job
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def list(self, server_id: Optional[str] = None) -> List[Job]:
+        with self._lock:
+            return [job for job in self._jobs.values() if server_id is None or job.server_id == server_id]
+    
+    def submit_fleet(self, action_id: str, server_ids: List[str], concurrency: int = FLEET_ACTION_CONCURRENCY,
+                     batch_size: Optional[int] = None, max_failures: Optional[int] = FLEET_ACTION_MAX_FAILURES) -> "FleetRun":
+        run = FleetRun(self, action_id, server_ids, concurrency, batch_size, max_failures)
+        with self._lock:
+            self._runs[run.id] = run
+            while len(self._runs) > JOB_HISTORY:
+                self._runs.popitem(last=False)
+        run.start()
+        return run
+    
+    def get_fleet_run(self, run_id: str) -> Optional["FleetRun"]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+
+class FleetRun:
+    """
+    One action across several servers. Servers are taken in batches of batch_size
+    (all at once by default); within a batch up to concurrency jobs run and the next
+    server starts as soon as one finishes. Once max_failures servers have failed no
+    new jobs start, in-flight ones finish, and the rest are marked skipped.
+    """
+    
+    def __init__(self, manager: JobManager, action_id: str, server_ids: List[str], concurrency: int,
+                 batch_size: Optional[int], max_failures: Optional[int]):
+        self.id = uuid.uuid4().hex[:12]
+        self.manager = manager
+        self.action_id = action_id
+        self.action = ServerActions.ACTIONS[action_id]["name"]
+        self.concurrency = max(concurrency, 1)
+        self.batch_size = batch_size or len(server_ids) or 1
+        self.max_failures = max_failures
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.hosts: "OrderedDict[str, Dict]" = OrderedDict(
+            (server_id, {"status": "pending", "job_id": None}) for server_id in server_ids
+        )
+        self._started = time.monotonic()
+        self._elapsed: Optional[float] = None
+        self._changed = threading.Condition()
+    
+    def start(self):
+        threading.Thread(target=self._run, name=f"fleet-run-{self.id}", daemon=True).start()
+    
+    def _failures(self) -> int:
+        return sum(1 for host in self.hosts.values() if host["status"] == "failed")
+    
+    def _should_stop(self) -> bool:
+        return self.max_failures is not None and self._failures() >= self.max_failures
+    
+    def _job_finished(self, job: Job):
+        with self._changed:
+            self.hosts[job.server_id].update({
+                "status": job.status,
+                "exit_code": job.exit_code,
+                "error": job.error or (None if job.status == "succeeded" else f"Exited with status {job.exit_code}")
+            })
+            self._changed.notify_all()
+    
+    def _launch(self, server_id: str):
+        try:
+            job = self.manager.submit(server_id, self.action_id)
+        except Exception as e:
+            with self._changed:
+                self.hosts[server_id].update({"status": "failed", "error": str(e)})
+            return
+        with self._changed:
+            self.hosts[server_id].update({"status": "running", "job_id": job.id})
+        job.on_finish(self._job_finished)
+    
+    def _active(self, server_ids: List[str]) -> int:
+        return sum(1 for server_id in server_ids if self.hosts[server_id]["status"] == "running")
+    
+    def _run(self):
+        try:
+            self._dispatch()
+        except Exception as e:
+            # Jobs already started run to the end; nothing else is started
+            traceback.print_exc()
+            self._finish("failed", str(e))
+    
+    def _finish(self, status: str, error: Optional[str] = None):
+        with self._changed:
+            for host in self.hosts.values():
+                if host["status"] == "pending":
+                    host["status"] = "skipped"
+            self.status = status
+            self.error = error
+            self._elapsed = time.monotonic() - self._started
+            self._changed.notify_all()
+    
+    def _dispatch(self):
+        server_ids = list(self.hosts)
+        for offset in range(0, len(server_ids), self.batch_size):
+            batch = server_ids[offset:offset + self.batch_size]
+            pending = list(batch)
+            
+            while pending:
+                with self._changed:
+                    self._changed.wait_for(
+                        lambda: self._active(batch) < self.concurrency or self._should_stop()
+                    )
+                    if self._should_stop():
+                        break
+                self._launch(pending.pop(0))
+            
+            with self._changed:
+                self._changed.wait_for(lambda: self._active(batch) == 0)
+                if self._should_stop():
+                    break
+        
+        with self._changed:
+            stopped = self._should_stop()
+        self._finish("stopped" if stopped else "completed")
+    
+    @property
+    def finished(self) -> bool:
+        return self.status != "running"
+    
+    def join(self, timeout: float) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: self.finished, timeout)
+    
+    def to_dict(self) -> Dict:
+        with self._changed:
+            summary: Dict[str, int] = {}
+            for host in self.hosts.values():
+                summary[host["status"]] = summary.get(host["status"], 0) + 1
+            return {
+                "run_id": self.id,
+                "action_id": self.action_id,
+                "action": self.action,
+                "status": self.status,
+                "error": self.error,
+                "concurrency": self.concurrency,
+                "batch_size": self.batch_size,
+                "max_failures": self.max_failures,
+                "created_at": self.created_at,
+                "elapsed": round(self._elapsed if self._elapsed is not None else time.monotonic() - self._started, 3),
+                "summary": summary,
+                "hosts": {server_id: dict(host) for server_id, host in self.hosts.items()}
+            }
+
+
+def job_event_stream(job: Job, since: int = 0, heartbeat: float = STREAM_HEARTBEAT_INTERVAL) -> Iterator[str]:
+    """
+    Server-sent events following a job: 'output' batches of new lines (with any
+    'dropped' count when a slow reader fell behind the ring buffer), then 'done'.
+    """
+    yield sse_event("status", job.to_dict())
+    
+    while True:
+        if not job.wait(since, heartbeat):
+            yield sse_event("heartbeat", {})
+            continue
+        
+        lines, since, dropped = job.read(since)
+        if lines or dropped:
+            yield sse_event("output", {"lines": lines, "next": since, "dropped": dropped})
+        
+        if job.finished and since >= job.next_line:
+            yield sse_event("done", job.to_dict())
+            return
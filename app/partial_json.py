@@ -0,0 +1,108 @@
+"""
+Partial JSON - Pull complete fields out of a JSON object while it is still being generated
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class IncrementalObjectParser:
+    """
+    Feed a top-level JSON object in arbitrary chunks. Each feed() returns events for
+    whatever became complete:
+      ("item", key, value)  - an element of a top-level array field
+      ("field", key, value) - a whole top-level field
+    """
+    
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.stack: List[str] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.expecting_key = True
+        self.key: Optional[str] = None
+        self.value_start: Optional[int] = None
+        self.item_start: Optional[int] = None
+    
+    def _in_top_array(self) -> bool:
+        return len(self.stack) == 2 and self.stack[1] == "["
+    
+    def _mark_start(self):
+        depth = len(self.stack)
+        if depth == 1 and not self.expecting_key and self.value_start is None:
+            self.value_start = self.pos
+        elif self._in_top_array() and self.item_start is None:
+            self.item_start = self.pos
+    
+    def _emit_field(self, events: List[Tuple], end: int):
+        events.append(("field", self.key, json.loads(self.buffer[self.value_start:end])))
+        self.value_start = None
+    
+    def _emit_item(self, events: List[Tuple], end: int):
+        events.append(("item", self.key, json.loads(self.buffer[self.item_start:end])))
+        self.item_start = None
+    
+    def feed(self, chunk: str) -> List[Tuple[str, Optional[str], Any]]:
+        self.buffer += chunk
+        events = []
+        
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    end = self.pos + 1
+                    if len(self.stack) == 1:
+                        if self.expecting_key:
+                            self.key = json.loads(self.buffer[self.string_start:end])
+                        elif self.value_start == self.string_start:
+                            self._emit_field(events, end)
+                    elif self._in_top_array() and self.item_start == self.string_start:
+                        self._emit_item(events, end)
+                self.pos += 1
+                continue
+            
+            if ch in " \t\r\n":
+                pass
+            elif ch == '"':
+                self.in_string = True
+                self.string_start = self.pos
+                self._mark_start()
+            elif ch in "{[":
+                self._mark_start()
+                self.stack.append(ch)
+            elif ch in "}]":
+                # Scalars have no closing token; the container's end finishes them
+                if self._in_top_array() and self.item_start is not None:
+                    self._emit_item(events, self.pos)
+                elif len(self.stack) == 1 and self.value_start is not None:
+                    self._emit_field(events, self.pos)
+                
+                self.stack.pop()
+                end = self.pos + 1
+                if self._in_top_array() and self.item_start is not None:
+                    self._emit_item(events, end)
+                elif len(self.stack) == 1 and self.value_start is not None:
+                    self._emit_field(events, end)
+            elif ch == ":":
+                if len(self.stack) == 1:
+                    self.expecting_key = False
+            elif ch == ",":
+                if len(self.stack) == 1:
+                    if self.value_start is not None:
+                        self._emit_field(events, self.pos)
+                    self.expecting_key = True
+                elif self._in_top_array() and self.item_start is not None:
+                    self._emit_item(events, self.pos)
+            else:
+                self._mark_start()
+            
+            self.pos += 1
+        
+        return events
@@ -0,0 +1,186 @@
+"""
+Prompt Builder - Dense, size-budgeted prompts for the server assistant
+"""
+import json
+import math
+import re
+import config
+from typing import Any, Dict, List, Tuple
+
+AI_PROMPT_TOKEN_BUDGET = getattr(config, "AI_PROMPT_TOKEN_BUDGET", 1200)
+
+# Identical on every call and sent first, so the provider can reuse its cached prefix
+SYSTEM_PROMPT = """You are a friendly server assistant helping non-technical users.
+When analyzing server issues, provide:
+1. A brief summary in plain language
+2. Actionable recommendations with risk levels:
+   - GREEN: Safe to do, low risk, recommended
+   - YELLOW: Consider carefully, explain what could happen in simple terms
+   - RED: High risk, only if necessary, explain risks clearly
+3. Server upgrade suggestions if resources are consistently high
+
+Available actions you can reference (use action_id if it matches):
+- docker_cleanup: Clean up unused Docker images/containers (GREEN)
+- docker_cleanup_full: Deep Docker cleanup including volumes (YELLOW)
+- clear_temp: Clear temporary files (GREEN)
+- clear_logs: Clear old log files (GREEN)
+- clear_docker_logs: Clear Docker container logs (GREEN)
+- check_disk_usage: Analyze what's using disk space (GREEN)
+- list_large_files: Find large files (GREEN)
+- memory_report: Show memory usage report (GREEN)
+- restart_docker: Restart Docker service (RED)
+
+Server data arrives as compact JSON: percentages are rounded, sizes are in GB,
+processes are [command, cpu%, mem%] and containers are [name, image, status].
+
+Format your response as JSON with this structure:
+{
+  "summary": "Brief explanation in plain language",
+  "recommendations": [
+    {
+      "title": "What to do",
+      "description": "Simple explanation of what this does",
+      "risk": "GREEN|YELLOW|RED",
+      "considerations": "For YELLOW/RED: explain what to watch out for in simple terms",
+      "action_id": "action_id_if_applicable (e.g. docker_cleanup, clear_temp)",
+      "action": "Specific command or step (if no action_id)"
+    }
+  ],
+  "upgrade_suggestion": {
+    "needed": true/false,
+    "reason": "Why upgrade might help",
+    "current_specs": "What you have now",
+    "recommended": "What to consider upgrading to"
+  }
+}
+
+Always explain things in simple, non-technical language. Avoid jargon. Prefer using action_id when possible so users can click to execute."""
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough BPE token count without a tokenizer: words cost about one token per
+    four characters and every punctuation mark costs one, which matters for JSON.
+    """
+    return sum(
+        math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+        for piece in _TOKEN_PATTERN.findall(text)
+    )
+
+
+def _gb(value) -> float:
+    return round((value or 0) / 1024 ** 3, 1)
+
+
+def _strip_path(command: str) -> str:
+    """'/usr/bin/python3 app.py' -> 'python3 app.py', 'ghcr.io/org/web:1.2' -> 'web:1.2'"""
+    head, _, rest = command.partition(" ")
+    head = head.rsplit("/", 1)[-1]
+    return f"{head} {rest}" if rest else head
+
+
+def compact_server_data(server_data: Dict) -> Dict[str, Any]:
+    """Only the fields the assistant reasons about, rounded and in short positional form"""
+    metrics = server_data.get("metrics", {})
+    compact: Dict[str, Any] = {}
+    
+    if metrics.get("status") != "online":
+        compact["status"] = metrics.get("status", "unknown")
+        if metrics.get("error"):
+            compact["error"] = str(metrics["error"])[:200]
+    
+    cpu = metrics.get("cpu", {})
+    if cpu:
+        compact["cpu"] = {"pct": round(cpu.get("percent") or 0), "cores": cpu.get("cores"), "load": cpu.get("load_avg")}
+    for name in ("memory", "disk"):
+        section = metrics.get(name, {})
+        if section:
+            compact[name] = {
+                "pct": round(section.get("percent") or 0),
+                "used_gb": _gb(section.get("used")),
+                "total_gb": _gb(section.get("total"))
+            }
+    if metrics.get("uptime"):
+        compact["uptime"] = metrics["uptime"]
+    
+    processes = server_data.get("top_processes", [])
+    if processes:
+        compact["processes"] = [
+            [_strip_path(p.get("command", "")), round(p.get("cpu") or 0), round(p.get("mem") or 0)]
+            for p in processes
+        ]
+    
+    docker = server_data.get("docker", {})
+    if docker.get("total") or docker.get("containers"):
+        compact["docker"] = {
+            "running": docker.get("running", 0),
+            "total": docker.get("total", 0),
+            "containers": [
+                [c.get("name"), _strip_path(c.get("image") or ""), c.get("status")]
+                for c in docker.get("containers", [])
+            ]
+        }
+        # "Images: 1.2GB" lines from docker system df
+        usage = dict(
+            line.split(": ", 1) for line in docker.get("disk_usage", "").splitlines() if ": " in line
+        )
+        if usage:
+            compact["docker"]["disk"] = usage
+    
+    return compact
+
+
+def _dense(data: Dict) -> str:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def _user_prompt(question: str, compact: Dict) -> str:
+    return f"Server:{_dense(compact)}\nQuestion: {question}"
+
+
+def fit_to_budget(question: str, compact: Dict, budget: int) -> Tuple[str, bool]:
+    """
+    Render the user prompt, dropping the least important detail until it fits:
+    the longest of the container/process lists loses its last entry first, then
+    the Docker disk breakdown goes. Core metrics and the question are always kept.
+    """
+    prompt = _user_prompt(question, compact)
+    trimmed = False
+    
+    while estimate_tokens(prompt) > budget:
+        docker = compact.get("docker", {})
+        lists = [items for items in (docker.get("containers"), compact.get("processes")) if items]
+        if lists:
+            max(lists, key=len).pop()
+        elif "disk" in docker:
+            del docker["disk"]
+        else:
+            break
+        trimmed = True
+        prompt = _user_prompt(question, compact)
+    
+    return prompt, trimmed
+
+
+def build_messages(question: str, server_data: Dict, budget: int = AI_PROMPT_TOKEN_BUDGET) -> Tuple[List[Dict], Dict]:
+    """Chat messages for one analysis plus a report of how large the prompt is"""
+    user_prompt, trimmed = fit_to_budget(question, compact_server_data(server_data), budget)
+    
+    system_tokens = estimate_tokens(SYSTEM_PROMPT)
+    user_tokens = estimate_tokens(user_prompt)
+    stats = {
+        "system_tokens": system_tokens,
+        "user_tokens": user_tokens,
+        "estimated_tokens": system_tokens + user_tokens,
+        "chars": len(SYSTEM_PROMPT) + len(user_prompt),
+        "budget": budget,
+        "trimmed": trimmed
+    }
+    
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+    return messages, stats
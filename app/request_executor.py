@@ -0,0 +1,84 @@
+"""
+Request Executor - Run blocking SSH/subprocess work off the request thread under a deadline
+"""
+import threading
+import config
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Any, Callable, Dict, Hashable, Optional
+
+REQUEST_MAX_WORKERS = getattr(config, "REQUEST_MAX_WORKERS", 32)
+REQUEST_MAX_PENDING = getattr(config, "REQUEST_MAX_PENDING", 64)
+REQUEST_MAX_PER_SERVER = getattr(config, "REQUEST_MAX_PER_SERVER", 4)
+
+
+class DeadlineExceeded(Exception):
+    """The work did not finish within the request's deadline"""
+
+
+class ExecutorSaturated(Exception):
+    """Too much work is already queued, either overall or for one server"""
+
+
+class RequestExecutor:
+    """
+    A bounded thread pool shared by all requests. A request waits at most its
+    deadline; on expiry the caller's on_timeout hook runs (typically cancelling
+    that work's own channels so the stuck worker unblocks) and DeadlineExceeded is raised.
+    Work for a single server is capped so a few hung hosts cannot take every
+    worker, and submissions beyond the queue limit are refused immediately.
+    """
+    
+    def __init__(self, max_workers: int = REQUEST_MAX_WORKERS,
+                 max_pending: int = REQUEST_MAX_PENDING,
+                 max_per_key: int = REQUEST_MAX_PER_SERVER):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="request")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self.max_per_key = max_per_key
+        self._per_key: Dict[Hashable, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self.timeouts = 0
+        self.rejected = 0
+    
+    def _key_slots(self, key: Hashable) -> threading.BoundedSemaphore:
+        with self._lock:
+            slots = self._per_key.get(key)
+            if slots is None:
+                slots = self._per_key[key] = threading.BoundedSemaphore(self.max_per_key)
+            return slots
+    
+    def run(self, fn: Callable[..., Any], *args, key: Hashable = None, timeout: float = 30,
+            on_timeout: Optional[Callable[[], None]] = None, **kwargs) -> Any:
+        """Call fn(*args, **kwargs) on the pool and return its result, or raise after timeout seconds"""
+        key_slots = self._key_slots(key) if key is not None else None
+        if key_slots is not None and not key_slots.acquire(blocking=False):
+            self.rejected += 1
+            raise ExecutorSaturated(f"Too many requests in progress for {key}")
+        if not self._slots.acquire(blocking=False):
+            if key_slots is not None:
+                key_slots.release()
+            self.rejected += 1
+            raise ExecutorSaturated("Server is busy, try again shortly")
+        
+        def release(_future):
+            self._slots.release()
+            if key_slots is not None:
+                key_slots.release()
+        
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            release(None)
+            raise
+        # Slots are held until the work really ends, not when the caller gives up
+        future.add_done_callback(release)
+        
+        try:
+            return future.result(timeout=timeout)
+        except FuturesTimeout:
+            self.timeouts += 1
+            if not future.cancel() and on_timeout is not None:
+                on_timeout()
+            raise DeadlineExceeded(f"No result within {timeout:g}s")
+    
+    def stats(self) -> Dict:
+        return {"timeouts": self.timeouts, "rejected": self.rejected}
@@ -1,18 +1,119 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, Response, render_template, jsonify, request
 from app.collectors.ssh_collector import SSHCollector
 from app.collectors.docker_collector import DockerCollector
 from app.collectors.detailed_analyzer import DetailedAnalyzer
 from app.ai_assistant import ServerAssistant
 from app.actions import ServerActions
+from app.cache import TTLCache
+from app.collectors.cancellation import CancelScope
+from app.collectors.single_flight import collector_flights
 from app.database import Database
+from app.jobs import JobManager, job_event_stream
+from app.downsample import downsample_history, lttb_indices
+from app.stream import metrics_event_stream, sse_event
+from app.wire_format import to_columnar, compress_response
+from app.request_executor import RequestExecutor, DeadlineExceeded, ExecutorSaturated
+from app.scheduler import (
+    SnapshotStore, MetricsScheduler, FLEET_HOST_TIMEOUT, SNAPSHOT_MAX_AGE, DIR_INDEX_INTERVAL, LARGE_FILE_INTERVAL
+)
+from app.collectors.dir_index import DIR_INDEX_ROOTS, format_entries
+from app.collectors.file_index import diff_files, format_files
 from config import SERVERS
+import config
+import json
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 main_bp = Blueprint('main', __name__)
 api_bp = Blueprint('api', __name__)
 
 db = Database()
 ai_assistant = ServerAssistant()
+snapshots = SnapshotStore()
+metrics_scheduler = MetricsScheduler(SERVERS, db, snapshots)
+
+# Server state handed to the AI, and its answers keyed by a fingerprint of that state
+ai_context_cache = TTLCache(ttl=getattr(config, "AI_CONTEXT_TTL", 30), max_entries=len(SERVERS) or 1)
+ai_recommendation_cache = TTLCache(
+    ttl=getattr(config, "AI_CACHE_TTL", 600),
+    max_entries=getattr(config, "AI_CACHE_MAX_ENTRIES", 256)
+)
+
+# Results of the expensive read endpoints, keyed by (server_id, endpoint, params). Past its
+# TTL an entry is still served for the stale window while one background refresh replaces it
+RESULT_CACHE_TTLS = getattr(config, "RESULT_CACHE_TTLS", {
+    "analyze": 300, "docker": 15, "processes": 5, "suggestions": 30
+})
+RESULT_CACHE_STALE = getattr(config, "RESULT_CACHE_STALE", {
+    "analyze": 1800, "docker": 120, "processes": 30, "suggestions": 300
+})
+result_cache = TTLCache(
+    ttl=30,
+    max_entries=getattr(config, "RESULT_CACHE_MAX_ENTRIES", 512),
+    executor=ThreadPoolExecutor(max_workers=getattr(config, "RESULT_CACHE_REFRESH_WORKERS", 4),
+                                thread_name_prefix="cache-refresh")
+)
+
+def forget_server_state(job):
+    """An action may have changed its server, so cached reads of that server are dropped"""
+    result_cache.invalidate_where(lambda key: key[0] == job.server_id)
+    ai_context_cache.invalidate(job.server_id)
+
+job_manager = JobManager(SERVERS, on_finish=forget_server_state)
+
+# Upper bound in seconds on how long each endpoint may block; ?timeout=N can only shorten it
+REQUEST_DEADLINES = getattr(config, "REQUEST_DEADLINES", {
+    "metrics": 20, "docker": 20, "analyze": 120, "chat": 90, "actions": 300
+})
+request_executor = RequestExecutor()
+
+def run_blocking(server_id: str, endpoint: str, fn, cancel: bool = True, timeout: float = None):
+    """
+    Run a blocking collector call on the shared executor under the endpoint's deadline.
+    With cancel, a timeout closes the channels and kills the local processes this
+    call opened, so its worker is freed; the host's pooled SSH session and other
+    work on it are left alone. Without an explicit timeout the request's ?timeout
+    applies, so pass one when calling outside a request.
+    """
+    limit = REQUEST_DEADLINES.get(endpoint, 30)
+    if timeout is None:
+        timeout = min(request.args.get('timeout', limit, type=float), limit)
+    scope = CancelScope()
+    return request_executor.run(scope.run, fn, key=server_id, timeout=timeout,
+                                on_timeout=scope.cancel if cancel else None)
+
+def cached_blocking(server_id: str, endpoint: str, name: str, fn, *params, cacheable=lambda value: True):
+    """
+    run_blocking through result_cache under (server_id, name, *params). A stale
+    entry is answered at once and refreshed in the background under the
+    endpoint's full deadline. ?fresh=1 skips the cache for this request.
+    """
+    key = (server_id, name) + params
+    if request.args.get('fresh'):
+        result_cache.invalidate(key)
+    
+    value, _ = result_cache.get_or_compute(
+        key,
+        lambda: run_blocking(server_id, endpoint, fn),
+        cacheable,
+        ttl=RESULT_CACHE_TTLS.get(name),
+        stale_ttl=RESULT_CACHE_STALE.get(name),
+        refresh=lambda: run_blocking(server_id, endpoint, fn, timeout=REQUEST_DEADLINES.get(endpoint, 30))
+    )
+    return value
+
+@api_bp.errorhandler(DeadlineExceeded)
+def deadline_exceeded(e):
+    return jsonify({"error": str(e)}), 504
+
+@api_bp.errorhandler(ExecutorSaturated)
+def executor_saturated(e):
+    return jsonify({"error": str(e)}), 503
+
+@api_bp.after_request
+def compress(response):
+    return compress_response(response, request.headers.get('Accept-Encoding', ''))
 
 @main_bp.route('/')
 def dashboard():
@@ -30,29 +131,79 @@ def get_metrics(server_id):
     if server_id not in SERVERS:
         return jsonify({"error": "Server not found"}), 404
     
-    server = SERVERS[server_id]
-    collector = SSHCollector(server)
-    metrics = collector.collect_all()
-    
-    if metrics.get("status") == "online":
-        db.save_metrics(
-            server_id,
-            metrics.get("cpu", {}).get("percent", 0),
-            metrics.get("memory", {}).get("percent", 0),
-            metrics.get("disk", {}).get("percent", 0)
-        )
+    # Serve the background collector's snapshot unless a live reading is requested
+    metrics = None if request.args.get('fresh') else snapshots.get(server_id, SNAPSHOT_MAX_AGE)
+    if metrics is None:
+        metrics = run_blocking(server_id, "metrics", lambda: metrics_scheduler.collect(server_id))
     
     return jsonify(metrics)
 
+@api_bp.route('/stream/<server_id>')
+def stream_metrics(server_id):
+    if server_id not in SERVERS:
+        return jsonify({"error": "Server not found"}), 404
+    
+    if snapshots.get(server_id, SNAPSHOT_MAX_AGE) is None:
+        metrics_scheduler.refresh(server_id)
+    
+    return Response(
+        metrics_event_stream(snapshots, server_id),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_bp.route('/fleet/metrics')
+def fleet_metrics():
+    """
+    Metrics for every server at once, collected in parallel.
+    ?fresh=1 ignores snapshots, ?timeout=N bounds each host, ?stream=1 returns
+    newline-delimited JSON as each host answers.
+    """
+    timeout = request.args.get('timeout', FLEET_HOST_TIMEOUT, type=float)
+    fresh = request.args.get('fresh')
+    
+    cached = {}
+    pending = []
+    for server_id in SERVERS:
+        snapshot = None if fresh else snapshots.get(server_id, SNAPSHOT_MAX_AGE)
+        if snapshot is None:
+            pending.append(server_id)
+        else:
+            cached[server_id] = snapshot
+    
+    if request.args.get('stream'):
+        def generate():
+            for server_id, metrics in cached.items():
+                yield json.dumps({"server_id": server_id, "metrics": metrics}) + "\n"
+            for server_id, metrics in metrics_scheduler.collect_many(pending, timeout):
+                yield json.dumps({"server_id": server_id, "metrics": metrics}) + "\n"
+        return Response(generate(), mimetype='application/x-ndjson')
+    
+    started = time.monotonic()
+    results = dict(cached)
+    for server_id, metrics in metrics_scheduler.collect_many(pending, timeout):
+        results[server_id] = metrics
+    
+    return jsonify({
+        "servers": results,
+        "elapsed": round(time.monotonic() - started, 3)
+    })
+
 @api_bp.route('/processes/<server_id>')
 def get_processes(server_id):
     if server_id not in SERVERS:
         return jsonify({"error": "Server not found"}), 404
     
+    sort = request.args.get('sort', 'memory')
+    if sort not in ('memory', 'cpu'):
+        return jsonify({"error": "sort must be 'memory' or 'cpu'"}), 400
+    limit = min(max(request.args.get('limit', 15, type=int), 1), 100)
+    
     server = SERVERS[server_id]
     collector = SSHCollector(server)
-    processes = collector.get_processes()
-    return jsonify({"processes": processes})
+    processes = cached_blocking(server_id, "metrics", "processes", lambda: collector.get_processes(limit, sort),
+                                limit, sort, cacheable=bool)
+    return jsonify({"processes": processes, "sort": sort})
 
 @api_bp.route('/docker/<server_id>')
 def get_docker(server_id):
@@ -61,25 +212,203 @@ def get_docker(server_id):
     
     server = SERVERS[server_id]
     collector = DockerCollector(server)
-    docker_info = collector.get_containers()
+    docker_info = cached_blocking(server_id, "docker", "docker", collector.get_containers,
+                                  cacheable=lambda info: "error" not in info)
     return jsonify(docker_info)
 
 @api_bp.route('/history/<server_id>')
 def get_history(server_id):
     hours = request.args.get('hours', 24, type=int)
-    history = db.get_history(server_id, hours)
-    return jsonify({"history": history})
+    tier = request.args.get('tier') or db.select_tier(hours)
+    if tier not in ("raw", "1m", "1h", "1d"):
+        return jsonify({"error": f"Unknown tier: {tier}"}), 400
+    
+    max_points = request.args.get('max_points', type=int)
+    
+    if request.args.get('format') == 'columnar':
+        columns = db.get_history_columns(server_id, hours, tier)
+        if max_points and max_points > 2 and len(columns["ts"]) > max_points:
+            keep = lttb_indices(columns["ts"], [columns["cpu"], columns["memory"], columns["disk"]], max_points)
+            columns = {name: [values[i] for i in keep] for name, values in columns.items()}
+        
+        payload = to_columnar(columns, binary=request.args.get('encoding') == 'binary')
+        payload["tier"] = tier
+        return jsonify(payload)
+    
+    history = db.get_history(server_id, hours, tier)
+    
+    # Shape-preserving reduction to roughly one point per chart pixel
+    if max_points and max_points > 2:
+        history = downsample_history(history, max_points)
+    
+    return jsonify({"history": history, "tier": tier})
+
+@api_bp.route('/history/<server_id>/containers')
+def get_container_history(server_id):
+    """Per-container series; ?metric=cpu|memory|memory_percent ranks by peak, ?top=N keeps the highest N"""
+    if server_id not in SERVERS:
+        return jsonify({"error": "Server not found"}), 404
+    
+    hours = request.args.get('hours', 24, type=float)
+    metric = request.args.get('metric', 'memory')
+    top = request.args.get('top', 5, type=int)
+    
+    try:
+        containers = db.get_container_history(server_id, hours, metric, top)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"containers": containers, "metric": metric})
 
 @api_bp.route('/analyze/<server_id>')
 def deep_analyze(server_id):
+    """
+    Deep analysis. With ?stream=1 (or Accept: text/event-stream) each section is
+    sent as a 'section' event the moment its probe finishes, then 'done'.
+    """
     if server_id not in SERVERS:
         return jsonify({"error": "Server not found"}), 404
     
     server = SERVERS[server_id]
     analyzer = DetailedAnalyzer(server)
-    analysis = analyzer.analyze()
+    
+    def cacheable(analysis):
+        return "errors" not in analysis
+    
+    if request.args.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+        key = (server_id, "analyze")
+        cached = None if request.args.get('fresh') else result_cache.get(key)
+        
+        def generate():
+            # Index-backed sections are instant; shell probes follow in completion order
+            for name, section in index_sections(server_id).items():
+                yield sse_event("section", dict(section, name=name))
+            
+            if cached is not None:
+                for name, output in cached.items():
+                    yield sse_event("section", {"name": name, "output": output, "status": "ok", "cached": True})
+            else:
+                results = []
+                for name, result in analyzer.run_probes():
+                    results.append((name, result))
+                    yield sse_event("section", dict(result, name=name))
+                analysis = DetailedAnalyzer.combine(results)
+                if cacheable(analysis):
+                    result_cache.set(key, analysis, RESULT_CACHE_TTLS.get("analyze"), RESULT_CACHE_STALE.get("analyze"))
+            yield sse_event("done", {})
+        
+        return Response(generate(), mimetype='text/event-stream',
+                         headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    analysis = dict(cached_blocking(server_id, "analyze", "analyze", analyzer.analyze, cacheable=cacheable))
+    sections = index_sections(server_id)
+    analysis["disk_by_directory"] = sections["disk_by_directory"]["output"]
+    analysis["directories"] = sections["disk_by_directory"]["data"]
+    analysis["large_files"] = sections["large_files"]["output"]
+    analysis["large_file_scan"] = sections["large_files"]["data"]
     return jsonify(analysis)
 
+def index_sections(server_id: str) -> dict:
+    """The analysis sections answered from the directory and large-file indexes"""
+    directories = directory_report(server_id)
+    if directories["entries"]:
+        age = int((time.time() - directories["scanned_at"]) / 60)
+        disk_by_directory = f"{format_entries(directories['entries'])}\n\nLast scanned {age} min ago"
+    elif directories["error"]:
+        disk_by_directory = f"Directory scan failed: {directories['error']}"
+    else:
+        disk_by_directory = "Directory sizes are being indexed, check back shortly"
+    
+    large_files = large_file_report(server_id, top=10)
+    if large_files["files"]:
+        age = int((time.time() - large_files["scanned_at"]) / 60)
+        large_files_text = f"{format_files(large_files['files'])}\n\nLast scanned {age} min ago"
+    elif large_files["scan"]:
+        large_files_text = ""
+    else:
+        large_files_text = "Large files are being indexed, check back shortly"
+    
+    return {
+        "disk_by_directory": {"output": disk_by_directory, "status": "ok", "data": directories},
+        "large_files": {"output": large_files_text, "status": "ok", "data": large_files}
+    }
+
+def directory_report(server_id: str, path: str = None, top: int = 15) -> dict:
+    """Largest directories from the stored index; starts a background rescan when it is missing or stale"""
+    scan = db.get_dir_scan(server_id)
+    if scan is None or (DIR_INDEX_INTERVAL and time.time() - scan["scanned_at"] > DIR_INDEX_INTERVAL):
+        metrics_scheduler.index_directories_async(server_id)
+    
+    roots = (scan or {}).get("roots") or SERVERS[server_id].get("dir_index_roots", DIR_INDEX_ROOTS)
+    return {
+        "path": path,
+        "entries": db.get_dir_children(server_id, [path] if path else roots, top) if scan else [],
+        "scanned_at": scan["scanned_at"] if scan else None,
+        "scan": scan,
+        "scanning": metrics_scheduler.is_indexing(server_id),
+        "error": metrics_scheduler.index_error(server_id)
+    }
+
+def large_file_report(server_id: str, top: int = 50, since_hours: float = None) -> dict:
+    """Largest files from the newest stored scan, optionally diffed against the scan from since_hours ago"""
+    scan = db.get_large_file_scan(server_id)
+    if scan is None or (LARGE_FILE_INTERVAL and time.time() - scan["scanned_at"] > LARGE_FILE_INTERVAL):
+        metrics_scheduler.index_directories_async(server_id, files=True)
+    
+    report = {
+        "files": db.get_large_files(scan["id"], top) if scan else [],
+        "scanned_at": scan["scanned_at"] if scan else None,
+        "scan": scan,
+        "scanning": metrics_scheduler.is_indexing(server_id),
+        "error": metrics_scheduler.index_error(server_id)
+    }
+    if scan and since_hours:
+        baseline = db.get_large_file_scan(server_id, before=time.time() - since_hours * 3600)
+        report["baseline"] = baseline
+        report["changes"] = diff_files(db.get_large_files(baseline["id"]), db.get_large_files(scan["id"])) \
+            if baseline and baseline["id"] != scan["id"] else None
+    return report
+
+@api_bp.route('/analyze/<server_id>/large-files', methods=['GET', 'POST'])
+def analyze_large_files(server_id):
+    """GET: largest files from the last scan, with ?since_hours=N changes since then. POST: rescan now"""
+    if server_id not in SERVERS:
+        return jsonify({"error": "Server not found"}), 404
+    
+    if request.method == 'POST':
+        metrics_scheduler.index_directories_async(server_id, files=True)
+        return jsonify({"scanning": True}), 202
+    
+    top = min(max(request.args.get('top', 50, type=int), 1), 1000)
+    return jsonify(large_file_report(server_id, top, request.args.get('since_hours', type=float)))
+
+@api_bp.route('/analyze/<server_id>/directories', methods=['GET', 'POST'])
+def analyze_directories(server_id):
+    """GET: children of ?path (default: the scan roots) by size. POST: rescan now (?full=1 re-measures everything)"""
+    if server_id not in SERVERS:
+        return jsonify({"error": "Server not found"}), 404
+    
+    if request.method == 'POST':
+        metrics_scheduler.index_directories_async(server_id, full=request.args.get('full') == '1')
+        return jsonify({"scanning": True}), 202
+    
+    path = request.args.get('path') or None
+    if path and path != '/':
+        path = path.rstrip('/')
+    top = min(max(request.args.get('top', 15, type=int), 1), 500)
+    return jsonify(directory_report(server_id, path, top))
+
+def collect_ai_context(server_id: str) -> dict:
+    """Metrics from the background snapshot when available, plus processes and containers"""
+    server = SERVERS[server_id]
+    metrics = snapshots.get(server_id, SNAPSHOT_MAX_AGE) or metrics_scheduler.collect(server_id)
+    
+    return {
+        "metrics": {key: value for key, value in metrics.items() if key != "collected_at"},
+        "top_processes": SSHCollector(server).get_processes()[:5],
+        "docker": DockerCollector(server).get_containers()
+    }
+
 @api_bp.route('/chat/<server_id>', methods=['POST'])
 def chat(server_id):
     if server_id not in SERVERS:
@@ -91,28 +420,73 @@ def chat(server_id):
     if not question:
         return jsonify({"error": "No question provided"}), 400
     
-    server = SERVERS[server_id]
+    def cacheable(result):
+        return not str(result.get("summary", "")).startswith("⚠️")
     
     try:
-        collector = SSHCollector(server)
-        metrics = collector.collect_all()
-        processes = collector.get_processes()
+        server_data, _ = run_blocking(
+            server_id, "chat",
+            lambda: ai_context_cache.get_or_compute(server_id, lambda: collect_ai_context(server_id))
+        )
+        key = ai_assistant.fingerprint(question, server_data)
         
-        docker_collector = DockerCollector(server)
-        docker_info = docker_collector.get_containers()
+        if request.args.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            def generate():
+                cached = ai_recommendation_cache.get(key)
+                if cached is not None:
+                    events = ai_assistant.response_events(cached)
+                else:
+                    events = ai_assistant.analyze_stream(question, server_data)
+                
+                for event in events:
+                    if event["type"] == "done":
+                        event["cached"] = cached is not None
+                        if cached is None and cacheable(event["response"]):
+                            ai_recommendation_cache.set(key, event["response"])
+                    yield sse_event(event["type"], event)
+            
+            return Response(
+                generate(),
+                mimetype='text/event-stream',
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         
-        server_data = {
-            "metrics": metrics,
-            "top_processes": processes[:5],
-            "docker": docker_info
-        }
-        
-        response = ai_assistant.analyze(question, server_data)
-        return jsonify({"response": response})
+        # Stable servers asking the same question reuse the last answer; concurrent
+        # identical requests share one LLM call. Error summaries are not cached.
+        response, cached = run_blocking(server_id, "chat", lambda: ai_recommendation_cache.get_or_compute(
+            key,
+            lambda: ai_assistant.analyze(question, server_data),
+            cacheable=cacheable
+        ), cancel=False)
+        return jsonify({"response": response, "cached": cached})
+    except (DeadlineExceeded, ExecutorSaturated):
+        raise
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+def build_suggestions(server: dict) -> dict:
+    metrics = SSHCollector(server).collect_all()
+    
+    actions = ServerActions(server)
+    suggestions = actions.get_suggestions(metrics)
+    
+    for suggestion in suggestions:
+        suggestion["action_details"] = [
+            ServerActions.get_action_info(action_id)
+            for action_id in suggestion.get("actions", [])
+        ]
+    
+    return {
+        "suggestions": suggestions,
+        "status": metrics.get("status"),
+        "metrics_summary": {
+            "cpu": metrics.get("cpu", {}).get("percent", 0),
+            "memory": metrics.get("memory", {}).get("percent", 0),
+            "disk": metrics.get("disk", {}).get("percent", 0)
+        }
+    }
+
 @api_bp.route('/suggestions/<server_id>')
 def get_suggestions(server_id):
     if server_id not in SERVERS:
@@ -121,52 +495,129 @@ def get_suggestions(server_id):
     server = SERVERS[server_id]
     
     try:
-        collector = SSHCollector(server)
-        metrics = collector.collect_all()
-        
-        actions = ServerActions(server)
-        suggestions = actions.get_suggestions(metrics)
-        
-        for suggestion in suggestions:
-            suggestion["action_details"] = [
-                ServerActions.get_action_info(action_id)
-                for action_id in suggestion.get("actions", [])
-            ]
-        
-        return jsonify({
-            "suggestions": suggestions,
-            "metrics_summary": {
-                "cpu": metrics.get("cpu", {}).get("percent", 0),
-                "memory": metrics.get("memory", {}).get("percent", 0),
-                "disk": metrics.get("disk", {}).get("percent", 0)
-            }
-        })
+        return jsonify(cached_blocking(server_id, "metrics", "suggestions", lambda: build_suggestions(server),
+                                       cacheable=lambda payload: payload["status"] == "online"))
+    except (DeadlineExceeded, ExecutorSaturated):
+        raise
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e), "suggestions": []}), 500
 
+@api_bp.route('/cache/stats')
+def cache_stats():
+    return jsonify({
+        "results": result_cache.stats(),
+        "ai_context": ai_context_cache.stats(),
+        "ai_recommendations": ai_recommendation_cache.stats(),
+        "collections": collector_flights.stats()
+    })
+
 @api_bp.route('/actions')
 def list_actions():
     return jsonify({"actions": ServerActions.get_all_actions()})
 
 @api_bp.route('/actions/<server_id>/<action_id>', methods=['POST'])
 def execute_action(server_id, action_id):
+    """
+    Queue an action and return its job right away (202). Follow the output at
+    /api/jobs/<job_id>. ?wait=1 waits up to the actions deadline and includes the
+    output when the job has finished by then.
+    """
     if server_id not in SERVERS:
         return jsonify({"error": "Server not found"}), 404
     
-    server = SERVERS[server_id]
-    actions = ServerActions(server)
-    
     action_info = ServerActions.get_action_info(action_id)
     if not action_info:
         return jsonify({"error": f"Unknown action: {action_id}"}), 404
     
-    try:
-        result = actions.execute_action(action_id)
-        return jsonify(result)
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"success": False, "error": str(e)}), 500
+    job = job_manager.submit(server_id, action_id)
+    
+    if request.args.get('wait') and job.join(REQUEST_DEADLINES.get("actions", 300)):
+        lines, _, _ = job.read()
+        return jsonify({**job.to_dict(), "output": "\n".join(lines)})
+    
+    return jsonify(job.to_dict()), 202
+
+def is_positive_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
 
+@api_bp.route('/fleet/actions/<action_id>', methods=['POST'])
+def execute_fleet_action(action_id):
+    """
+    Run one action across several servers. JSON body (all optional):
+    servers (default every server), concurrency, batch_size, and max_failures
+    (stop starting new hosts after this many fail; null never stops).
+    Returns the run right away (202). ?wait=1 waits up to the actions deadline.
+    """
+    if not ServerActions.get_action_info(action_id):
+        return jsonify({"error": f"Unknown action: {action_id}"}), 404
+    
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+    server_ids = data.get("servers") or list(SERVERS)
+    if not isinstance(server_ids, list) or not all(isinstance(server_id, str) for server_id in server_ids):
+        return jsonify({"error": "servers must be a list of server ids"}), 400
+    unknown = [server_id for server_id in server_ids if server_id not in SERVERS]
+    if unknown:
+        return jsonify({"error": f"Unknown servers: {', '.join(unknown)}"}), 404
+    
+    options = {key: data[key] for key in ("concurrency", "batch_size", "max_failures") if key in data}
+    for key, value in options.items():
+        nullable = key in ("batch_size", "max_failures")
+        if not (is_positive_int(value) or (nullable and value is None)):
+            allowed = "a positive integer or null" if nullable else "a positive integer"
+            return jsonify({"error": f"{key} must be {allowed}"}), 400
+    run = job_manager.submit_fleet(action_id, list(dict.fromkeys(server_ids)), **options)
+    
+    if request.args.get('wait') and run.join(REQUEST_DEADLINES.get("actions", 300)):
+        return jsonify(run.to_dict())
+    return jsonify(run.to_dict()), 202
+
+@api_bp.route('/fleet/runs/<run_id>')
+def get_fleet_run(run_id):
+    run = job_manager.get_fleet_run(run_id)
+    if run is None:
+        return jsonify({"error": "Run not found"}), 404
+    return jsonify(run.to_dict())
+
+@api_bp.route('/jobs')
+def list_jobs():
+    server_id = request.args.get('server_id')
+    return jsonify({"jobs": [job.to_dict() for job in job_manager.list(server_id)]})
+
+@api_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Stop a running or queued job; the job fails with error 'Cancelled' once its command is killed"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.finished:
+        return jsonify({**job.to_dict(), "error": "Job has already finished"}), 409
+    
+    job_manager.cancel(job_id)
+    return jsonify(job.to_dict()), 202
+
+@api_bp.route('/jobs/<job_id>')
+def get_job(job_id):
+    """
+    A job's status and output. ?since=N returns lines from number N on,
+    ?tail=N the last N lines, and ?follow=1 streams new lines as server-sent events.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    since = request.args.get('since', 0, type=int)
+    if request.args.get('follow'):
+        return Response(
+            job_event_stream(job, since),
+            mimetype='text/event-stream',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    tail = request.args.get('tail', type=int)
+    lines, next_line, dropped = job.tail(tail) if tail is not None else job.read(since)
+    return jsonify({**job.to_dict(), "output": lines, "next": next_line, "dropped": dropped})
 
 
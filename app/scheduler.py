@@ -0,0 +1,348 @@
+"""
+Background Collection - Poll every server on a schedule and keep the latest snapshot in memory
+"""
+import os
+import queue
+import threading
+import time
+import config
+from concurrent.futures import ThreadPoolExecutor as FanOutPool, as_completed, TimeoutError as FuturesTimeout
+from datetime import datetime, timedelta
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:  # Windows: no lock, every process polls
+    fcntl = None
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+from app.cache import SingleFlight
+from app.collectors.cancellation import raise_if_cancelled
+from app.collectors.single_flight import coalesce
+from app.collectors.ssh_collector import SSHCollector
+from app.collectors.docker_collector import DockerCollector
+from app.collectors.detailed_analyzer import DetailedAnalyzer
+
+METRICS_POLL_INTERVAL = getattr(config, "METRICS_POLL_INTERVAL", 30)
+METRICS_POLL_JITTER = getattr(config, "METRICS_POLL_JITTER", 5)
+METRICS_POLL_WORKERS = getattr(config, "METRICS_POLL_WORKERS", 8)
+FLEET_MAX_WORKERS = getattr(config, "FLEET_MAX_WORKERS", 16)
+FLEET_HOST_TIMEOUT = getattr(config, "FLEET_HOST_TIMEOUT", 20)
+CONTAINER_COLLECTION = getattr(config, "CONTAINER_COLLECTION", True)
+DIR_INDEX_INTERVAL = getattr(config, "DIR_INDEX_INTERVAL", 3600)
+DIR_INDEX_WORKERS = getattr(config, "DIR_INDEX_WORKERS", 2)
+LARGE_FILE_INTERVAL = getattr(config, "LARGE_FILE_INTERVAL", 21600)
+# Only the process holding this lock polls and records samples (None = every process does)
+SCHEDULER_LOCK_FILE = getattr(
+    config, "SCHEDULER_LOCK_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'scheduler.lock')
+)
+# Older snapshots are recollected on request, e.g. in a process that is not polling
+SNAPSHOT_MAX_AGE = getattr(config, "SNAPSHOT_MAX_AGE", 2 * METRICS_POLL_INTERVAL + METRICS_POLL_JITTER)
+
+
+class SnapshotStore:
+    """Thread-safe latest-value store, one entry per server, with change subscriptions"""
+    
+    SUBSCRIBER_QUEUE_SIZE = 8
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, Dict] = {}
+        self._subscribers: Dict[str, Set[queue.Queue]] = {}
+    
+    def put(self, server_id: str, data: Dict):
+        snapshot = dict(data)
+        snapshot["collected_at"] = time.time()
+        with self._lock:
+            self._snapshots[server_id] = snapshot
+            subscribers = list(self._subscribers.get(server_id, ()))
+        
+        for subscriber in subscribers:
+            # Slow consumers only need the newest state, so drop what they have not read
+            while True:
+                try:
+                    subscriber.put_nowait(snapshot)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+    
+    def subscribe(self, server_id: str) -> queue.Queue:
+        """Queue that receives every new snapshot for the server"""
+        subscriber = queue.Queue(maxsize=self.SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(server_id, set()).add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, server_id: str, subscriber: queue.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(server_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[server_id]
+    
+    def subscriber_count(self, server_id: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(server_id, ()))
+    
+    def get(self, server_id: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        """The latest snapshot, or None when there is none or it is older than max_age seconds"""
+        with self._lock:
+            snapshot = self._snapshots.get(server_id)
+        if snapshot is not None and max_age is not None and time.time() - snapshot["collected_at"] > max_age:
+            return None
+        return snapshot
+    
+    def all(self) -> Dict[str, Dict]:
+        with self._lock:
+            return dict(self._snapshots)
+
+
+class MetricsScheduler:
+    """
+    Collect metrics for every server in the background, independent of HTTP traffic.
+    
+    Under a multi-process server (gunicorn -w N) each worker starts a scheduler, but
+    only the one holding SCHEDULER_LOCK_FILE polls every host, records samples and
+    indexes disks. The others record nothing: they collect only servers someone is
+    streaming from them, collect on request when their snapshot is stale, and take
+    over polling if the lock holder exits.
+    """
+    
+    def __init__(self, servers: Dict, db, snapshots: SnapshotStore,
+                 interval: int = METRICS_POLL_INTERVAL,
+                 jitter: int = METRICS_POLL_JITTER,
+                 max_workers: int = METRICS_POLL_WORKERS):
+        self.servers = servers
+        self.db = db
+        self.snapshots = snapshots
+        self.interval = interval
+        self.jitter = jitter
+        self.max_workers = max_workers
+        self._scheduler = None
+        self._start_lock = threading.Lock()
+        self._fan_out = FanOutPool(max_workers=FLEET_MAX_WORKERS, thread_name_prefix="fleet")
+        # Disk scans are long and few; they get their own pool so they never delay polling
+        self._scans = FanOutPool(max_workers=DIR_INDEX_WORKERS, thread_name_prefix="dirscan")
+        self._scanning: Set[str] = set()
+        self._scan_errors: Dict[str, str] = {}
+        self._scan_lock = threading.Lock()
+        self._collections = SingleFlight()
+        self._lock_file = None
+        self.polling = False
+        # Cleared in processes that are not polling, so only the poller writes samples
+        self.records = True
+    
+    def collect(self, server_id: str) -> Dict:
+        """
+        Collect one server now, update its snapshot and record the sample. Calls
+        for a server that is already being collected wait for that collection
+        instead, so one collection records exactly one sample.
+        """
+        return coalesce(self._collections, server_id, lambda: self._collect(server_id))
+    
+    def _collect(self, server_id: str) -> Dict:
+        metrics = SSHCollector(self.servers[server_id]).collect_all()
+        # Cut short for a caller that gave up: neither a snapshot nor a sample
+        raise_if_cancelled()
+        self.snapshots.put(server_id, metrics)
+        
+        if self.records and metrics.get("status") == "online":
+            self.db.save_metrics_many([(
+                server_id,
+                metrics.get("cpu", {}).get("percent", 0),
+                metrics.get("memory", {}).get("percent", 0),
+                metrics.get("disk", {}).get("percent", 0)
+            )])
+        
+        return self.snapshots.get(server_id)
+    
+    def collect_many(self, server_ids: Iterable[str], timeout: float = FLEET_HOST_TIMEOUT) -> Iterator[Tuple[str, Dict]]:
+        """
+        Collect several servers in parallel, yielding (server_id, metrics) as each finishes.
+        Hosts still running after the timeout are reported as such and left to finish
+        in the background, where they still refresh their snapshot.
+        """
+        futures = {self._fan_out.submit(self.collect, server_id): server_id for server_id in server_ids}
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                server_id = futures[future]
+                try:
+                    yield server_id, future.result()
+                except Exception as e:
+                    yield server_id, {"status": "offline", "error": str(e)}
+        except FuturesTimeout:
+            for future, server_id in futures.items():
+                if not future.done():
+                    future.cancel()
+                    yield server_id, {"status": "timeout", "error": f"No response within {timeout}s"}
+    
+    def refresh(self, server_id: str):
+        """Collect a server in the background; subscribers see the result when it lands"""
+        self._fan_out.submit(self._collect_safely, server_id)
+    
+    def _collect_safely(self, server_id: str):
+        try:
+            self.collect(server_id)
+        except Exception as e:
+            self.snapshots.put(server_id, {"status": "offline", "error": str(e)})
+    
+    def collect_containers(self, server_id: str) -> int:
+        """Record per-container stats for one server; returns the number of rows written"""
+        docker = DockerCollector(self.servers[server_id]).get_containers()
+        return self.db.save_container_samples(server_id, docker.get("containers", []))
+    
+    def _claim_scan(self, server_id: str) -> bool:
+        with self._scan_lock:
+            if server_id in self._scanning:
+                return False
+            self._scanning.add(server_id)
+            return True
+    
+    def _scan(self, server_id: str, full: bool, files: bool) -> Optional[Dict]:
+        """Directory index, then the large-file scan when it is due (or files is set)"""
+        analyzer = DetailedAnalyzer(self.servers[server_id])
+        errors = []
+        scan = None
+        try:
+            try:
+                scan = analyzer.refresh_directory_index(server_id, self.db, full)
+            except Exception as e:
+                errors.append(f"directories: {e}")
+            
+            last_files = self.db.get_large_file_scan(server_id)
+            if files or last_files is None or (
+                    LARGE_FILE_INTERVAL and time.time() - last_files["scanned_at"] > LARGE_FILE_INTERVAL):
+                try:
+                    analyzer.scan_large_files(server_id, self.db)
+                except Exception as e:
+                    errors.append(f"large files: {e}")
+            
+            if errors:
+                self._scan_errors[server_id] = "; ".join(errors)
+            else:
+                self._scan_errors.pop(server_id, None)
+            return scan
+        finally:
+            with self._scan_lock:
+                self._scanning.discard(server_id)
+    
+    def index_directories(self, server_id: str, full: bool = False, files: bool = False) -> Optional[Dict]:
+        """Refresh one server's disk indexes now; returns the directory scan summary, or None if a scan is already running"""
+        return self._scan(server_id, full, files) if self._claim_scan(server_id) else None
+    
+    def index_directories_async(self, server_id: str, full: bool = False, files: bool = False):
+        if self._claim_scan(server_id):
+            self._scans.submit(self._scan, server_id, full, files)
+    
+    def is_indexing(self, server_id: str) -> bool:
+        with self._scan_lock:
+            return server_id in self._scanning
+    
+    def index_error(self, server_id: str) -> Optional[str]:
+        return self._scan_errors.get(server_id)
+    
+    def _poll(self, server_id: str):
+        """Scheduled job: host metrics, then container stats while the host is reachable"""
+        self._collect_safely(server_id)
+        if CONTAINER_COLLECTION and (self.snapshots.get(server_id) or {}).get("status") == "online":
+            try:
+                self.collect_containers(server_id)
+            except Exception:
+                pass
+    
+    def start(self):
+        if self._scheduler:
+            return
+        with self._start_lock:
+            if self._scheduler:
+                return
+            self._start()
+    
+    def _start(self):
+        self._scheduler = BackgroundScheduler(
+            executors={"default": ThreadPoolExecutor(self.max_workers)},
+            job_defaults={"coalesce": True, "max_instances": 1}
+        )
+        
+        if self._acquire_lock():
+            self._add_polling_jobs()
+        else:
+            self.records = False
+            self._scheduler.add_job(
+                self._follow,
+                "interval",
+                id="follow",
+                seconds=self.interval,
+                jitter=self.jitter,
+                next_run_time=datetime.now()
+            )
+        
+        self._scheduler.start()
+    
+    def _acquire_lock(self) -> bool:
+        """Take the poller lock without waiting; it is held until this process exits"""
+        if SCHEDULER_LOCK_FILE is None or fcntl is None:
+            return True
+        try:
+            os.makedirs(os.path.dirname(SCHEDULER_LOCK_FILE), exist_ok=True)
+            lock_file = open(SCHEDULER_LOCK_FILE, "a+")
+        except OSError:
+            # Better every process polling than none
+            return True
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+    
+    def _follow(self):
+        """Scheduled job while another process polls: keep streamed servers live, take over if it has gone"""
+        if self._acquire_lock():
+            self._scheduler.remove_job("follow")
+            self.records = True
+            self._add_polling_jobs()
+            return
+        for server_id in self.servers:
+            if self.snapshots.subscriber_count(server_id):
+                self.refresh(server_id)
+    
+    def _add_polling_jobs(self):
+        self.polling = True
+        # Spread first runs across the interval so servers are not all polled at once
+        count = max(len(self.servers), 1)
+        for index, server_id in enumerate(self.servers):
+            offset = self.interval * index / count
+            self._scheduler.add_job(
+                self._poll,
+                "interval",
+                args=[server_id],
+                id=f"metrics:{server_id}",
+                seconds=self.interval,
+                jitter=self.jitter,
+                next_run_time=datetime.now() + timedelta(seconds=offset)
+            )
+            if DIR_INDEX_INTERVAL:
+                self._scheduler.add_job(
+                    self.index_directories_async,
+                    "interval",
+                    args=[server_id],
+                    id=f"dirindex:{server_id}",
+                    seconds=DIR_INDEX_INTERVAL,
+                    jitter=DIR_INDEX_INTERVAL // 10
+                )
+    
+    def shutdown(self):
+        if self._scheduler:
+            self._scheduler.shutdown(wait=False)
+            self._scheduler = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.polling = False
+
@@ -0,0 +1,63 @@
+"""
+Live Stream - Push metric snapshots to dashboards as server-sent events
+"""
+import json
+import queue
+import config
+from typing import Dict, Iterator
+
+STREAM_HEARTBEAT_INTERVAL = getattr(config, "STREAM_HEARTBEAT_INTERVAL", 15)
+
+
+def diff(old: Dict, new: Dict) -> Dict:
+    """Nested changes from old to new; keys that disappeared are sent as None"""
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff(previous, value)
+            if nested:
+                changes[key] = nested
+        elif value != previous or key not in old:
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes
+
+
+def sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def metrics_event_stream(snapshots, server_id: str, heartbeat: float = STREAM_HEARTBEAT_INTERVAL) -> Iterator[str]:
+    """
+    Server-sent events for one server: a full 'snapshot' first, then only 'delta'
+    events with changed fields. Every subscriber shares the background collector's
+    result, so viewers add no load on the monitored host. A 'heartbeat' keeps
+    proxies from closing idle connections.
+    """
+    subscriber = snapshots.subscribe(server_id)
+    try:
+        yield "retry: 5000\n\n"
+        
+        last = snapshots.get(server_id)
+        if last is not None:
+            yield sse_event("snapshot", last)
+        
+        while True:
+            try:
+                current = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                yield sse_event("heartbeat", {})
+                continue
+            
+            if last is None:
+                yield sse_event("snapshot", current)
+            else:
+                changes = diff(last, current)
+                if changes:
+                    yield sse_event("delta", changes)
+            last = current
+    finally:
+        snapshots.unsubscribe(server_id, subscriber)
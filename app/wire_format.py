@@ -0,0 +1,62 @@
+"""
+Wire Format - Compact encodings and compression for API responses
+"""
+import base64
+import gzip
+import math
+import sys
+from array import array
+from typing import Dict, List, Optional
+
+MIN_COMPRESS_BYTES = 1024
+
+
+def encode_float32(values: List[Optional[float]]) -> str:
+    """Little-endian Float32 array as base64; missing values become NaN"""
+    packed = array('f', [math.nan if value is None else value for value in values])
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode('ascii')
+
+
+def to_columnar(columns: Dict[str, List], fields=("cpu", "memory", "disk"), binary: bool = False) -> Dict:
+    """
+    Parallel arrays instead of one dict per point.
+    Timestamps are sent as a start time plus integer deltas, which are
+    mostly the same small number and compress to almost nothing.
+    """
+    ts = columns["ts"]
+    deltas = [ts[i] - ts[i - 1] for i in range(1, len(ts))]
+    payload = {
+        "format": "columnar",
+        "start": ts[0] if ts else None,
+        "ts_deltas": [0] + deltas if ts else [],
+        "encoding": "float32" if binary else "json"
+    }
+    for field in fields:
+        if binary:
+            payload[field] = encode_float32(columns[field])
+        else:
+            payload[field] = [None if value is None else round(value, 2) for value in columns[field]]
+    return payload
+
+
+def compress_response(response, accept_encoding: str):
+    """gzip a buffered JSON response when the client accepts it and it is worth the CPU"""
+    if (response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype != 'application/json'
+            or 'gzip' not in (accept_encoding or '').lower()):
+        return response
+    
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+    
+    response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Content-Length'] = len(response.get_data())
+    response.vary.add('Accept-Encoding')
+    return response
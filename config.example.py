@@ -28,9 +28,113 @@ SERVERS = {
     }
 }
 
+# SSH connection pool (seconds)
+SSH_CONNECT_TIMEOUT = 30
+SSH_POOL_IDLE_TIMEOUT = 300   # Close sessions unused for this long
+SSH_KEEPALIVE_INTERVAL = 30   # Keepalive / health-probe interval
+
+# Background metrics collection (seconds)
+BACKGROUND_COLLECTION = True
+METRICS_POLL_INTERVAL = 30
+METRICS_POLL_JITTER = 5      # Random delay added to each poll to avoid bursts
+METRICS_POLL_WORKERS = 8     # Servers polled concurrently
+FLEET_MAX_WORKERS = 16       # Parallel collections for /api/fleet/metrics
+FLEET_HOST_TIMEOUT = 20      # Per-host deadline for fleet collection
+STREAM_HEARTBEAT_INTERVAL = 15  # Keepalive for /api/stream connections
+# With several worker processes (gunicorn -w N) only the one holding this lock polls,
+# records samples and indexes disks; the others take over if it exits (None = all poll)
+SCHEDULER_LOCK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "scheduler.lock")
+SNAPSHOT_MAX_AGE = 65         # Older snapshots are recollected on request
+
+# Request handling: blocking SSH work runs on a bounded pool with per-endpoint deadlines (seconds)
+REQUEST_MAX_WORKERS = 32
+REQUEST_MAX_PENDING = 64      # Queued beyond the workers before answering 503
+REQUEST_MAX_PER_SERVER = 4    # So a few hung hosts cannot hold every worker
+REQUEST_DEADLINES = {"metrics": 20, "docker": 20, "analyze": 120, "chat": 90, "actions": 300}
+
+# Deep analysis probes run concurrently, each on its own SSH channel with its own deadline (seconds)
+ANALYZE_PROBE_DEADLINES = {"docker_disk": 60, "memory_processes": 15}
+ANALYZE_PROBE_WORKERS = 16
+
+# Smart Action jobs
+JOB_MAX_WORKERS = 8
+JOB_MAX_PER_SERVER = 1        # Actions on one server run one at a time
+JOB_MAX_QUEUED_PER_SERVER = 10
+JOB_OUTPUT_LINES = 2000       # Output lines kept per job (oldest dropped first)
+JOB_MAX_LINE_LENGTH = 4096    # Longer output lines are cut before they are buffered
+ACTION_MAX_RUNTIME = 3600     # Kill an action running longer than this (None = no limit); POST /api/jobs/<id>/cancel stops one early
+JOB_HISTORY = 200             # Finished jobs kept for /api/jobs
+FLEET_ACTION_CONCURRENCY = 5  # Hosts running a fleet-wide action at once
+FLEET_ACTION_MAX_FAILURES = 1 # Stop starting new hosts after this many fail (None = never)
+
+# Docker Engine API (remote hosts are reached through `docker system dial-stdio` over SSH;
+# a server entry may set "docker_socket" to override the socket path)
+DOCKER_SOCKET = "/var/run/docker.sock"
+DOCKER_API_TIMEOUT = 15
+DOCKER_API_WORKERS = 4        # Parallel API calls (and SSH tunnels) per collection
+DOCKER_API_RETRY = 600        # Seconds to use the CLI after the API fails for a host
+
+# Metrics database write batching
+METRICS_FLUSH_SIZE = 500      # Rows buffered before a batched write
+METRICS_FLUSH_INTERVAL = 5    # Max seconds a buffered row waits
+
+# Metric history retention (days, None = forever) and response size
+METRICS_RAW_RETENTION_DAYS = 7
+METRICS_1M_RETENTION_DAYS = 30
+METRICS_1H_RETENTION_DAYS = 400
+METRICS_1D_RETENTION_DAYS = None
+HISTORY_MAX_POINTS = 1500     # /api/history picks the finest tier under this
+
+# Per-container history, recorded on each scheduled poll
+CONTAINER_COLLECTION = True
+CONTAINER_CPU_CHANGE = 1.0    # Write a container's row when cpu moves more than this (points)
+CONTAINER_MEMORY_CHANGE = 4 * 1024 * 1024  # ...or memory moves more than this (bytes)
+CONTAINER_HEARTBEAT = 600     # ...or its last row is this many seconds old
+CONTAINER_RETENTION_DAYS = 7
+
+# Process list: CPU % is measured between /proc snapshots kept per server
+PROCESS_RING_SIZE = 4         # Snapshots kept per server
+PROCESS_MIN_INTERVAL = 1.0    # Compare against a snapshot at least this many seconds old
+PROCESS_BASELINE_INTERVAL = 0.5  # Sampling gap when no usable earlier snapshot exists
+PROCESS_SAMPLE_MAX_AGE = 300  # Snapshots older than this are not compared against
+PROCESS_COMMAND_LENGTH = 200
+
+# Directory size index for Deep Analysis, scanned at nice 19 / idle I/O priority.
+# Only directories whose mtime changed are re-measured; a server entry may set
+# "dir_index_roots" to scan other paths
+DIR_INDEX_ROOTS = ["/home", "/var", "/tmp"]
+DIR_INDEX_INTERVAL = 3600     # Seconds between background rescans (None = only when requested)
+DIR_INDEX_FULL_RESCAN = 86400 # Re-measure everything this often (files growing in place keep their directory's mtime)
+DIR_INDEX_SCAN_TIMEOUT = 1800
+DIR_INDEX_WORKERS = 2         # Servers scanned at once
+
+# Large-file scans run in the same background slot; a server entry may set
+# "large_file_roots" and "large_file_min_size"
+LARGE_FILE_ROOTS = ["/home", "/var", "/opt", "/srv", "/root", "/tmp"]
+LARGE_FILE_MIN_SIZE = 50 * 1024 * 1024
+LARGE_FILE_TOP = 200          # Largest files kept per scan
+LARGE_FILE_INTERVAL = 21600   # Seconds between scans (None = only when requested)
+LARGE_FILE_SCAN_TIMEOUT = 1800
+LARGE_FILE_RETENTION_DAYS = 30  # Old scans kept for ?since_hours comparisons
+
 # OpenAI API Key
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "your_openai_api_key")
 
+# AI recommendation caching
+AI_CACHE_TTL = 600            # Reuse an answer while the server state is unchanged
+AI_CACHE_MAX_ENTRIES = 256
+AI_CACHE_BUCKET = 10          # cpu/memory/disk % bucket width for the state fingerprint
+AI_CONTEXT_TTL = 30           # Reuse collected processes/containers for this long
+AI_PROMPT_TOKEN_BUDGET = 1200 # Estimated tokens allowed for server data + question
+
+# Result cache for /api/analyze, /api/docker, /api/processes and /api/suggestions (seconds).
+# Past its TTL an entry is still answered during the stale window while it refreshes in
+# the background; finished actions drop their server's entries, and ?fresh=1 bypasses it
+RESULT_CACHE_TTLS = {"analyze": 300, "docker": 15, "processes": 5, "suggestions": 30}
+RESULT_CACHE_STALE = {"analyze": 1800, "docker": 120, "processes": 30, "suggestions": 300}
+RESULT_CACHE_MAX_ENTRIES = 512
+RESULT_CACHE_REFRESH_WORKERS = 4
+
 # AWS credentials for Cost Explorer (optional)
 AWS_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
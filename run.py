@@ -1,9 +1,10 @@
+import os
 from app import create_app
 
-app = create_app()
+# app.run(debug=True) runs this file twice: a watcher that only restarts on changes,
+# and the child that serves requests, marked by WERKZEUG_RUN_MAIN
+reloader_watcher = __name__ == '__main__' and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+app = create_app(start_background=not reloader_watcher)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5050)
-
-
-
@@ -0,0 +1,141 @@
+"""
+Docker API Check - Run DockerCollector against a fake dockerd on a unix socket and verify its numbers
+
+    python scripts/check_docker_api.py
+
+Covers the Engine API path (listing, parallel stats, /system/df over keep-alive
+connections, chunked stats bodies), the stats math, the first-sample versus
+one-shot CPU logic and the fallback to the CLI once the socket is gone.
+"""
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.collectors.docker_collector import DockerCollector
+
+CONTAINERS = [
+    {"Id": "a" * 64, "Names": ["/web"], "Image": "nginx:1", "State": "running", "Status": "Up 2 hours"},
+    {"Id": "b" * 64, "Names": ["/db"], "Image": "postgres:16", "State": "running", "Status": "Up 2 hours"},
+    {"Id": "c" * 64, "Names": ["/old"], "Image": "busybox", "State": "exited", "Status": "Exited (0)"}
+]
+SYSTEM_DF = {
+    "Images": [{"Size": 2_500_000_000}],
+    "Containers": [{"SizeRw": 1000}],
+    "Volumes": [{"UsageData": {"Size": 5_000_000}}],
+    "BuildCache": []
+}
+
+
+class FakeDockerd(BaseHTTPRequestHandler):
+    """
+    Answers the calls DockerCollector makes. Every stats call advances the CPU
+    counters by 1000 container ticks per 10000 system ticks on 2 CPUs, i.e. 20%.
+    Without one-shot, precpu_stats holds the reading 500/2000 ticks earlier (50%).
+    """
+    protocol_version = "HTTP/1.1"
+    paths = []
+    stats_calls = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, body, status=200, chunked=False):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if chunked:
+            # dockerd streams stats with chunked encoding even when stream=false
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(data), data))
+        else:
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    def do_GET(self):
+        with self.lock:
+            self.paths.append(self.path)
+        if self.path.startswith("/containers/json"):
+            return self.send(CONTAINERS)
+        if self.path.startswith("/system/df"):
+            return self.send(SYSTEM_DF)
+        if "/stats" in self.path:
+            with self.lock:
+                FakeDockerd.stats_calls += 1
+                k = FakeDockerd.stats_calls
+            one_shot = "one-shot=true" in self.path
+            return self.send({
+                "cpu_stats": {"cpu_usage": {"total_usage": k * 1000 + 500}, "system_cpu_usage": k * 10000 + 2000,
+                              "online_cpus": 2},
+                "precpu_stats": {} if one_shot else {"cpu_usage": {"total_usage": k * 1000},
+                                                     "system_cpu_usage": k * 10000},
+                "memory_stats": {"usage": 300_000_000, "limit": 1_000_000_000,
+                                 "stats": {"inactive_file": 100_000_000}},
+                "networks": {"eth0": {"rx_bytes": 10, "tx_bytes": 20}, "eth1": {"rx_bytes": 1, "tx_bytes": 2}},
+                "blkio_stats": {"io_service_bytes_recursive": [
+                    {"op": "read", "value": 5}, {"op": "write", "value": 7}, {"op": "Read", "value": 1}
+                ]}
+            }, chunked=True)
+        self.send({"message": "page not found"}, 404)
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+    print(f"ok    {message}")
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "docker.sock")
+    server = UnixServer(path, FakeDockerd)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    collector = DockerCollector({"name": "check", "host": "localhost", "port": 0, "username": "check",
+                                 "docker_socket": path})
+
+    first = collector.get_containers()
+    check(first.get("source") == "api", "first collection uses the Engine API")
+    check((first["running"], first["total"]) == (2, 3), "running and total counts")
+    check([c["name"] for c in first["containers"]] == ["web", "db"], "only running containers, names without '/'")
+    check(not any("one-shot" in p for p in FakeDockerd.paths), "first sample lets the daemon take both CPU readings")
+    web = first["containers"][0]
+    check(web["cpu_percent"] == 50.0, "CPU% from precpu_stats on the first sample")
+    check(web["memory"] == {"usage": 200_000_000, "limit": 1_000_000_000, "percent": 20.0},
+          "memory excludes page cache")
+    check(web["network"] == {"rx_bytes": 11, "tx_bytes": 22}, "network summed over interfaces")
+    check(web["block_io"] == {"read_bytes": 6, "write_bytes": 7}, "block I/O summed per op, case-insensitively")
+    check(first["disk_usage_bytes"] == {"Images": 2_500_000_000, "Containers": 1000,
+                                        "Local Volumes": 5_000_000, "Build Cache": 0}, "system df bytes")
+    check(first["disk_usage"].splitlines()[0] == "Images: 2.5GB", "system df text matches the CLI's units")
+
+    FakeDockerd.paths.clear()
+    second = collector.get_containers()
+    stats_paths = [p for p in FakeDockerd.paths if "/stats" in p]
+    check(len(stats_paths) == 2 and all("one-shot=true" in p for p in stats_paths),
+          "later samples are one-shot")
+    check([c["cpu_percent"] for c in second["containers"]] == [20.0, 20.0], "CPU% against our previous sample")
+
+    server.shutdown()
+    server.server_close()
+    os.unlink(path)
+    DockerCollector._previous_cpu.clear()
+    fallback = DockerCollector({"name": "check", "host": "localhost", "port": 1, "username": "check",
+                                "docker_socket": path}).get_containers()
+    check(fallback.get("source") == "cli" or "error" in fallback, "falls back to the CLI without the socket")
+    check(("localhost", 1) in DockerCollector._api_failed_at, "API failure is remembered for DOCKER_API_RETRY")
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
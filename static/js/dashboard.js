@@ -2,7 +2,8 @@
 let currentServer = null;
 let metricsChart = null;
 let historyChart = null;
-let refreshInterval = null;
+let metricsStream = null;
+let liveMetrics = null;
 
 // Initialize
 document.addEventListener('DOMContentLoaded', () => {
@@ -86,13 +87,13 @@ function switchView(viewName) {
 }
 
 // Data Loading
-async function loadServerData() {
+async function loadServerData(fresh = false) {
     if (!currentServer) return;
     
     showLoading(true);
     
     try {
-        const metrics = await fetchAPI(`/metrics/${currentServer}`);
+        const metrics = await fetchAPI(`/metrics/${currentServer}${fresh ? '?fresh=1' : ''}`);
         updateMetrics(metrics);
         updateStatus(metrics.status);
         document.getElementById('lastUpdate').textContent = `Last updated: ${new Date().toLocaleTimeString()}`;
@@ -158,6 +159,7 @@ async function loadProcesses() {
                 <td>${p.pid}</td>
                 <td>${p.cpu}%</td>
                 <td>${p.mem}%</td>
+                <td>${p.rss != null ? `${(p.rss / 1048576).toFixed(0)} MB${p.rss_delta ? ` (${p.rss_delta > 0 ? '+' : ''}${(p.rss_delta / 1048576).toFixed(1)})` : ''}` : '--'}</td>
                 <td>${escapeHtml(p.command)}</td>
             </tr>
         `).join('');
@@ -182,6 +184,8 @@ async function loadDocker() {
                 <td>${escapeHtml(c.name)}</td>
                 <td>${escapeHtml(c.image)}</td>
                 <td>${escapeHtml(c.status)}</td>
+                <td>${c.cpu_percent != null ? `${c.cpu_percent.toFixed(1)} %` : '--'}</td>
+                <td>${c.memory ? `${(c.memory.usage / 1048576).toFixed(0)} MB (${c.memory.percent.toFixed(1)} %)` : '--'}</td>
             </tr>
         `).join('');
     } catch (error) {
@@ -194,13 +198,37 @@ async function loadHistory() {
     if (!currentServer) return;
     
     try {
-        const data = await fetchAPI(`/history/${currentServer}?hours=24`);
-        updateHistoryChart(data.history);
+        // One point per horizontal pixel is all the chart can show
+        const width = document.getElementById('historyChart').clientWidth || 800;
+        const data = await fetchAPI(`/history/${currentServer}?hours=24&max_points=${Math.max(100, Math.round(width))}&format=columnar&encoding=binary`);
+        updateHistoryChart(decodeColumnarHistory(data));
     } catch (error) {
         console.error('Failed to load history:', error);
     }
 }
 
+// Columnar history: start + ts_deltas, metrics as base64 little-endian Float32 arrays
+function decodeFloat32(base64) {
+    const bytes = Uint8Array.from(atob(base64), c => c.charCodeAt(0));
+    return new Float32Array(bytes.buffer);
+}
+
+function decodeColumnarHistory(data) {
+    const timestamps = [];
+    let ts = data.start || 0;
+    for (const delta of data.ts_deltas || []) {
+        ts += delta;
+        timestamps.push(ts * 1000);
+    }
+    const decode = values => data.encoding === 'float32' ? decodeFloat32(values) : values;
+    return {
+        timestamps,
+        cpu: decode(data.cpu),
+        memory: decode(data.memory),
+        disk: decode(data.disk)
+    };
+}
+
 function updateHistoryChart(history) {
     const ctx = document.getElementById('historyChart').getContext('2d');
     
@@ -209,25 +237,25 @@ function updateHistoryChart(history) {
     historyChart = new Chart(ctx, {
         type: 'line',
         data: {
-            labels: history.map(h => new Date(h.timestamp).toLocaleTimeString()),
+            labels: history.timestamps.map(ts => new Date(ts).toLocaleTimeString()),
             datasets: [
                 {
                     label: 'CPU %',
-                    data: history.map(h => h.cpu),
+                    data: Array.from(history.cpu),
                     borderColor: '#6366f1',
                     tension: 0.3,
                     fill: false
                 },
                 {
                     label: 'Memory %',
-                    data: history.map(h => h.memory),
+                    data: Array.from(history.memory),
                     borderColor: '#22c55e',
                     tension: 0.3,
                     fill: false
                 },
                 {
                     label: 'Disk %',
-                    data: history.map(h => h.disk),
+                    data: Array.from(history.disk),
                     borderColor: '#f59e0b',
                     tension: 0.3,
                     fill: false
@@ -249,23 +277,47 @@ function updateHistoryChart(history) {
 }
 
 // Deep Analysis
+const ANALYSIS_SECTIONS = {
+    disk_by_directory: ['diskAnalysis', 'No data'],
+    docker_disk: ['dockerAnalysis', 'No data'],
+    large_files: ['largeFiles', 'No large files found'],
+    memory_processes: ['memoryAnalysis', 'No data']
+};
+let analysisController = null;
+
 async function runDeepAnalysis() {
     if (!currentServer) return;
     
-    document.getElementById('diskAnalysis').textContent = 'Analyzing...';
-    document.getElementById('dockerAnalysis').textContent = 'Analyzing...';
-    document.getElementById('largeFiles').textContent = 'Analyzing...';
-    document.getElementById('memoryAnalysis').textContent = 'Analyzing...';
+    // Starting a new run cancels the probes of the previous one
+    if (analysisController) analysisController.abort();
+    const controller = analysisController = new AbortController();
+    
+    Object.values(ANALYSIS_SECTIONS).forEach(([id]) => {
+        document.getElementById(id).textContent = 'Analyzing...';
+    });
     
     try {
-        const data = await fetchAPI(`/analyze/${currentServer}`);
+        const response = await fetch(`/api/analyze/${currentServer}?stream=1`, {
+            headers: { 'Accept': 'text/event-stream' },
+            signal: controller.signal
+        });
+        if (!response.ok || !response.body) {
+            const data = await response.json();
+            throw new Error(data.error || `Request failed (${response.status})`);
+        }
         
-        document.getElementById('diskAnalysis').textContent = data.disk_by_directory || 'No data';
-        document.getElementById('dockerAnalysis').textContent = data.docker_disk || 'No data';
-        document.getElementById('largeFiles').textContent = data.large_files || 'No large files found';
-        document.getElementById('memoryAnalysis').textContent = data.memory_processes || 'No data';
+        await readEventStream(response, (type, data) => {
+            const section = ANALYSIS_SECTIONS[data.name];
+            if (type !== 'section' || !section) return;
+            const [id, empty] = section;
+            document.getElementById(id).textContent = data.status === 'ok'
+                ? (data.output || empty)
+                : `Failed: ${data.error || data.status}`;
+        });
     } catch (error) {
-        document.getElementById('diskAnalysis').textContent = `Error: ${error.message}`;
+        if (error.name !== 'AbortError') {
+            document.getElementById('diskAnalysis').textContent = `Error: ${error.message}`;
+        }
     }
 }
 
@@ -281,36 +333,97 @@ async function sendChatMessage() {
     
     // Add user message
     messagesDiv.innerHTML += `<div class="chat-message user"><p>${escapeHtml(question)}</p></div>`;
-    messagesDiv.innerHTML += `<div class="chat-message assistant" id="typingIndicator"><p>Thinking...</p></div>`;
+    messagesDiv.insertAdjacentHTML('beforeend', `<div class="chat-message assistant"><p>Thinking...</p></div>`);
+    const answer = messagesDiv.lastElementChild;
     messagesDiv.scrollTop = messagesDiv.scrollHeight;
     
+    // Sections appear as the assistant writes them instead of after the whole answer
+    const observer = new MutationObserver(() => { messagesDiv.scrollTop = messagesDiv.scrollHeight; });
+    observer.observe(answer, { childList: true, subtree: true });
+    
     try {
-        const response = await fetch(`/api/chat/${currentServer}`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ question })
-        });
-        
-        const data = await response.json();
-        
-        document.getElementById('typingIndicator').remove();
-        
-        // Check if response is structured (new format) or plain text (old format)
-        if (data.response && typeof data.response === 'object' && data.response.summary) {
-            displayStructuredResponse(data.response, messagesDiv);
-        } else {
-            // Fallback to plain text
-            messagesDiv.innerHTML += `<div class="chat-message assistant"><p>${escapeHtml(data.response || data.error || 'No response')}</p></div>`;
-        }
-        
-        messagesDiv.scrollTop = messagesDiv.scrollHeight;
+        await streamResponseInto(answer, question);
     } catch (error) {
-        document.getElementById('typingIndicator').remove();
-        messagesDiv.innerHTML += `<div class="chat-message assistant"><p>Error: ${error.message}</p></div>`;
+        answer.innerHTML = `<p>Error: ${escapeHtml(error.message)}</p>`;
+    } finally {
+        observer.disconnect();
         messagesDiv.scrollTop = messagesDiv.scrollHeight;
     }
 }
 
+function renderSummary(summary) {
+    return `<div class="ai-summary"><p>${escapeHtml(summary)}</p></div>`;
+}
+
+function renderRecommendation(rec, index) {
+    const risk = rec.risk || 'YELLOW';
+    const riskClass = risk.toLowerCase();
+    const riskColors = {
+        'green': { bg: 'rgba(34, 197, 94, 0.1)', border: '#22c55e', icon: '✓', label: 'SAFE' },
+        'yellow': { bg: 'rgba(234, 179, 8, 0.1)', border: '#eab308', icon: '⚠', label: 'CAUTION' },
+        'red': { bg: 'rgba(239, 68, 68, 0.1)', border: '#ef4444', icon: '⚠', label: 'RISKY' }
+    };
+    const colors = riskColors[riskClass] || riskColors['yellow'];
+    const hasAction = rec.action_id || rec.action;
+    const recId = `rec-${Date.now()}-${index}`;
+    
+    // Store recommendation data - use base64 encoding to avoid escaping issues
+    const recData = btoa(JSON.stringify(rec));
+    
+    // Create clear action description
+    const actionDescription = rec.description || rec.title || 'Execute action';
+    
+    return `
+        <div class="ai-recommendation-item" 
+             style="border-left: 4px solid ${colors.border}; background: ${colors.bg};"
+             data-rec-id="${recId}"
+             data-rec-data="${recData}">
+            <div class="ai-rec-item-content">
+                <div class="ai-rec-item-left">
+                    <span class="ai-rec-risk-badge" style="background: ${colors.border};">
+                        ${colors.icon} ${colors.label}
+                    </span>
+                    <div class="ai-rec-item-text">
+                        <div class="ai-rec-item-title">${escapeHtml(rec.title || 'Recommendation')}</div>
+                        <div class="ai-rec-item-desc">${escapeHtml(actionDescription)}</div>
+                        ${rec.considerations ? `<div class="ai-rec-item-considerations">⚠ ${escapeHtml(rec.considerations)}</div>` : ''}
+                    </div>
+                </div>
+                <div class="ai-rec-item-right">
+                    ${hasAction ? `
+                        <button class="ai-rec-action-btn" 
+                                style="border-color: ${colors.border}; color: ${colors.border};"
+                                onclick="executeRecommendationFromElement(this.closest('.ai-recommendation-item'))"
+                                data-rec-id="${recId}">
+                            <svg viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" style="width:16px;height:16px">
+                                <polygon points="5 3 19 12 5 21 5 3"/>
+                            </svg>
+                            Do It
+                        </button>
+                    ` : `
+                        <span class="ai-rec-no-action">Manual step required</span>
+                    `}
+                </div>
+            </div>
+        </div>
+    `;
+}
+
+function renderUpgradeSuggestion(upgrade) {
+    if (!upgrade || !upgrade.needed) return '';
+    return `
+        <div class="ai-upgrade-suggestion">
+            <div class="ai-upgrade-header">
+                <span class="ai-upgrade-icon">💻</span>
+                <h4>Consider Upgrading Your Server</h4>
+            </div>
+            <p><strong>Why:</strong> ${escapeHtml(upgrade.reason || '')}</p>
+            ${upgrade.current_specs ? `<p><strong>Current:</strong> ${escapeHtml(upgrade.current_specs)}</p>` : ''}
+            ${upgrade.recommended ? `<p><strong>Recommended:</strong> ${escapeHtml(upgrade.recommended)}</p>` : ''}
+        </div>
+    `;
+}
+
 function displayStructuredResponse(response, container) {
     // Check if this is for chat (append) or overview (replace)
     const isChat = container.id === 'chatMessages';
@@ -318,82 +431,20 @@ function displayStructuredResponse(response, container) {
     
     // Summary
     if (response.summary) {
-        html += `<div class="ai-summary"><p>${escapeHtml(response.summary)}</p></div>`;
+        html += renderSummary(response.summary);
     }
     
     // Recommendations - Display as line items with action buttons
     if (response.recommendations && response.recommendations.length > 0) {
         html += '<div class="ai-recommendations-list">';
         response.recommendations.forEach((rec, index) => {
-            const risk = rec.risk || 'YELLOW';
-            const riskClass = risk.toLowerCase();
-            const riskColors = {
-                'green': { bg: 'rgba(34, 197, 94, 0.1)', border: '#22c55e', icon: '✓', label: 'SAFE' },
-                'yellow': { bg: 'rgba(234, 179, 8, 0.1)', border: '#eab308', icon: '⚠', label: 'CAUTION' },
-                'red': { bg: 'rgba(239, 68, 68, 0.1)', border: '#ef4444', icon: '⚠', label: 'RISKY' }
-            };
-            const colors = riskColors[riskClass] || riskColors['yellow'];
-            const hasAction = rec.action_id || rec.action;
-            const recId = `rec-${Date.now()}-${index}`;
-            
-            // Store recommendation data - use base64 encoding to avoid escaping issues
-            const recData = btoa(JSON.stringify(rec));
-            
-            // Create clear action description
-            const actionDescription = rec.description || rec.title || 'Execute action';
-            
-            html += `
-                <div class="ai-recommendation-item" 
-                     style="border-left: 4px solid ${colors.border}; background: ${colors.bg};"
-                     data-rec-id="${recId}"
-                     data-rec-data="${recData}">
-                    <div class="ai-rec-item-content">
-                        <div class="ai-rec-item-left">
-                            <span class="ai-rec-risk-badge" style="background: ${colors.border};">
-                                ${colors.icon} ${colors.label}
-                            </span>
-                            <div class="ai-rec-item-text">
-                                <div class="ai-rec-item-title">${escapeHtml(rec.title || 'Recommendation')}</div>
-                                <div class="ai-rec-item-desc">${escapeHtml(actionDescription)}</div>
-                                ${rec.considerations ? `<div class="ai-rec-item-considerations">⚠ ${escapeHtml(rec.considerations)}</div>` : ''}
-                            </div>
-                        </div>
-                        <div class="ai-rec-item-right">
-                            ${hasAction ? `
-                                <button class="ai-rec-action-btn" 
-                                        style="border-color: ${colors.border}; color: ${colors.border};"
-                                        onclick="executeRecommendationFromElement(this.closest('.ai-recommendation-item'))"
-                                        data-rec-id="${recId}">
-                                    <svg viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" style="width:16px;height:16px">
-                                        <polygon points="5 3 19 12 5 21 5 3"/>
-                                    </svg>
-                                    Do It
-                                </button>
-                            ` : `
-                                <span class="ai-rec-no-action">Manual step required</span>
-                            `}
-                        </div>
-                    </div>
-                </div>
-            `;
+            html += renderRecommendation(rec, index);
         });
         html += '</div>';
     }
     
     // Upgrade suggestion
-    if (response.upgrade_suggestion && response.upgrade_suggestion.needed) {
-        html += `
-            <div class="ai-upgrade-suggestion">
-                <div class="ai-upgrade-header">
-                    <span class="ai-upgrade-icon">💻</span>
-                    <h4>Consider Upgrading Your Server</h4>
-                </div>
-                <p><strong>Why:</strong> ${escapeHtml(response.upgrade_suggestion.reason || '')}</p>
-                ${response.upgrade_suggestion.current_specs ? `<p><strong>Current:</strong> ${escapeHtml(response.upgrade_suggestion.current_specs)}</p>` : ''}
-                ${response.upgrade_suggestion.recommended ? `<p><strong>Recommended:</strong> ${escapeHtml(response.upgrade_suggestion.recommended)}</p>` : ''}
-            </div>
-        `;
-    }
+    html += renderUpgradeSuggestion(response.upgrade_suggestion);
     
     if (isChat) {
         html += '</div>';
@@ -403,6 +454,84 @@ function displayStructuredResponse(response, container) {
     }
 }
 
+// Ask the assistant with ?stream=1 and hand each server-sent event to onEvent(type, data)
+async function streamChat(question, onEvent) {
+    const response = await fetch(`/api/chat/${currentServer}?stream=1`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+        body: JSON.stringify({ question })
+    });
+    
+    if (!response.ok || !response.body) {
+        const data = await response.json();
+        throw new Error(data.error || `Request failed (${response.status})`);
+    }
+    
+    return readEventStream(response, onEvent);
+}
+
+// Parse a fetch response body as server-sent events, calling onEvent(type, data) for each
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let type = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) type = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            if (data) onEvent(type, JSON.parse(data));
+        }
+    }
+}
+
+// Render a streamed answer into element piece by piece as events arrive
+function streamResponseInto(element, question) {
+    let list = null;
+    let index = 0;
+    let started = false;
+    
+    const start = () => {
+        if (!started) {
+            element.innerHTML = '';
+            started = true;
+        }
+    };
+    
+    return streamChat(question, (type, data) => {
+        if (type === 'summary') {
+            start();
+            element.insertAdjacentHTML('beforeend', renderSummary(data.summary));
+        } else if (type === 'recommendation') {
+            start();
+            if (!list) {
+                element.insertAdjacentHTML('beforeend', '<div class="ai-recommendations-list"></div>');
+                list = element.lastElementChild;
+            }
+            list.insertAdjacentHTML('beforeend', renderRecommendation(data.recommendation, index++));
+        } else if (type === 'upgrade_suggestion') {
+            start();
+            element.insertAdjacentHTML('beforeend', renderUpgradeSuggestion(data.upgrade_suggestion));
+        } else if (type === 'done' && !started) {
+            // Errors and unparseable answers only arrive as the final response
+            element.innerHTML = '';
+            displayStructuredResponse(data.response, element);
+        }
+    });
+}
+
 function executeRecommendationFromElement(element) {
     const recData = element.getAttribute('data-rec-data');
     if (!recData) return;
@@ -436,12 +565,7 @@ async function executeRecommendation(recId, recommendation, recElement = null) {
     try {
         if (recommendation.action_id) {
             // Use existing action
-            const response = await fetch(`/api/actions/${currentServer}/${recommendation.action_id}`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' }
-            });
-            
-            const result = await response.json();
+            const result = await runActionJob(recommendation.action_id);
             
             // Show result inline
             recElement.classList.remove('executing');
@@ -625,19 +749,78 @@ async function runAction(actionId) {
         btn.innerHTML = '<div class="spinner-small"></div> Running...';
     });
     
+    // Open the modal right away and fill it as output arrives
+    const output = document.getElementById('actionOutput');
+    document.getElementById('actionModalTitle').textContent = 'Running...';
+    output.className = '';
+    output.textContent = '';
+    document.getElementById('actionModal').classList.add('active');
+    
     try {
-        const response = await fetch(`/api/actions/${currentServer}/${actionId}`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' }
+        const result = await runActionJob(actionId, text => {
+            output.textContent = text;
+            output.scrollTop = output.scrollHeight;
         });
-        
-        const result = await response.json();
         showActionResult(result);
     } catch (error) {
         showActionResult({ success: false, action: actionId, error: error.message });
     }
 }
 
+// Queue an action as a job and follow its output until it finishes.
+// onOutput receives the output so far; resolves with a result for showActionResult.
+function runActionJob(actionId, onOutput = () => {}) {
+    const maxLines = 2000;
+    let lines = [];
+    let next = 0;
+    let retries = 0;
+    
+    return new Promise(async (resolve, reject) => {
+        try {
+            const response = await fetch(`/api/actions/${currentServer}/${actionId}`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' }
+            });
+            const job = await response.json();
+            if (!response.ok) throw new Error(job.error || `Request failed (${response.status})`);
+            
+            const follow = () => {
+                // Resume from the last line seen if the connection drops
+                const source = new EventSource(`/api/jobs/${job.job_id}?follow=1&since=${next}`);
+                
+                source.addEventListener('output', event => {
+                    const data = JSON.parse(event.data);
+                    if (data.dropped) lines.push(`... ${data.dropped} lines skipped ...`);
+                    lines = lines.concat(data.lines).slice(-maxLines);
+                    next = data.next;
+                    retries = 0;
+                    onOutput(lines.join('\n'));
+                });
+                
+                source.addEventListener('done', event => {
+                    source.close();
+                    const done = JSON.parse(event.data);
+                    resolve({
+                        success: done.success,
+                        action: done.action,
+                        output: lines.join('\n'),
+                        error: done.error || (done.success ? null : `Exited with status ${done.exit_code}`)
+                    });
+                });
+                
+                source.onerror = () => {
+                    source.close();
+                    if (++retries > 5) reject(new Error('Lost connection to the running action'));
+                    else setTimeout(follow, 2000);
+                };
+            };
+            follow();
+        } catch (error) {
+            reject(error);
+        }
+    });
+}
+
 function showActionResult(result) {
     const modal = document.getElementById('actionModal');
     const title = document.getElementById('actionModalTitle');
@@ -672,22 +855,58 @@ function showLoading(show) {
     document.getElementById('loadingOverlay').classList.toggle('active', show);
 }
 
+// Live updates: the server pushes one shared snapshot, then only changed fields
 function startAutoRefresh() {
     stopAutoRefresh();
-    if (document.getElementById('autoRefresh').checked && currentServer) {
-        refreshInterval = setInterval(loadServerData, 30000);
-    }
+    if (!document.getElementById('autoRefresh').checked || !currentServer) return;
+    
+    const serverId = currentServer;
+    metricsStream = new EventSource(`/api/stream/${serverId}`);
+    
+    metricsStream.addEventListener('snapshot', (e) => {
+        if (serverId !== currentServer) return;
+        liveMetrics = JSON.parse(e.data);
+        showLiveMetrics();
+    });
+    
+    metricsStream.addEventListener('delta', (e) => {
+        if (serverId !== currentServer || !liveMetrics) return;
+        liveMetrics = applyDelta(liveMetrics, JSON.parse(e.data));
+        showLiveMetrics();
+    });
 }
 
 function stopAutoRefresh() {
-    if (refreshInterval) {
-        clearInterval(refreshInterval);
-        refreshInterval = null;
+    if (metricsStream) {
+        metricsStream.close();
+        metricsStream = null;
     }
+    liveMetrics = null;
+}
+
+function applyDelta(target, delta) {
+    const result = { ...target };
+    for (const [key, value] of Object.entries(delta)) {
+        if (value === null) {
+            delete result[key];
+        } else if (typeof value === 'object' && !Array.isArray(value) && typeof result[key] === 'object' && result[key] !== null) {
+            result[key] = applyDelta(result[key], value);
+        } else {
+            result[key] = value;
+        }
+    }
+    return result;
+}
+
+function showLiveMetrics() {
+    updateMetrics(liveMetrics);
+    updateStatus(liveMetrics.status);
+    const collectedAt = liveMetrics.collected_at ? new Date(liveMetrics.collected_at * 1000) : new Date();
+    document.getElementById('lastUpdate').textContent = `Last updated: ${collectedAt.toLocaleTimeString()}`;
 }
 
 function refreshData() {
-    loadServerData();
+    loadServerData(true);
 }
 
 // Expose global functions
@@ -727,16 +946,8 @@ async function loadAIRecommendations() {
     }
     
     try {
-        // Get current metrics
-        const metrics = await fetchAPI(`/metrics/${currentServer}`);
-        const processes = await fetchAPI(`/processes/${currentServer}`);
-        const docker = await fetchAPI(`/docker/${currentServer}`);
-        
-        const server_data = {
-            metrics: metrics,
-            top_processes: processes.processes?.slice(0, 5) || [],
-            docker: docker
-        };
+        // Current metrics only pick the question; the server gathers the full context itself
+        const metrics = liveMetrics || await fetchAPI(`/metrics/${currentServer}`);
         
         // Generate smart question based on current state
         let question = "Analyze my server and provide recommendations.";
@@ -754,19 +965,10 @@ async function loadAIRecommendations() {
             question = "Analyze my server health and provide any recommendations for optimization.";
         }
         
-        // Get AI analysis
-        const response = await fetch(`/api/chat/${currentServer}`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ question })
-        });
+        // Get AI analysis, rendering recommendations as they stream in
+        await streamResponseInto(container, question);
         
-        const data = await response.json();
-        
-        // Display recommendations
-        if (data.response && typeof data.response === 'object' && data.response.summary) {
-            displayStructuredResponse(data.response, container);
-        } else {
+        if (!container.innerHTML.trim()) {
             container.innerHTML = `
                 <div class="ai-recommendations-placeholder">
                     <p>Unable to generate recommendations. Please try the AI Assistant chat for detailed analysis.</p>